@@ -3,17 +3,194 @@
 from . import core
 import numpy as np
 
-def step_NpArr(arr:np.ndarray) -> np.ndarray:
+# statistics of a generation, gathered by the step functions while stepping.
+# Only the cells that are stepped are counted, the bounding box of the live cells includes both ends
+# and is -1 if there are none. x is the first and y the second index of the board.
+STATS_DTYPE = np.dtype([
+	('population', np.int64),
+	('births', np.int64),
+	('deaths', np.int64),
+	('x_min', np.int64),
+	('x_max', np.int64),
+	('y_min', np.int64),
+	('y_max', np.int64),
+])
+
+# Steps boards of one shape with its own scratch memory, pool and statistics, see help(Stepper).
+# The module level step functions use a stepper that is kept for the last few board shapes and options.
+Stepper = core.Stepper
+
+def new_stats(count:int=1) -> np.ndarray:
+	"""Returns an array for the statistics of count generations"""
+	return np.zeros(count, dtype=STATS_DTYPE)
+
+def step_NpArr(arr:np.ndarray, topology:str="bounded", rule=None, return_hash:bool=False,
+		stats:np.ndarray=None, out=None, shape:tuple=None) -> np.ndarray:
 	"""Step the game of life for a numpy array.
-	Warning: It can modify the array in place.
-	Returns the same or a new array with the next step.
+	topology is "bounded" (the outer ring of cells is a dead border) or "torus" (the edges wrap around).
+	rule is a life-like rule in B/S notation like "B36/S23", None is conway's game of life (B3/S23).
+	The GIL is released while stepping, so other python threads keep running.
+	arr can be any writeable C contiguous buffer of single byte cells (a uint8, int8 or bool numpy array,
+	a bytearray, a memoryview or an array.array), 1D buffers need shape=(rows, columns).
+	It is stepped in place without a copy, or into out (a buffer of the same size) if out is given.
+	numpy arrays of other types or strides are converted to a new int8 array first.
+	Returns the stepped board (arr, out or the converted array).
+	If return_hash is set, the hash of the new board (see board_hash) is returned with it,
+	it is computed while stepping, without another pass over the board.
+	If stats is a STATS_DTYPE array (see new_stats), the statistics of the new board are written to stats[0],
+	they are gathered while stepping as well.
 	"""
 	
-	return core.step_NpArr(arr)
+	return core.step_NpArr(arr, topology=topology, rule=rule, return_hash=return_hash, stats=stats, out=out, shape=shape)
+
+def step_list_multithread(arr, topology:str="bounded", rule=None, out=None, shape:tuple=None):
+	"""Step the game of life for a list of lists using the worker pool.
+	The list is modified in place and None is returned.
+	Buffers (numpy arrays, bytearrays, ...) are stepped without converting them to lists,
+	in place or into out like in step_NpArr, and the stepped board is returned.
+	"""
+	return core.step_list_multithread(arr, topology=topology, rule=rule, out=out, shape=shape)
 
-def step_list_multithread(arr:list) -> list:
-	"""Step the game of life for a list of lists.
-	Warning: It can modify the list in place.
-	Returns the same or a new list with the next step.
+def step_NpArr_multithread(arr:np.ndarray, topology:str="bounded", rule=None,
+		return_hash:bool=False, stats:np.ndarray=None, out=None, shape:tuple=None) -> np.ndarray:
+	"""Step the game of life for a numpy array using the worker pool.
+	The GIL is released while stepping.
+	arr, out and shape work like in step_NpArr, the board is stepped in place or into out.
+	Returns the stepped board, and its hash if return_hash is set.
+	stats works like in step_NpArr, every worker gathers the statistics of its rows.
 	"""
-	return core.step_list_multithread(arr)
\ No newline at end of file
+	return core.step_NpArr_multithread(arr, topology=topology, rule=rule, return_hash=return_hash, stats=stats,
+		out=out, shape=shape)
+
+def step_n(arr:np.ndarray, n:int, stop_when_stable:bool=False, multithread:bool=False, topology:str="bounded",
+		rule=None, hashes:np.ndarray=None, stats:np.ndarray=None, out=None, shape:tuple=None) -> tuple:
+	"""Step the game of life n times for a numpy array without returning to python.
+	The GIL is released for the whole batch.
+	If stop_when_stable is set, it stops early once a step does not change the board.
+	If hashes is a uint64 array of at least n elements, the hash of every generation is written to it.
+	If stats is a STATS_DTYPE array of at least n elements, the statistics of every generation are written to it.
+	arr, out and shape work like in step_NpArr, the board is stepped in place or into out.
+	Returns the stepped board and the amount of steps that were run.
+	"""
+	return core.step_n(arr, n, stop_when_stable=stop_when_stable, multithread=multithread, topology=topology, rule=rule,
+		hashes=hashes, stats=stats, out=out, shape=shape)
+
+def board_hash(arr:np.ndarray, topology:str="bounded") -> int:
+	"""64 bit hash of the cells of a board that are stepped, the dead border of a bounded board is left out.
+	It is the same hash that the step functions compute with return_hash or hashes.
+	"""
+	return core.board_hash(arr, topology=topology)
+
+def step_tiled(arr:np.ndarray, scratch:np.ndarray, active:np.ndarray, tile_size:int, topology:str="bounded",
+		rule=None) -> int:
+	"""Step the game of life in place, only calculating tiles that can change.
+	scratch is a board sized uint8 array used for the new tiles.
+	active has one flag per tile_size x tile_size tile, marking the tiles that changed in the last step,
+	it is updated for the next step.
+	Returns the amount of tiles that were calculated.
+	"""
+	return core.step_tiled(arr, scratch, active, tile_size, topology=topology, rule=rule)
+
+def set_thread_count(thread_count:int=0) -> int:
+	"""Set the amount of worker threads used by the multithreaded functions.
+	0 uses one thread per core, which is also the default.
+	Returns the amount of threads that are actually running.
+	"""
+	return core.set_thread_count(thread_count)
+
+def get_thread_count() -> int:
+	"""Get the amount of worker threads used by the multithreaded functions."""
+	return core.get_thread_count()
+
+def set_profiling(enabled:bool=True) -> bool:
+	"""Enable or disable the profiling of the step functions, it is disabled by default.
+	While disabled it adds no measurable overhead.
+	Returns whether profiling was enabled before.
+	"""
+	return core.set_profiling(enabled)
+
+def get_profile() -> dict:
+	"""Get the wall clock time and amount of calls of the step functions since the last reset_profile.
+	Returns {function name: {"seconds": s, "calls": n, "phases": {phase: {"seconds": s, "calls": n}}}}
+	for the functions that were called while profiling was enabled.
+	The phases are "check" (the arguments), "copy_in" (converting the input),
+	"partial_sum" (the sums of the rows around the bands of rows the threads step),
+	"next_step" (the rest of the step, or all of it for kernels that aren't split)
+	and "copy_out" (writing the result back).
+	step_n records the step phases once per generation.
+	"""
+	return core.get_profile()
+
+def reset_profile() -> None:
+	"""Reset the times and calls returned by get_profile."""
+	core.reset_profile()
+
+def set_simd(variant:str) -> str:
+	"""Force the SIMD kernels of the step functions, one of simd_variants().
+	"scalar" is the portable fallback, "sse2", "avx2" and "avx512" use 128, 256 and 512 bit vectors.
+	The best variant of the CPU is selected on import, forcing the others lets them be checked against each other,
+	which benchmark.py --check-simd does.
+	Returns the previous variant.
+	"""
+	return core.set_simd(variant)
+
+def get_simd() -> str:
+	"""Get the SIMD kernels used by the step functions."""
+	return core.get_simd()
+
+def simd_variants() -> list:
+	"""Get the SIMD kernels the CPU supports, from the slowest to the fastest."""
+	return core.simd_variants()
+
+def pack_NpArr(arr:np.ndarray) -> np.ndarray:
+	"""Pack a 2D array of 0/1 cells into a bit-packed board.
+	Each row is stored in ceil(width/64) uint64 words, one cell per bit.
+	"""
+	return core.pack_NpArr(arr)
+
+def unpack_NpArr(packed:np.ndarray, height:int) -> np.ndarray:
+	"""Unpack a bit-packed board into a new 2D uint8 array.
+	height is the amount of cells in each packed row.
+	"""
+	return core.unpack_NpArr(packed, height)
+
+def step_packed(packed:np.ndarray, height:int, topology:str="bounded", rule=None) -> np.ndarray:
+	"""Step the game of life for a bit-packed board.
+	Warning: It modifies the packed board in place.
+	Returns the same packed board.
+	"""
+	return core.step_packed(packed, height, topology=topology, rule=rule)
+
+
+class BitBoard:
+	"""Game of life board that stores one cell per bit.
+
+	Uses 8 times less memory than the uint8 layout and steps 64 cells per word operation.
+	Just like the other step functions the outer ring of cells is a dead border,
+	unless the topology is "torus".
+	"""
+	def __init__(self, packed:np.ndarray, height:int, topology:str="bounded", rule=None) -> None:
+		self.packed = packed
+		self.height = height
+		self.topology = topology
+		self.rule = rule
+
+	@classmethod
+	def from_array(cls, arr:np.ndarray, topology:str="bounded", rule=None) -> 'BitBoard':
+		"""Creates a bit-packed board from a 2D array of 0/1 cells"""
+		return cls(pack_NpArr(arr), arr.shape[1], topology, rule)
+
+	@property
+	def shape(self) -> tuple:
+		"""Shape of the board in cells"""
+		return (self.packed.shape[0], self.height)
+
+	def to_array(self) -> np.ndarray:
+		"""Returns the board as a new 2D uint8 array"""
+		return unpack_NpArr(self.packed, self.height)
+
+	def step(self, generations:int=1) -> 'BitBoard':
+		"""Advances the board in place by the given amount of generations"""
+		for _ in range(generations):
+			step_packed(self.packed, self.height, self.topology, self.rule)
+		return self
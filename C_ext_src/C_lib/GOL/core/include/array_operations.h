@@ -1,6 +1,54 @@
 #include <Python.h>
+#include "thread_pool.h"
+#include "step_config.h"
+#include "step_stats.h"
+#include "profile.h"
 
+#pragma once
 
-void calculate_next_step(
-		int8_t* arr,
-		long long* arr_dims, long long* arr_strides);
\ No newline at end of file
+
+// Partial sums of three neighbouring cells in a row, for every cell that is stepped.
+// The rows are stepped in bands, one per thread, and every band only keeps the sums of the three rows
+// around the row it is at and of the rows around the band, so the board is stepped in a single pass.
+// They are scratch memory of a board shape and topology, every caller owns its own (see stepper.h),
+// so boards can be stepped from several threads at once.
+struct partial_sum {
+	int8_t* arr;
+	// partial sums per row
+	long long width;
+	// column of the board that the first partial sum is centered on
+	long long col_offset;
+	// bands there is memory for, it grows to the size of the pool a board is stepped on
+	int bands;
+};
+
+// arr is NULL if the allocation failed
+struct partial_sum partial_sum_alloc(const long long* arr_dims, const struct step_config* config, int bands);
+
+void partial_sum_free(struct partial_sum* par);
+
+// par has to be allocated for the dimensions and topology of the board. The pool is optional (NULL).
+// hash is optional (NULL), it receives the hash of the new board, see board_hash.h
+// stats is optional as well, it receives the statistics of the new board, see step_stats.h
+// timer is optional too, the phases of the step are recorded in it, see profile.h
+// The next step of src is written to dst, which can be src. Both have the same dimensions and strides,
+// a separate dst gets the dead border of a bounded src.
+// The cells of a row have to be contiguous (arr_strides[1] == 1), they are stepped by the SIMD kernels, see simd.h
+// Returns 1 if any cell changed
+int calculate_next_step(
+		const int8_t* src, int8_t* dst,
+		long long* arr_dims, long long* arr_strides,
+		const struct step_config* config, struct partial_sum* par,
+		struct thread_pool* pool, uint64_t* hash, struct step_stats* stats,
+		struct profile_timer* timer);
+
+// The dead border of a bounded board is never stepped, so a separate dst gets it from src
+void copy_border(const int8_t* src, int8_t* dst, const long long* arr_dims, const long long* arr_strides);
+
+// arr and out have to be C contiguous, out can be arr
+long long calculate_n_steps(
+		const int8_t* arr, int8_t* out,
+		long long* arr_dims, long long* arr_strides,
+		const struct step_config* config, struct partial_sum* par,
+		long long n, int stop_when_stable, struct thread_pool* pool, uint64_t* hashes,
+		struct step_stats* stats, struct profile_timer* timer);
@@ -0,0 +1,20 @@
+#include <Python.h>
+#include <stdint.h>
+#include "step_config.h"
+
+#pragma once
+
+// Amount of cells stored in a single word of a bit-packed board
+#define BITBOARD_WORD_BITS 64
+
+long long packed_words(long long cols);
+
+void pack_board(
+		const uint8_t* arr, long long rows, long long cols, long long row_stride,
+		uint64_t* packed);
+
+void unpack_board(
+		const uint64_t* packed, long long rows, long long cols,
+		uint8_t* arr);
+
+int step_packed_board(uint64_t* packed, long long rows, long long cols, const struct step_config* config);
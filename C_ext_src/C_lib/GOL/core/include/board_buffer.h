@@ -0,0 +1,36 @@
+#include <Python.h>
+
+#pragma once
+
+// A board taken from any object that supports the buffer protocol, without copying it
+struct board_buffer {
+	Py_buffer view;
+	// the object that is returned for the board, the board itself or a converted copy of a numpy array
+	PyObject* object;
+	long long dims[2];
+	long long strides[2];
+};
+
+// Gets a writeable, C contiguous board of single byte cells (uint8, int8, bool or char),
+// like a numpy array, a bytearray, a memoryview or an array.array.
+// 2D buffers have their own shape, shapeOb (a (rows, columns) tuple, Py_None if not given)
+// is needed for 1D buffers and reshapes any buffer of the same size.
+// With convert set, numpy arrays that don't fit (other types, strides or read only)
+// are converted into a new int8 array instead.
+// Returns 0 with an exception set on failure, board_buffer_release has to be called otherwise
+int board_buffer_get(PyObject* obj, PyObject* shapeOb, int convert, struct board_buffer* board);
+
+// Like board_buffer_get, for a board that must have the given dimensions, which 1D buffers take.
+// name is used in the error message
+int board_buffer_get_dims(PyObject* obj, const long long* dims, int convert, const char* name,
+	struct board_buffer* board);
+
+// Gets the out argument of the step functions, it is never converted and needs the shape of board,
+// which 1D buffers take. Py_None sets out to board, so it is stepped in place.
+// Returns 0 with an exception set on failure, out has to be released with board_out_release otherwise
+int board_out_get(PyObject* outOb, struct board_buffer* board, struct board_buffer** out,
+	struct board_buffer* out_storage);
+
+void board_buffer_release(struct board_buffer* board);
+
+void board_out_release(struct board_buffer* board, struct board_buffer* out);
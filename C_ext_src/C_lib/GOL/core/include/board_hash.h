@@ -0,0 +1,22 @@
+#include <Python.h>
+#include <stdint.h>
+#include "step_config.h"
+
+#pragma once
+
+// 64 bit hash of a board, used to find generations that repeat.
+// The hash only covers the cells that are stepped, so the dead border of a bounded board is skipped.
+// Every row is hashed on its own and the mixed row hashes are summed up,
+// so the rows can be hashed in any order, by any thread, right after they were written.
+
+uint64_t hash_row(const int8_t* row, long long count, long long stride);
+
+// Contribution of a row to the board hash
+uint64_t row_hash_mix(uint64_t row_hash, long long row);
+
+// Final board hash from the sum of the row contributions
+uint64_t board_hash_finish(uint64_t sum, const long long* arr_dims);
+
+uint64_t board_hash(
+		const int8_t* arr, const long long* arr_dims, const long long* arr_strides,
+		const struct step_config* config);
@@ -0,0 +1,69 @@
+#include <Python.h>
+
+#pragma once
+
+// Opt-in profiling of the python functions of the module.
+// The wall clock time and the amount of calls are accumulated for every phase of every backend,
+// while profiling is disabled every phase costs a single branch.
+
+enum profile_backend {
+	PROFILE_STEP_NP_ARR,
+	PROFILE_STEP_NP_ARR_MULTITHREAD,
+	PROFILE_STEP_N,
+	PROFILE_STEP_LIST_MULTITHREAD,
+	PROFILE_STEP_TILED,
+	PROFILE_STEP_PACKED,
+	PROFILE_STEPPER_STEP,
+	PROFILE_STEPPER_STEP_N,
+	PROFILE_BACKEND_COUNT
+};
+
+enum profile_phase {
+	// parsing and checking the arguments
+	PROFILE_CHECK,
+	// converting or copying the input into the layout the kernel works on
+	PROFILE_COPY_IN,
+	PROFILE_PARTIAL_SUM,
+	// the rest of the step, or the whole step for kernels that aren't split into phases
+	PROFILE_NEXT_STEP,
+	// copying the result back
+	PROFILE_COPY_OUT,
+	PROFILE_PHASE_COUNT
+};
+
+// Times the phases of a single call.
+// It belongs to the thread that runs the call, so the kernels can record phases without holding the GIL
+struct profile_timer {
+	int enabled;
+	enum profile_backend backend;
+	double start;
+	double last;
+	double seconds[PROFILE_PHASE_COUNT];
+	long long calls[PROFILE_PHASE_COUNT];
+};
+
+// Monotonic wall clock time in seconds
+double profile_clock(void);
+
+void profile_begin(struct profile_timer* timer, enum profile_backend backend);
+
+static inline void profile_lap(struct profile_timer* timer, enum profile_phase phase) {
+	// Adds the time since the last lap to the phase, timer can be NULL
+	if (timer != NULL && timer->enabled) {
+		double now = profile_clock();
+		timer->seconds[phase] += now - timer->last;
+		timer->calls[phase]++;
+		timer->last = now;
+	}
+}
+
+// Adds the call to the totals of its backend, must be called while holding the GIL
+void profile_end(struct profile_timer* timer);
+
+// Returns whether profiling was enabled before
+int profile_set_enabled(int enabled);
+
+void profile_reset(void);
+
+// New dict with the totals of the backends and phases that were called, NULL with an exception set on failure
+PyObject* profile_to_dict(void);
@@ -0,0 +1,55 @@
+#include <Python.h>
+#include <stdint.h>
+#include "step_config.h"
+
+#pragma once
+
+// Row kernels of the step functions in 128, 256 and 512 bit vectors, with a portable scalar fallback.
+// The best variant the CPU supports is selected when the module is imported,
+// simd_select forces another one, so the variants can be checked against each other.
+
+enum simd_variant {
+	SIMD_SCALAR,
+	SIMD_SSE2,
+	SIMD_AVX2,
+	SIMD_AVX512,
+	SIMD_VARIANT_COUNT
+};
+
+// The neighbour counts that give a live cell, compared against every count in the vector kernels,
+// and the rule table (see rule_table) of the scalar kernel
+struct simd_rule {
+	int8_t table[RULE_TABLE_SIZE];
+	int birth_count;
+	int survive_count;
+	int8_t birth[9];
+	int8_t survive[9];
+};
+
+struct simd_kernels {
+	const char* name;
+	// partial[j] = row[j-1] + row[j] + row[j+1] for start <= j < end
+	void (*sum_row)(const int8_t* row, int8_t* partial, long long start, long long end);
+	// Applies the rule to count cells, the neighbours of cell j are up[j] + mid[j] + down[j] - src[j].
+	// dst can be src. Returns the amount of cells that changed
+	long long (*rule_row)(
+		const int8_t* up, const int8_t* mid, const int8_t* down, const int8_t* src, int8_t* dst,
+		long long count, const struct simd_rule* rule);
+};
+
+void simd_rule_init(const struct step_config* config, struct simd_rule* rule);
+
+// Kernels of the selected variant
+const struct simd_kernels* simd_kernels(void);
+
+enum simd_variant simd_selected(void);
+
+const char* simd_variant_name(enum simd_variant variant);
+
+int simd_supported(enum simd_variant variant);
+
+// Returns 0 if the CPU doesn't support the variant
+int simd_select(enum simd_variant variant);
+
+// Selects the best variant the CPU supports
+void simd_init(void);
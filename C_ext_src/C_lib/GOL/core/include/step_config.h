@@ -0,0 +1,41 @@
+#include <Python.h>
+#include <stdint.h>
+
+#pragma once
+
+// How the cells on the edge of the board see their neighbours
+enum topology {
+	// the outer ring of cells is a dead border that is never changed
+	TOPOLOGY_BOUNDED = 0,
+	// the edges wrap around, every cell is part of the simulation
+	TOPOLOGY_TORUS = 1
+};
+
+// Options shared by all the step kernels
+struct step_config {
+	enum topology topology;
+	// life-like rule, bit n is set if a cell with n alive neighbours is born / survives
+	uint16_t birth;
+	uint16_t survive;
+};
+
+#define RULE_CONWAY_BIRTH (1 << 3)
+#define RULE_CONWAY_SURVIVE ((1 << 2) | (1 << 3))
+
+#define STEP_CONFIG_DEFAULT {.topology = TOPOLOGY_BOUNDED, .birth = RULE_CONWAY_BIRTH, .survive = RULE_CONWAY_SURVIVE}
+
+// Next state of a cell, indexed by alive * 9 + neighbours
+#define RULE_TABLE_SIZE 18
+
+void rule_table(const struct step_config* config, int8_t* table);
+
+int is_conway(const struct step_config* config);
+
+int parse_rule(const char* text, struct step_config* config);
+
+// "O&" converter for the topology keyword of the python functions, accepts "bounded" or "torus"
+int topology_converter(PyObject* obj, void* topology);
+
+// "O&" converter for the rule keyword of the python functions,
+// accepts None (conway's game of life) or anything that converts to a string in B/S notation
+int rule_converter(PyObject* obj, void* config);
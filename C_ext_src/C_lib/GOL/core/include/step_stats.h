@@ -0,0 +1,24 @@
+#include <Python.h>
+#include <stdint.h>
+
+#pragma once
+
+// Statistics of a generation, gathered by the step kernels while they write the new cells,
+// so they don't need another pass over the board. Only the cells that are stepped are counted.
+// The layout matches GOL.STATS_DTYPE.
+struct step_stats {
+	long long population;
+	// cells that were born and that died in this generation
+	long long births;
+	long long deaths;
+	// bounding box of the live cells, both ends included, all -1 if there are none
+	long long x_min;
+	long long x_max;
+	long long y_min;
+	long long y_max;
+};
+
+void step_stats_clear(struct step_stats* stats);
+
+// Adds the counts of from to into and grows the bounding box of into to include the one of from
+void step_stats_merge(struct step_stats* into, const struct step_stats* from);
@@ -0,0 +1,27 @@
+#include <Python.h>
+#include "profile.h"
+#include "board_buffer.h"
+#include "step_config.h"
+
+#pragma once
+
+// GOL.Stepper, steps boards of one shape with the scratch memory, pool and statistics it owns.
+// Every stepper holds a lock while stepping and releases the GIL, so steppers can be used from
+// several threads at once, and boards of different shapes don't share any buffers.
+extern PyTypeObject StepperType;
+
+// The module level step functions, they step with a stepper that is cached for the shape and options
+// of the board, so stepping a board again doesn't allocate anything
+PyObject* stepper_step_function(PyObject* args, PyObject* kwargs, int multithread, enum profile_backend backend);
+
+PyObject* stepper_step_n_function(PyObject* args, PyObject* kwargs);
+
+// Steps a board that supports the buffer protocol once into out (in place for Py_None) with the cached stepper,
+// returns the stepped board and ends the timer
+PyObject* stepper_step_buffer(PyObject* inputOb, PyObject* outOb, PyObject* shapeOb, const struct step_config* config,
+	int multithread, struct profile_timer* timer);
+
+// Steps the board once in place with the cached stepper, without ending the timer.
+// Returns 0 with an exception set on failure
+int stepper_step_in_place(struct board_buffer* board, const struct step_config* config, int multithread,
+	struct profile_timer* timer);
@@ -0,0 +1,26 @@
+#include <Python.h>
+
+#pragma once
+
+#ifndef THREAD_POOL_MAX_THREADS
+#define THREAD_POOL_MAX_THREADS 256
+#endif
+
+// Function run by every thread of the pool,
+// band is the index of the part of the work the thread should do (0 <= band < band_count)
+typedef void (*pool_task_fn)(void* ctx, int band, int band_count);
+
+struct thread_pool;
+
+int cpu_count(void);
+
+struct thread_pool* thread_pool_create(int thread_count);
+void thread_pool_destroy(struct thread_pool* pool);
+int thread_pool_resize(struct thread_pool* pool, int thread_count);
+int thread_pool_size(struct thread_pool* pool);
+void thread_pool_run(struct thread_pool* pool, pool_task_fn fn, void* ctx);
+void thread_pool_barrier(struct thread_pool* pool);
+
+struct thread_pool* default_thread_pool(void);
+
+void band_range(long long total, int band, int band_count, long long* start, long long* end);
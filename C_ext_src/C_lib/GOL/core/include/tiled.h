@@ -0,0 +1,9 @@
+#include <Python.h>
+#include <stdint.h>
+#include "step_config.h"
+
+#pragma once
+
+long long step_tiled(
+		int8_t* arr, int8_t* scratch, uint8_t* active,
+		long long rows, long long cols, long long tile_size, const struct step_config* config);
@@ -1,76 +1,384 @@
 #include "array_operations.h"
+#include "board_hash.h"
+#include "step_stats.h"
+#include "simd.h"
 
-struct partial_sum {
-	int8_t* arr;
-	long long* arr_dims;
-	long long* arr_strides;
-};
+// Rows of scratch memory every band has, the sums of the rows above and below the band
+// and the rolling window of the rows the band is at
+#define PARTIAL_SUM_HALO_UP 0
+#define PARTIAL_SUM_HALO_DOWN 1
+#define PARTIAL_SUM_WINDOW 2
+#define PARTIAL_SUM_BAND_ROWS 5
+
+
+struct partial_sum partial_sum_alloc(const long long* arr_dims, const struct step_config* config, int bands) {
+	// On a bounded board the first and last column have no partial sums
+	long long col_offset = config->topology == TOPOLOGY_TORUS ? 0 : 1;
+	struct partial_sum par = {
+		.width = arr_dims[1] - 2 * col_offset,
+		.col_offset = col_offset,
+		.bands = bands < 1 ? 1 : bands
+	};
+	par.arr = (int8_t*)malloc(par.bands * PARTIAL_SUM_BAND_ROWS * par.width * sizeof(int8_t));
+	return par;
+}
+
+
+static int partial_sum_reserve(struct partial_sum* par, int bands) {
+	// Grows the scratch memory to the given amount of bands, returns 0 if it could not be allocated
+	if (bands <= par->bands) {
+		return 1;
+	}
+	int8_t* arr = (int8_t*)realloc(par->arr, bands * PARTIAL_SUM_BAND_ROWS * par->width * sizeof(int8_t));
+	if (arr == NULL) {
+		return 0;
+	}
+	par->arr = arr;
+	par->bands = bands;
+	return 1;
+}
+
+
+void partial_sum_free(struct partial_sum* par) {
+	free(par->arr);
+	par->arr = NULL;
+}
 
 
-static struct partial_sum partial_sum_buffer_setup(const long long* arr_dims) {
-	// The partial summing is done in a seperate array
-	// that is cached between calls to this function
-	// if the array dimensions change, the buffer is invalidated (freed)
-	// and a new buffer is created
-	static long long partial_dims[2] = {0, 0};
-	static long long partial_strides[2]= {0, 0};
-	static int8_t* partial = NULL;
+static inline int8_t* partial_sum_row(const struct partial_sum* par, int band, int row) {
+	return par->arr + (band * PARTIAL_SUM_BAND_ROWS + row) * par->width;
+}
+
+
+static void sum_row(
+		const int8_t* row, int8_t* partial, long long width, long long col_offset, const struct simd_kernels* simd) {
+	// Writes the partial sums of a board row, partial starts at the column col_offset
+	long long last = width - 1;
+	// indexed by the column the sum is centered on
+	partial -= col_offset;
+	simd->sum_row(row, partial, 1, last);
+	if (col_offset == 0) {
+		// the first and last column are neighbours on a torus
+		partial[0] = row[last] + row[0] + row[1];
+		partial[last] = row[last - 1] + row[last] + row[0];
+	}
+}
 
-	if(partial_dims[0] != arr_dims[0] || partial_dims[1] != arr_dims[1] - 2) {
-		if(partial != NULL) {
-			free(partial);
+
+static inline int count_alive(const int8_t* row, long long count, long long stride) {
+	// The contiguous loop is vectorized by the compiler
+	int alive = 0;
+	if (stride == 1) {
+		for (long long j = 0; j < count; j++) {
+			alive += row[j] != 0;
+		}
+	} else {
+		for (long long j = 0; j < count; j++) {
+			alive += row[j * stride] != 0;
 		}
-		partial_dims[0] = arr_dims[0];
-		partial_dims[1] = arr_dims[1] - 2;
-		partial = (int8_t*)calloc(partial_dims[0] * partial_dims[1], sizeof(int8_t));
-		partial_strides[0] = partial_dims[1];
-		partial_strides[1] = 1;
 	}
+	return alive;
+}
 
-	return (struct partial_sum){
-		.arr = partial,
-		.arr_dims = partial_dims,
-		.arr_strides = partial_strides
-	};
+
+static inline int next_step_row(
+		const int8_t* src, int8_t* dst, const long long* arr_strides,
+		const struct partial_sum* par, const int8_t* partial_up, const int8_t* partial_mid, const int8_t* partial_down,
+		const struct simd_kernels* simd, const struct simd_rule* rule,
+		long long i, const int count, struct step_stats* stats) {
+	// Steps row i with the partial sums of the rows around it,
+	// with count set the population, births and deaths of the row are added to stats.
+	// count is a constant at both call sites, so the counting is compiled out when it isn't needed
+	// births and deaths follow from the flipped cells and the change of the population,
+	// the populations are counted in separate passes over the row while it is in the cache,
+	// the old one before the row is overwritten, because src can be dst
+	long long width = par->width;
+	long long row_index = i * arr_strides[0] + par->col_offset;
+	int previous_population = count ? count_alive(src + row_index, width, 1) : 0;
+	// births and deaths assume the cells are 0 or 1, just like the rules do
+	long long flips = simd->rule_row(partial_up, partial_mid, partial_down, src + row_index, dst + row_index,
+		width, rule);
+	if (count) {
+		int population = count_alive(dst + row_index, width, 1);
+		stats->population += population;
+		stats->births += (flips + population - previous_population) / 2;
+		stats->deaths += (flips - population + previous_population) / 2;
+	}
+	return flips != 0;
 }
 
 
-void calculate_next_step(int8_t* arr, long long* arr_dims, long long* arr_strides) {
-	// recreate the partial sum array if the array dimensions have changed
-	struct partial_sum par = partial_sum_buffer_setup(arr_dims);
-	int8_t* partial = par.arr;
-	long long* partial_dims = par.arr_dims;
-	long long* partial_strides = par.arr_strides;
-	
-	// calculate the partial sums
-	for (long long i = 0; i < partial_dims[0]; i ++) {
-		for (long long j = 0; j < partial_dims[1]; j++) {
-			long long index = i * arr_strides[0] + j * arr_strides[1];
-			long long partial_index = i * partial_strides[0] + j * partial_strides[1];
-			partial[partial_index] =
-				arr[index							] +
-				arr[index + arr_strides[1]				] +
-				arr[index + arr_strides[1] + arr_strides[1]	];
+static void row_bounds(
+		const int8_t* row, long long first, long long last, long long stride, struct step_stats* stats) {
+	// Grows the column range of the bounding box to the live cells of a row that has some.
+	// Only the columns outside of the current range are searched, from the outside in
+	long long j;
+	long long y_min = stats->y_min < 0 ? last + 1 : stats->y_min;
+	for (j = first; j < y_min && row[j * stride] == 0; j++);
+	if (j < y_min) {
+		stats->y_min = j;
+	}
+	long long y_max = stats->y_max < 0 ? stats->y_min - 1 : stats->y_max;
+	for (j = last; j > y_max && row[j * stride] == 0; j--);
+	if (j > y_max) {
+		stats->y_max = j;
+	}
+}
+
+
+static void band_halo(
+		const int8_t* src, const long long* arr_dims, const long long* arr_strides,
+		struct partial_sum* par, int band, long long row_start, long long row_end) {
+	// Saves the partial sums of the rows above and below the rows of a band,
+	// they belong to other bands that may overwrite them before the band needs them.
+	// The rows wrap around, which only matters on a torus
+	const struct simd_kernels* simd = simd_kernels();
+	if (row_start == row_end) {
+		return;
+	}
+	long long up = (row_start - 1 + arr_dims[0]) % arr_dims[0];
+	long long down = row_end % arr_dims[0];
+	sum_row(src + up * arr_strides[0], partial_sum_row(par, band, PARTIAL_SUM_HALO_UP), arr_dims[1],
+		par->col_offset, simd);
+	sum_row(src + down * arr_strides[0], partial_sum_row(par, band, PARTIAL_SUM_HALO_DOWN), arr_dims[1],
+		par->col_offset, simd);
+}
+
+
+// Writes the next step of the rows of a band from src into dst in a single pass,
+// band_halo has to be run for the band first.
+// Only the partial sums of three rows are kept, the sums of a row are calculated just before
+// the row above it is stepped, so every row is read from memory once and written once.
+// dst can be the same array as src because every row is summed before the row above it is written.
+// If hash is not NULL, the hash contributions of the new rows are added to it (see board_hash.h),
+// each row is hashed right after it was written, while it is still in the cache.
+// If stats is not NULL, the statistics of the new rows are merged into it (see step_stats.h).
+// Returns 1 if any cell changed, 0 otherwise
+static int next_step_rows(
+		const int8_t* src, int8_t* dst, const long long* arr_dims, const long long* arr_strides,
+		const struct step_config* config, const struct partial_sum* par, int band,
+		long long row_start, long long row_end, uint64_t* hash, struct step_stats* stats) {
+	int changed = 0;
+	const struct simd_kernels* simd = simd_kernels();
+	struct simd_rule rule;
+	simd_rule_init(config, &rule);
+	struct step_stats rows;
+	step_stats_clear(&rows);
+	// the sums of row i are in window[(i - row_start) % 3]
+	int8_t* window[3] = {
+		partial_sum_row(par, band, PARTIAL_SUM_WINDOW),
+		partial_sum_row(par, band, PARTIAL_SUM_WINDOW + 1),
+		partial_sum_row(par, band, PARTIAL_SUM_WINDOW + 2)
+	};
+	const int8_t* partial_up = partial_sum_row(par, band, PARTIAL_SUM_HALO_UP);
+	if (row_start < row_end) {
+		sum_row(src + row_start * arr_strides[0], window[0], arr_dims[1], par->col_offset, simd);
+	}
+	for (long long i = row_start; i < row_end; i++) {
+		const int8_t* partial_mid = window[(i - row_start) % 3];
+		const int8_t* partial_down;
+		if (i + 1 == row_end) {
+			partial_down = partial_sum_row(par, band, PARTIAL_SUM_HALO_DOWN);
+		} else {
+			partial_down = window[(i + 1 - row_start) % 3];
+			sum_row(src + (i + 1) * arr_strides[0], (int8_t*)partial_down, arr_dims[1], par->col_offset, simd);
+		}
+		const int8_t* row = dst + i * arr_strides[0] + par->col_offset * arr_strides[1];
+		if (stats == NULL) {
+			changed |= next_step_row(src, dst, arr_strides, par, partial_up, partial_mid, partial_down,
+				simd, &rule, i, 0, NULL);
+		} else {
+			long long population = rows.population;
+			changed |= next_step_row(src, dst, arr_strides, par, partial_up, partial_mid, partial_down,
+				simd, &rule, i, 1, &rows);
+			if (rows.population > population) {
+				// the rows are stepped in order
+				rows.x_min = rows.x_min < 0 ? i : rows.x_min;
+				rows.x_max = i;
+				row_bounds(row - par->col_offset * arr_strides[1], par->col_offset,
+					arr_dims[1] - 1 - par->col_offset, arr_strides[1], &rows);
+			}
+		}
+		if (hash != NULL) {
+			*hash += row_hash_mix(hash_row(row, par->width, arr_strides[1]), i);
 		}
+		partial_up = partial_mid;
 	}
+	if (stats != NULL) {
+		step_stats_merge(stats, &rows);
+	}
+	return changed;
+}
+
+
+static void step_rows(long long rows, const struct step_config* config, long long* start, long long* end) {
+	// Rows that are stepped, the first and last row are only a border on a bounded board
+	*start = config->topology == TOPOLOGY_TORUS ? 0 : 1;
+	*end = config->topology == TOPOLOGY_TORUS ? rows : rows - 1;
+}
+
+
+struct step_task {
+	const int8_t* src;
+	int8_t* dst;
+	long long* arr_dims;
+	long long* arr_strides;
+	const struct step_config* config;
+	struct partial_sum* par;
+	struct thread_pool* pool;
+	// only recorded by band 0, which runs on the calling thread
+	struct profile_timer* timer;
+	int changed[THREAD_POOL_MAX_THREADS];
+	// hash sums of the bands, NULL if the hash isn't needed
+	uint64_t* hash;
+	// statistics of the bands, NULL if they aren't needed
+	struct step_stats* stats;
+};
 
-	
-	// calculate the next step
-	int8_t arr_val;
+
+static void step_task_run(void* ctx, int band, int band_count) {
+	// Sums the rows around the band, waits for the other bands to do the same and steps the band.
+	// Both phases run in the same task, so the amount of bands can't change in between.
+	// Without the memory for a band per thread the threads with a higher band stay idle
+	struct step_task* task = (struct step_task*)ctx;
+	int bands = band_count < task->par->bands ? band_count : task->par->bands;
+	long long first, last, start = 0, end = 0;
+	if (band < bands) {
+		step_rows(task->arr_dims[0], task->config, &first, &last);
+		band_range(last - first, band, bands, &start, &end);
+		start += first;
+		end += first;
+		band_halo(task->src, task->arr_dims, task->arr_strides, task->par, band, start, end);
+	}
+	thread_pool_barrier(task->pool);
+	if (band == 0) {
+		profile_lap(task->timer, PROFILE_PARTIAL_SUM);
+	}
+	if (band < bands) {
+		task->changed[band] = next_step_rows(task->src, task->dst, task->arr_dims, task->arr_strides,
+			task->config, task->par, band, start, end, task->hash != NULL ? &task->hash[band] : NULL,
+			task->stats != NULL ? &task->stats[band] : NULL);
+	}
+}
+
+
+void copy_border(const int8_t* src, int8_t* dst, const long long* arr_dims, const long long* arr_strides) {
+	long long last_row = (arr_dims[0] - 1) * arr_strides[0];
+	long long last_col = (arr_dims[1] - 1) * arr_strides[1];
+	for (long long j = 0; j < arr_dims[1]; j++) {
+		dst[j * arr_strides[1]] = src[j * arr_strides[1]];
+		dst[last_row + j * arr_strides[1]] = src[last_row + j * arr_strides[1]];
+	}
 	for (long long i = 1; i < arr_dims[0] - 1; i++) {
-		for (long long j = 1; j < arr_dims[1] - 1; j++) {
-			long long index = i * arr_strides[0] + j * arr_strides[1];
-			long long partial_index = i * partial_strides[0] + (j - 1) * partial_strides[1];
-			arr_val = arr[index];
-			arr[index] = 
-				partial[partial_index - partial_strides[0]	] +
-				partial[partial_index						] +
-				partial[partial_index + partial_strides[0]	] -
-				arr[index];
-			arr[index] = (arr[index] == 3 || (arr[index] == 2 && arr_val == 1) ? 1 : 0);
+		dst[i * arr_strides[0]] = src[i * arr_strides[0]];
+		dst[i * arr_strides[0] + last_col] = src[i * arr_strides[0] + last_col];
+	}
+}
+
+
+static int step_into(
+		const int8_t* src, int8_t* dst, long long* arr_dims, long long* arr_strides,
+		const struct step_config* config, struct partial_sum* par, struct thread_pool* pool,
+		uint64_t* hash, struct step_stats* stats, struct profile_timer* timer) {
+	// Runs a single step from src into dst, on the pool if there is one
+	// If hash is not NULL, the hash of the new board is written to it, the same for stats
+	// Returns 1 if any cell changed
+	if (stats != NULL) {
+		step_stats_clear(stats);
+	}
+	if (src != dst && config->topology != TOPOLOGY_TORUS) {
+		copy_border(src, dst, arr_dims, arr_strides);
+	}
+	if (pool == NULL) {
+		long long start, end;
+		uint64_t sum = 0;
+		step_rows(arr_dims[0], config, &start, &end);
+		band_halo(src, arr_dims, arr_strides, par, 0, start, end);
+		profile_lap(timer, PROFILE_PARTIAL_SUM);
+		int changed = next_step_rows(src, dst, arr_dims, arr_strides, config, par, 0, start, end,
+			hash != NULL ? &sum : NULL, stats);
+		if (hash != NULL) {
+			*hash = board_hash_finish(sum, arr_dims);
+		}
+		profile_lap(timer, PROFILE_NEXT_STEP);
+		return changed;
+	}
+	uint64_t band_hashes[THREAD_POOL_MAX_THREADS] = {0};
+	struct step_stats band_stats[THREAD_POOL_MAX_THREADS];
+	if (stats != NULL) {
+		for (int i = 0; i < THREAD_POOL_MAX_THREADS; i++) {
+			step_stats_clear(&band_stats[i]);
+		}
+	}
+	// Each cell is only written by the thread that reads it, and the rows the bands share
+	// are summed before any band starts, so the board can be updated in place.
+	// The pool can still be resized before the task runs, then fewer or more bands are used,
+	// if the memory for all of them can't be allocated some threads stay idle
+	partial_sum_reserve(par, thread_pool_size(pool));
+	struct step_task task = {
+		.src = src,
+		.dst = dst,
+		.arr_dims = arr_dims,
+		.arr_strides = arr_strides,
+		.config = config,
+		.par = par,
+		.pool = pool,
+		.timer = timer,
+		.changed = {0},
+		.hash = hash != NULL ? band_hashes : NULL,
+		.stats = stats != NULL ? band_stats : NULL
+	};
+	thread_pool_run(pool, step_task_run, &task);
+	int changed = 0;
+	uint64_t sum = 0;
+	for (int i = 0; i < THREAD_POOL_MAX_THREADS; i++) {
+		changed |= task.changed[i];
+		sum += band_hashes[i];
+		if (stats != NULL) {
+			step_stats_merge(stats, &band_stats[i]);
 		}
 	}
+	if (hash != NULL) {
+		*hash = board_hash_finish(sum, arr_dims);
+	}
+	profile_lap(timer, PROFILE_NEXT_STEP);
+	return changed;
+}
+
+
+int calculate_next_step(
+		const int8_t* src, int8_t* dst, long long* arr_dims, long long* arr_strides,
+		const struct step_config* config, struct partial_sum* par, struct thread_pool* pool,
+		uint64_t* hash, struct step_stats* stats, struct profile_timer* timer) {
+	return step_into(src, dst, arr_dims, arr_strides, config, par, pool, hash, stats, timer);
+}
 
 
-	return;
-}
\ No newline at end of file
+// Runs up to n steps from arr into out without returning to python, out can be arr.
+// The first step writes out and the others step it in place, so no other board is needed.
+// The pool is optional (NULL).
+// If hashes is not NULL, the hash of every generation is written to it, it must have room for n hashes.
+// The same goes for stats, which receives the statistics of every generation.
+// Returns the amount of steps that were run
+long long calculate_n_steps(
+		const int8_t* arr, int8_t* out, long long* arr_dims, long long* arr_strides,
+		const struct step_config* config, struct partial_sum* par,
+		long long n, int stop_when_stable, struct thread_pool* pool, uint64_t* hashes, struct step_stats* stats,
+		struct profile_timer* timer) {
+	const int8_t* src = arr;
+	long long generation = 0;
+	while (generation < n) {
+		int changed = step_into(src, out, arr_dims, arr_strides, config, par, pool,
+			hashes != NULL ? &hashes[generation] : NULL, stats != NULL ? &stats[generation] : NULL, timer);
+		src = out;
+		generation++;
+		if (stop_when_stable && !changed) {
+			break;
+		}
+	}
+	if (src != out) {
+		memcpy(out, src, arr_dims[0] * arr_strides[0] * sizeof(int8_t));
+		profile_lap(timer, PROFILE_COPY_OUT);
+	}
+	return generation;
+}
@@ -0,0 +1,209 @@
+#include "bitboard.h"
+
+// A bit-packed board stores each row of cells in ceil(cols/64) words.
+// Cell j of a row is bit j%64 of word j/64, unused bits of the last word are always 0.
+// This way a single bitwise operation on a word updates 64 cells at once.
+
+
+long long packed_words(long long cols) {
+	return (cols + BITBOARD_WORD_BITS - 1) / BITBOARD_WORD_BITS;
+}
+
+
+void pack_board(const uint8_t* arr, long long rows, long long cols, long long row_stride, uint64_t* packed) {
+	long long words = packed_words(cols);
+	for (long long i = 0; i < rows; i++) {
+		const uint8_t* row = arr + i * row_stride;
+		uint64_t* out = packed + i * words;
+		for (long long w = 0; w < words; w++) {
+			long long base = w * BITBOARD_WORD_BITS;
+			long long count = cols - base < BITBOARD_WORD_BITS ? cols - base : BITBOARD_WORD_BITS;
+			uint64_t word = 0;
+			for (long long b = 0; b < count; b++) {
+				word |= (uint64_t)(row[base + b] != 0) << b;
+			}
+			out[w] = word;
+		}
+	}
+}
+
+
+void unpack_board(const uint64_t* packed, long long rows, long long cols, uint8_t* arr) {
+	long long words = packed_words(cols);
+	for (long long i = 0; i < rows; i++) {
+		const uint64_t* row = packed + i * words;
+		uint8_t* out = arr + i * cols;
+		for (long long j = 0; j < cols; j++) {
+			out[j] = (uint8_t)((row[j / BITBOARD_WORD_BITS] >> (j % BITBOARD_WORD_BITS)) & 1);
+		}
+	}
+}
+
+
+static inline void full_add(uint64_t a, uint64_t b, uint64_t c, uint64_t* sum, uint64_t* carry) {
+	uint64_t t = a ^ b;
+	*sum = t ^ c;
+	*carry = (a & b) | (t & c);
+}
+
+
+// Counts the 8 neighbours of the 64 cells in the middle row,
+// given the neighbour words (west/east are the row shifted by one cell)
+// The count of every cell is returned as 4 bits spread over the words ones, twos, fours and eights
+static inline void count_neighbours(
+		uint64_t a_w, uint64_t a, uint64_t a_e,
+		uint64_t c_w, uint64_t c_e,
+		uint64_t b_w, uint64_t b, uint64_t b_e,
+		uint64_t* ones, uint64_t* twos, uint64_t* fours, uint64_t* eights) {
+	uint64_t s0, c0, s1, c1, c3, t0, t1;
+	// add up the rows above and below, giving a 2 bit sum for each
+	full_add(a_w, a, a_e, &s0, &c0);
+	full_add(b_w, b, b_e, &s1, &c1);
+	// the middle row only has the 2 side neighbours
+	uint64_t s2 = c_w ^ c_e;
+	uint64_t c2 = c_w & c_e;
+	// add the 1s place together and then the 2s place
+	full_add(s0, s1, s2, ones, &c3);
+	full_add(c0, c1, c2, &t0, &t1);
+	*twos = t0 ^ c3;
+	uint64_t t2 = t0 & c3;
+	*fours = t1 ^ t2;
+	*eights = t1 & t2;
+}
+
+
+// Calculates the next state of the 64 cells in `c` with conway's rule
+static inline uint64_t life_word(
+		uint64_t a_w, uint64_t a, uint64_t a_e,
+		uint64_t c_w, uint64_t c, uint64_t c_e,
+		uint64_t b_w, uint64_t b, uint64_t b_e) {
+	uint64_t ones, twos, fours, eights;
+	count_neighbours(a_w, a, a_e, c_w, c_e, b_w, b, b_e, &ones, &twos, &fours, &eights);
+	// alive if the neighbour count is 3, or 2 and the cell is already alive
+	return twos & ~(fours | eights) & (ones | c);
+}
+
+
+// Calculates the next state of the 64 cells in `c` with any life-like rule
+// Every neighbour count that is part of the rule adds one term of 4 bits to the result
+static inline uint64_t rule_word(
+		uint64_t a_w, uint64_t a, uint64_t a_e,
+		uint64_t c_w, uint64_t c, uint64_t c_e,
+		uint64_t b_w, uint64_t b, uint64_t b_e,
+		uint16_t birth, uint16_t survive) {
+	uint64_t count[4];
+	count_neighbours(a_w, a, a_e, c_w, c_e, b_w, b, b_e, &count[0], &count[1], &count[2], &count[3]);
+	uint64_t born = 0;
+	uint64_t survived = 0;
+	for (int n = 0; n <= 8; n++) {
+		if (!((birth | survive) >> n & 1)) {
+			continue;
+		}
+		uint64_t equal = ~(uint64_t)0;
+		for (int bit = 0; bit < 4; bit++) {
+			equal &= (n >> bit & 1) ? count[bit] : ~count[bit];
+		}
+		if (birth >> n & 1) {
+			born |= equal;
+		}
+		if (survive >> n & 1) {
+			survived |= equal;
+		}
+	}
+	return (born & ~c) | (survived & c);
+}
+
+
+static inline uint64_t west_of(const uint64_t* row, long long w, long long cols, int torus) {
+	uint64_t carry = 0;
+	if (w > 0) {
+		carry = row[w - 1] >> (BITBOARD_WORD_BITS - 1);
+	} else if (torus) {
+		// the west neighbour of the first cell is the last cell of the row
+		carry = (row[(cols - 1) / BITBOARD_WORD_BITS] >> ((cols - 1) % BITBOARD_WORD_BITS)) & 1;
+	}
+	return (row[w] << 1) | carry;
+}
+
+
+static inline uint64_t east_of(const uint64_t* row, long long w, long long words, long long cols, int torus) {
+	uint64_t shifted = row[w] >> 1;
+	if (w < words - 1) {
+		shifted |= row[w + 1] << (BITBOARD_WORD_BITS - 1);
+	} else if (torus) {
+		// the east neighbour of the last cell is the first cell of the row
+		shifted |= (row[0] & 1) << ((cols - 1) % BITBOARD_WORD_BITS);
+	}
+	return shifted;
+}
+
+
+// Steps the bit-packed board in place.
+// On a bounded board the outer ring of cells is left untouched just like in calculate_next_step,
+// on a torus the edges wrap around.
+// Returns 0 on success, -1 if the row buffers could not be allocated
+int step_packed_board(uint64_t* packed, long long rows, long long cols, const struct step_config* config) {
+	long long words = packed_words(cols);
+	int torus = config->topology == TOPOLOGY_TORUS;
+	// conway's rule has its own shorter logic
+	int conway = is_conway(config);
+	// the original state of the previous row, the next state of the current row
+	// and the original state of the first row, which is below the last row on a torus
+	uint64_t* above = (uint64_t*)malloc(3 * words * sizeof(uint64_t));
+	if (above == NULL) {
+		return -1;
+	}
+	uint64_t* next = above + words;
+	uint64_t* first = next + words;
+	memcpy(first, packed, words * sizeof(uint64_t));
+	if (torus) {
+		memcpy(above, packed + (rows - 1) * words, words * sizeof(uint64_t));
+	} else {
+		memcpy(above, packed, words * sizeof(uint64_t));
+	}
+
+	// only the inner cells are written back on a bounded board, the first and last column are border
+	// on a torus only the unused bits of the last word are masked
+	uint64_t first_mask = torus ? ~(uint64_t)0 : ~(uint64_t)1;
+	uint64_t last_mask = torus ? ~(uint64_t)0 : ((uint64_t)1 << ((cols - 1) % BITBOARD_WORD_BITS)) - 1;
+	if (torus && cols % BITBOARD_WORD_BITS != 0) {
+		last_mask = ((uint64_t)1 << (cols % BITBOARD_WORD_BITS)) - 1;
+	}
+	long long last_word = torus ? words - 1 : (cols - 1) / BITBOARD_WORD_BITS;
+
+	for (long long i = torus ? 0 : 1; i < (torus ? rows : rows - 1); i++) {
+		uint64_t* cur = packed + i * words;
+		const uint64_t* below = i == rows - 1 ? first : cur + words;
+		if (conway) {
+			for (long long w = 0; w < words; w++) {
+				next[w] = life_word(
+					west_of(above, w, cols, torus), above[w], east_of(above, w, words, cols, torus),
+					west_of(cur, w, cols, torus), cur[w], east_of(cur, w, words, cols, torus),
+					west_of(below, w, cols, torus), below[w], east_of(below, w, words, cols, torus));
+			}
+		} else {
+			for (long long w = 0; w < words; w++) {
+				next[w] = rule_word(
+					west_of(above, w, cols, torus), above[w], east_of(above, w, words, cols, torus),
+					west_of(cur, w, cols, torus), cur[w], east_of(cur, w, words, cols, torus),
+					west_of(below, w, cols, torus), below[w], east_of(below, w, words, cols, torus),
+					config->birth, config->survive);
+			}
+		}
+		memcpy(above, cur, words * sizeof(uint64_t));
+
+		for (long long w = 0; w < words; w++) {
+			uint64_t mask = ~(uint64_t)0;
+			if (w == 0) {
+				mask &= first_mask;
+			}
+			if (w == last_word) {
+				mask &= last_mask;
+			}
+			cur[w] = (next[w] & mask) | (cur[w] & ~mask);
+		}
+	}
+
+	free(above);
+	return 0;
+}
@@ -0,0 +1,164 @@
+#define PY_SSIZE_T_CLEAN
+// the numpy API is imported by core_main.c
+#define PY_ARRAY_UNIQUE_SYMBOL GOL_ARRAY_API
+#define NO_IMPORT_ARRAY
+#include <numpy/ndarrayobject.h>
+#include "board_buffer.h"
+
+#define BOARD_BUFFER_FLAGS (PyBUF_C_CONTIGUOUS | PyBUF_FORMAT | PyBUF_WRITABLE)
+
+
+static int byte_format(const char* format) {
+	// Returns whether the struct format of a buffer is a single byte
+	if (format == NULL) {
+		return 1;
+	}
+	if (*format == '@' || *format == '=' || *format == '<' || *format == '>' || *format == '!') {
+		format++;
+	}
+	return (format[0] == 'B' || format[0] == 'b' || format[0] == '?' || format[0] == 'c') && format[1] == '\0';
+}
+
+
+static int board_shape(PyObject* shapeOb, const Py_buffer* view, long long* dims) {
+	if (shapeOb != Py_None) {
+		PyObject* shape = PySequence_Tuple(shapeOb);
+		if (shape == NULL) {
+			return 0;
+		}
+		int parsed = PyArg_ParseTuple(shape, "LL;shape must be (rows, columns)", &dims[0], &dims[1]);
+		Py_DECREF(shape);
+		if (!parsed) {
+			return 0;
+		}
+		if (dims[0] < 0 || dims[1] < 0 || dims[0] * dims[1] != view->len) {
+			PyErr_SetString(PyExc_ValueError, "Shape does not match the size of the buffer");
+			return 0;
+		}
+	}
+	else if (view->ndim == 2) {
+		dims[0] = view->shape[0];
+		dims[1] = view->shape[1];
+	}
+	else {
+		PyErr_SetString(PyExc_TypeError, "Input must be a 2D array, or a 1D buffer with a shape");
+		return 0;
+	}
+	if (dims[0] < 3) {
+		PyErr_SetString(PyExc_ValueError, "Input must have at least 3 rows");
+		return 0;
+	}
+	if (dims[1] < 3) {
+		PyErr_SetString(PyExc_ValueError, "Input must have at least 3 columns");
+		return 0;
+	}
+	return 1;
+}
+
+
+static int board_view_get(PyObject* obj, int convert, struct board_buffer* board) {
+	// Gets the buffer of a board, or of its int8 copy if it is a numpy array that doesn't fit
+	board->object = NULL;
+	int can_convert = convert && PyArray_Check(obj);
+	if (PyObject_GetBuffer(obj, &board->view, BOARD_BUFFER_FLAGS) == 0) {
+		if (board->view.itemsize == 1 && byte_format(board->view.format)) {
+			Py_INCREF(obj);
+			board->object = obj;
+		}
+		else {
+			PyBuffer_Release(&board->view);
+			if (!can_convert) {
+				PyErr_SetString(PyExc_TypeError, "Input cells must be single bytes (uint8, int8 or bool)");
+				return 0;
+			}
+		}
+	}
+	else if (can_convert) {
+		PyErr_Clear();
+	}
+	else {
+		PyErr_SetString(PyExc_TypeError, "Input must be a writeable, C contiguous buffer of single byte cells");
+		return 0;
+	}
+	if (board->object == NULL) {
+		// the numpy array is copied into an int8 array, the step functions return the copy
+		PyObject* converted = PyArray_FromArray((PyArrayObject*)obj, PyArray_DescrFromType(NPY_INT8),
+			NPY_ARRAY_C_CONTIGUOUS | NPY_ARRAY_ALIGNED | NPY_ARRAY_WRITEABLE | NPY_ARRAY_FORCECAST);
+		if (converted == NULL) {
+			return 0;
+		}
+		if (PyObject_GetBuffer(converted, &board->view, BOARD_BUFFER_FLAGS) < 0) {
+			Py_DECREF(converted);
+			return 0;
+		}
+		board->object = converted;
+	}
+	return 1;
+}
+
+
+int board_buffer_get(PyObject* obj, PyObject* shapeOb, int convert, struct board_buffer* board) {
+	if (!board_view_get(obj, convert, board)) {
+		return 0;
+	}
+	if (!board_shape(shapeOb, &board->view, board->dims)) {
+		board_buffer_release(board);
+		return 0;
+	}
+	board->strides[0] = board->dims[1];
+	board->strides[1] = 1;
+	return 1;
+}
+
+
+int board_buffer_get_dims(PyObject* obj, const long long* dims, int convert, const char* name,
+		struct board_buffer* board) {
+	if (!board_view_get(obj, convert, board)) {
+		return 0;
+	}
+	int fits;
+	if (board->view.ndim == 2) {
+		fits = board->view.shape[0] == dims[0] && board->view.shape[1] == dims[1];
+	}
+	else {
+		fits = board->view.len == dims[0] * dims[1];
+	}
+	if (!fits) {
+		board_buffer_release(board);
+		PyErr_Format(PyExc_ValueError, "%s must have the shape (%lld, %lld)", name, dims[0], dims[1]);
+		return 0;
+	}
+	board->dims[0] = dims[0];
+	board->dims[1] = dims[1];
+	board->strides[0] = dims[1];
+	board->strides[1] = 1;
+	return 1;
+}
+
+
+int board_out_get(PyObject* outOb, struct board_buffer* board, struct board_buffer** out,
+		struct board_buffer* out_storage) {
+	if (outOb == Py_None) {
+		*out = board;
+		return 1;
+	}
+	if (!board_buffer_get_dims(outOb, board->dims, 0, "Out", out_storage)) {
+		return 0;
+	}
+	*out = out_storage;
+	return 1;
+}
+
+
+void board_buffer_release(struct board_buffer* board) {
+	PyBuffer_Release(&board->view);
+	Py_CLEAR(board->object);
+}
+
+
+void board_out_release(struct board_buffer* board, struct board_buffer* out) {
+	if (out != board) {
+		board_buffer_release(out);
+	}
+	board_buffer_release(board);
+}
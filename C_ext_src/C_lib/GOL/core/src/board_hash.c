@@ -0,0 +1,62 @@
+#include "board_hash.h"
+
+#define HASH_SEED 0x243F6A8885A308D3ULL
+#define HASH_MULTIPLIER 0x9E3779B97F4A7C15ULL
+#define ROW_MULTIPLIER 0xC2B2AE3D27D4EB4FULL
+
+
+static inline uint64_t mix64(uint64_t x) {
+	// finalizer of splitmix64, every input bit affects every output bit
+	x ^= x >> 30;
+	x *= 0xBF58476D1CE4E5B9ULL;
+	x ^= x >> 27;
+	x *= 0x94D049BB133111EBULL;
+	x ^= x >> 31;
+	return x;
+}
+
+
+uint64_t hash_row(const int8_t* row, long long count, long long stride) {
+	// The cells are combined 8 at a time, so there is only one multiplication per 8 cells
+	uint64_t h = HASH_SEED;
+	long long j = 0;
+	if (stride == 1) {
+		for (; j + 8 <= count; j += 8) {
+			uint64_t word;
+			memcpy(&word, row + j, sizeof(word));
+			h = (h ^ word) * HASH_MULTIPLIER;
+		}
+	}
+	while (j < count) {
+		uint64_t word = 0;
+		for (int k = 0; k < 8 && j < count; k++, j++) {
+			word |= (uint64_t)(uint8_t)row[j * stride] << (8 * k);
+		}
+		h = (h ^ word) * HASH_MULTIPLIER;
+	}
+	return h;
+}
+
+
+uint64_t row_hash_mix(uint64_t row_hash, long long row) {
+	return mix64(row_hash + (uint64_t)row * ROW_MULTIPLIER);
+}
+
+
+uint64_t board_hash_finish(uint64_t sum, const long long* arr_dims) {
+	// boards of different shapes don't share hashes
+	return mix64(sum ^ mix64((uint64_t)arr_dims[0] << 32 ^ (uint64_t)arr_dims[1]));
+}
+
+
+uint64_t board_hash(
+		const int8_t* arr, const long long* arr_dims, const long long* arr_strides,
+		const struct step_config* config) {
+	long long border = config->topology == TOPOLOGY_TORUS ? 0 : 1;
+	uint64_t sum = 0;
+	for (long long i = border; i < arr_dims[0] - border; i++) {
+		const int8_t* row = arr + i * arr_strides[0] + border * arr_strides[1];
+		sum += row_hash_mix(hash_row(row, arr_dims[1] - 2 * border, arr_strides[1]), i);
+	}
+	return board_hash_finish(sum, arr_dims);
+}
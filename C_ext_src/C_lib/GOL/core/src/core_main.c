@@ -1,76 +1,384 @@
 #define PY_SSIZE_T_CLEAN
+// shared with board_buffer.c, which uses the numpy API imported here
+#define PY_ARRAY_UNIQUE_SYMBOL GOL_ARRAY_API
 #include <numpy/ndarrayobject.h>
 #include <Python.h>
 #include <stdio.h>
 #include <time.h>
 #include "array_operations.h"
 #include "multithread.h"
+#include "bitboard.h"
+#include "tiled.h"
+#include "board_hash.h"
+#include "step_stats.h"
+#include "profile.h"
+#include "stepper.h"
+#include "simd.h"
 
 static PyObject* GOL_init(PyObject* self, PyObject* args) {
 	Py_RETURN_NONE;
 }
 
 
-static PyObject* GOL_step_NpArr(PyObject* self, PyObject* args) {
+static PyObject* GOL_step_NpArr(PyObject* self, PyObject* args, PyObject* kwargs) {
+	return stepper_step_function(args, kwargs, 0, PROFILE_STEP_NP_ARR);
+}
+
+
+static PyObject* GOL_step_NpArr_multithread(PyObject* self, PyObject* args, PyObject* kwargs) {
+	return stepper_step_function(args, kwargs, 1, PROFILE_STEP_NP_ARR_MULTITHREAD);
+}
+
+
+static PyObject* GOL_step_n(PyObject* self, PyObject* args, PyObject* kwargs) {
+	return stepper_step_n_function(args, kwargs);
+}
+
 
+static PyObject* GOL_board_hash(PyObject* self, PyObject* args, PyObject* kwargs) {
+	static char* keywords[] = {"arr", "topology", NULL};
 	PyObject* inputOb;
-	if (!PyArg_ParseTuple(args, "O", &inputOb)) {
-		PyErr_SetString(PyExc_TypeError, "Input must be a numpy array");
+	struct step_config config = STEP_CONFIG_DEFAULT;
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|O&", keywords,
+			&inputOb, topology_converter, &config.topology)) {
 		return NULL;
 	}
-	//printf("Input parsed, inputOb: %p\n", inputOb);
-	if(!PyArray_Check(inputOb)) {
-		//printf("Input is not a numpy array\n");
+	if (!PyArray_Check(inputOb)) {
 		PyErr_SetString(PyExc_TypeError, "Input must be a numpy array");
 		return NULL;
 	}
-	Py_INCREF(inputOb);
-	PyArrayObject* input = PyArray_FromArray((PyArrayObject*)inputOb, PyArray_DescrFromType(NPY_INT8), 
-		NPY_ARRAY_C_CONTIGUOUS | NPY_ARRAY_ALIGNED | 
-		NPY_ARRAY_WRITEABLE | NPY_ARRAY_FORCECAST);
-	//printf("Input converted to numpy array\n");
-	
-	if (input == NULL) {
-		PyErr_SetString(PyExc_TypeError, "Unable to convert input to numpy array");
+	PyArrayObject* input = (PyArrayObject*)inputOb;
+	if (PyArray_ITEMSIZE(input) == 1 && (PyArray_ISINTEGER(input) || PyArray_ISBOOL(input))) {
+		// one byte boards are hashed in place, whatever their strides
+		Py_INCREF(input);
+	}
+	else {
+		input = (PyArrayObject*)PyArray_FromArray(input, PyArray_DescrFromType(NPY_INT8),
+			NPY_ARRAY_ALIGNED | NPY_ARRAY_FORCECAST);
+		if (input == NULL) {
+			return NULL;
+		}
+	}
+	if (PyArray_NDIM(input) != 2) {
+		Py_DECREF(input);
+		PyErr_SetString(PyExc_TypeError, "Input must be a 2D array");
+		return NULL;
+	}
+	// npy_intp isn't long long everywhere
+	long long dims[2] = {PyArray_DIM(input, 0), PyArray_DIM(input, 1)};
+	long long strides[2] = {PyArray_STRIDE(input, 0), PyArray_STRIDE(input, 1)};
+	uint64_t hash;
+	Py_BEGIN_ALLOW_THREADS
+	hash = board_hash((int8_t*)PyArray_DATA(input), dims, strides, &config);
+	Py_END_ALLOW_THREADS
+	Py_DECREF(input);
+	return PyLong_FromUnsignedLongLong(hash);
+}
+
+
+static PyObject* GOL_set_thread_count(PyObject* self, PyObject* args) {
+	int thread_count = 0;
+	if (!PyArg_ParseTuple(args, "|i", &thread_count)) {
+		return NULL;
+	}
+	struct thread_pool* pool = default_thread_pool();
+	if (pool == NULL) {
+		PyErr_SetString(PyExc_MemoryError, "Could not create the thread pool");
+		return NULL;
+	}
+	int err;
+	Py_BEGIN_ALLOW_THREADS
+	err = thread_pool_resize(pool, thread_count);
+	Py_END_ALLOW_THREADS
+	if (err) {
+		PyErr_SetString(PyExc_MemoryError, "Could not allocate memory");
+		return NULL;
+	}
+	return PyLong_FromLong(thread_pool_size(pool));
+}
+
+
+static PyObject* GOL_get_thread_count(PyObject* self, PyObject* args) {
+	struct thread_pool* pool = default_thread_pool();
+	if (pool == NULL) {
+		PyErr_SetString(PyExc_MemoryError, "Could not create the thread pool");
+		return NULL;
+	}
+	return PyLong_FromLong(thread_pool_size(pool));
+}
+
+
+static PyArrayObject* byte_array_check(PyObject* ob, const char* name) {
+	// Checks that the object is a writeable C contiguous 2D array with one byte per cell
+	// The array is used as is, so changes are visible to the caller
+	if (!PyArray_Check(ob)) {
+		PyErr_Format(PyExc_TypeError, "%s must be a numpy array", name);
+		return NULL;
+	}
+	PyArrayObject* arr = (PyArrayObject*)ob;
+	if (PyArray_NDIM(arr) != 2 || PyArray_ITEMSIZE(arr) != 1 ||
+			!(PyArray_ISINTEGER(arr) || PyArray_ISBOOL(arr))) {
+		PyErr_Format(PyExc_TypeError, "%s must be a 2D array of uint8s", name);
+		return NULL;
+	}
+	if (!PyArray_IS_C_CONTIGUOUS(arr) || !PyArray_ISWRITEABLE(arr)) {
+		PyErr_Format(PyExc_ValueError, "%s must be C contiguous and writeable", name);
+		return NULL;
+	}
+	return arr;
+}
+
+
+static PyObject* GOL_step_tiled(PyObject* self, PyObject* args, PyObject* kwargs) {
+	static char* keywords[] = {"arr", "scratch", "active", "tile_size", "topology", "rule", NULL};
+	struct profile_timer timer;
+	profile_begin(&timer, PROFILE_STEP_TILED);
+	PyObject *inputOb, *scratchOb, *activeOb;
+	long long tile_size;
+	struct step_config config = STEP_CONFIG_DEFAULT;
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OOOL|$O&O&", keywords,
+			&inputOb, &scratchOb, &activeOb, &tile_size, topology_converter, &config.topology,
+			rule_converter, &config)) {
+		return NULL;
+	}
+	PyArrayObject* input = byte_array_check(inputOb, "Input");
+	PyArrayObject* scratch = input ? byte_array_check(scratchOb, "Scratch") : NULL;
+	PyArrayObject* active = scratch ? byte_array_check(activeOb, "Active") : NULL;
+	if (active == NULL) {
+		return NULL;
+	}
+	if (tile_size < 1) {
+		PyErr_SetString(PyExc_ValueError, "Tile size must be positive");
+		return NULL;
+	}
+	long long rows = PyArray_DIM(input, 0);
+	long long cols = PyArray_DIM(input, 1);
+	if (rows < 3 || cols < 3) {
+		PyErr_SetString(PyExc_ValueError, "Input must have at least 3 rows and 3 columns");
+		return NULL;
+	}
+	if (PyArray_DIM(scratch, 0) != rows || PyArray_DIM(scratch, 1) != cols) {
+		PyErr_SetString(PyExc_ValueError, "Scratch must have the same shape as the input");
+		return NULL;
+	}
+	if (PyArray_DIM(active, 0) != (rows + tile_size - 1) / tile_size ||
+			PyArray_DIM(active, 1) != (cols + tile_size - 1) / tile_size) {
+		PyErr_SetString(PyExc_ValueError, "Active must have one element per tile");
+		return NULL;
+	}
+	profile_lap(&timer, PROFILE_CHECK);
+	long long calculated;
+	Py_BEGIN_ALLOW_THREADS
+	calculated = step_tiled((int8_t*)PyArray_DATA(input), (int8_t*)PyArray_DATA(scratch),
+		(uint8_t*)PyArray_DATA(active), rows, cols, tile_size, &config);
+	Py_END_ALLOW_THREADS
+	profile_lap(&timer, PROFILE_NEXT_STEP);
+	profile_end(&timer);
+	if (calculated < 0) {
+		PyErr_SetString(PyExc_MemoryError, "Could not allocate memory");
+		return NULL;
+	}
+	return PyLong_FromLongLong(calculated);
+}
+
+
+static PyArrayObject* packed_board_check(PyObject* packedOb, long long height) {
+	// Checks that the object is a bit-packed board that holds `height` cells per row
+	if (!PyArray_Check(packedOb)) {
+		PyErr_SetString(PyExc_TypeError, "Packed board must be a numpy array");
+		return NULL;
+	}
+	PyArrayObject* packed = (PyArrayObject*)packedOb;
+	if (PyArray_NDIM(packed) != 2 || PyArray_TYPE(packed) != NPY_UINT64) {
+		PyErr_SetString(PyExc_TypeError, "Packed board must be a 2D array of uint64s");
 		return NULL;
 	}
-	//printf("Input converted and checked\n");
+	if (!PyArray_IS_C_CONTIGUOUS(packed)) {
+		PyErr_SetString(PyExc_ValueError, "Packed board must be C contiguous");
+		return NULL;
+	}
+	if (height <= 0 || packed_words(height) != PyArray_DIM(packed, 1)) {
+		PyErr_SetString(PyExc_ValueError, "Height does not match the amount of words per row");
+		return NULL;
+	}
+	return packed;
+}
+
 
-	// Check that input is a 2D array of uint8s
+static PyObject* GOL_pack_NpArr(PyObject* self, PyObject* args) {
+	PyObject* inputOb;
+	if (!PyArg_ParseTuple(args, "O", &inputOb)) {
+		return NULL;
+	}
+	PyArrayObject* input = (PyArrayObject*)PyArray_FROM_OTF(inputOb, NPY_UINT8,
+		NPY_ARRAY_C_CONTIGUOUS | NPY_ARRAY_ALIGNED | NPY_ARRAY_FORCECAST);
+	if (input == NULL) {
+		return NULL;
+	}
 	if (PyArray_NDIM(input) != 2) {
+		Py_DECREF(input);
 		PyErr_SetString(PyExc_TypeError, "Input must be a 2D array");
 		return NULL;
 	}
-	if (PyArray_TYPE(input) != NPY_INT8) {
-		PyErr_SetString(PyExc_TypeError, "Input must be a 2D array of uint8s");
+	npy_intp* dims = PyArray_DIMS(input);
+	npy_intp packed_dims[2] = {dims[0], packed_words(dims[1])};
+	PyArrayObject* packed = (PyArrayObject*)PyArray_SimpleNew(2, packed_dims, NPY_UINT64);
+	if (packed == NULL) {
+		Py_DECREF(input);
+		return NULL;
+	}
+	pack_board((uint8_t*)PyArray_DATA(input), dims[0], dims[1], PyArray_STRIDE(input, 0),
+		(uint64_t*)PyArray_DATA(packed));
+	Py_DECREF(input);
+	return (PyObject*)packed;
+}
+
+
+static PyObject* GOL_unpack_NpArr(PyObject* self, PyObject* args) {
+	PyObject* packedOb;
+	long long height;
+	if (!PyArg_ParseTuple(args, "OL", &packedOb, &height)) {
+		return NULL;
+	}
+	PyArrayObject* packed = packed_board_check(packedOb, height);
+	if (packed == NULL) {
+		return NULL;
+	}
+	npy_intp dims[2] = {PyArray_DIM(packed, 0), height};
+	PyArrayObject* output = (PyArrayObject*)PyArray_SimpleNew(2, dims, NPY_UINT8);
+	if (output == NULL) {
+		return NULL;
+	}
+	unpack_board((uint64_t*)PyArray_DATA(packed), dims[0], dims[1], (uint8_t*)PyArray_DATA(output));
+	return (PyObject*)output;
+}
+
+
+static PyObject* GOL_step_packed(PyObject* self, PyObject* args, PyObject* kwargs) {
+	static char* keywords[] = {"packed", "height", "topology", "rule", NULL};
+	struct profile_timer timer;
+	profile_begin(&timer, PROFILE_STEP_PACKED);
+	PyObject* packedOb;
+	long long height;
+	struct step_config config = STEP_CONFIG_DEFAULT;
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OL|$O&O&", keywords,
+			&packedOb, &height, topology_converter, &config.topology, rule_converter, &config)) {
+		return NULL;
+	}
+	PyArrayObject* packed = packed_board_check(packedOb, height);
+	if (packed == NULL) {
+		return NULL;
+	}
+	if (!PyArray_ISWRITEABLE(packed)) {
+		PyErr_SetString(PyExc_ValueError, "Packed board must be writeable");
 		return NULL;
 	}
-	if (PyArray_DIM(input, 0) < 3) {
+	if (PyArray_DIM(packed, 0) < 3) {
 		PyErr_SetString(PyExc_ValueError, "Input must have at least 3 rows");
 		return NULL;
 	}
-	if (PyArray_DIM(input, 1) < 3) {
+	if (height < 3) {
 		PyErr_SetString(PyExc_ValueError, "Input must have at least 3 columns");
 		return NULL;
 	}
+	profile_lap(&timer, PROFILE_CHECK);
+	int err;
+	Py_BEGIN_ALLOW_THREADS
+	err = step_packed_board((uint64_t*)PyArray_DATA(packed), PyArray_DIM(packed, 0), height, &config);
+	Py_END_ALLOW_THREADS
+	profile_lap(&timer, PROFILE_NEXT_STEP);
+	profile_end(&timer);
+	if (err) {
+		PyErr_SetString(PyExc_MemoryError, "Could not allocate memory");
+		return NULL;
+	}
+	Py_INCREF(packed);
+	return (PyObject*)packed;
+}
 
-	uint8_t* arr = (uint8_t*)PyArray_DATA(input);
-	npy_intp* dims = PyArray_DIMS(input);
+static PyObject* GOL_set_profiling(PyObject* self, PyObject* args) {
+	int enabled;
+	if (!PyArg_ParseTuple(args, "p", &enabled)) {
+		return NULL;
+	}
+	return PyBool_FromLong(profile_set_enabled(enabled));
+}
 
-	// Get the strides of the input array
-	npy_intp* strides = PyArray_STRIDES(input);
-	
-	calculate_next_step(arr, dims, strides);
-	Py_DECREF(inputOb);
-	//Py_DECREF(input);
-	return input;
-	
+
+static PyObject* GOL_get_profile(PyObject* self, PyObject* args) {
+	return profile_to_dict();
+}
+
+
+static PyObject* GOL_reset_profile(PyObject* self, PyObject* args) {
+	profile_reset();
+	Py_RETURN_NONE;
+}
+
+static PyObject* GOL_set_simd(PyObject* self, PyObject* args) {
+	const char* name;
+	if (!PyArg_ParseTuple(args, "s", &name)) {
+		return NULL;
+	}
+	enum simd_variant previous = simd_selected();
+	for (int variant = 0; variant < SIMD_VARIANT_COUNT; variant++) {
+		if (strcmp(name, simd_variant_name((enum simd_variant)variant)) == 0) {
+			if (!simd_select((enum simd_variant)variant)) {
+				PyErr_Format(PyExc_ValueError, "The CPU does not support the %s kernels", name);
+				return NULL;
+			}
+			return PyUnicode_FromString(simd_variant_name(previous));
+		}
+	}
+	PyErr_Format(PyExc_ValueError, "Unknown SIMD variant: %s", name);
+	return NULL;
+}
+
+
+static PyObject* GOL_get_simd(PyObject* self, PyObject* args) {
+	return PyUnicode_FromString(simd_variant_name(simd_selected()));
+}
+
+
+static PyObject* GOL_simd_variants(PyObject* self, PyObject* args) {
+	PyObject* variants = PyList_New(0);
+	if (variants == NULL) {
+		return NULL;
+	}
+	for (int variant = 0; variant < SIMD_VARIANT_COUNT; variant++) {
+		if (!simd_supported((enum simd_variant)variant)) {
+			continue;
+		}
+		PyObject* name = PyUnicode_FromString(simd_variant_name((enum simd_variant)variant));
+		if (name == NULL || PyList_Append(variants, name) < 0) {
+			Py_XDECREF(name);
+			Py_DECREF(variants);
+			return NULL;
+		}
+		Py_DECREF(name);
+	}
+	return variants;
 }
 
 static PyMethodDef GOL_methods[] = {
 	{"init", GOL_init, METH_NOARGS, "Initialize GOL module"},
-	{"step_NpArr", GOL_step_NpArr, METH_VARARGS, "Run one step of the simulation using numpy arrays"},
-	{"step_list_multithread", GOL_step_list_multithread, METH_VARARGS, "Run one step of the simulation using lists and multithreading"},
+	{"step_NpArr", (PyCFunction)(void(*)(void))GOL_step_NpArr, METH_VARARGS | METH_KEYWORDS, "Run one step of the simulation using numpy arrays"},
+	{"step_list_multithread", (PyCFunction)(void(*)(void))GOL_step_list_multithread, METH_VARARGS | METH_KEYWORDS, "Run one step of the simulation using lists and multithreading"},
+	{"step_NpArr_multithread", (PyCFunction)(void(*)(void))GOL_step_NpArr_multithread, METH_VARARGS | METH_KEYWORDS, "Run one step of the simulation using numpy arrays and multithreading"},
+	{"step_n", (PyCFunction)(void(*)(void))GOL_step_n, METH_VARARGS | METH_KEYWORDS, "Run n steps of the simulation using numpy arrays without returning to python"},
+	{"step_tiled", (PyCFunction)(void(*)(void))GOL_step_tiled, METH_VARARGS | METH_KEYWORDS, "Run one step of the simulation, only calculating the tiles that can change"},
+	{"board_hash", (PyCFunction)(void(*)(void))GOL_board_hash, METH_VARARGS | METH_KEYWORDS, "Hash of the cells of a board that are stepped"},
+	{"set_thread_count", GOL_set_thread_count, METH_VARARGS, "Set the amount of threads used by the multithreaded functions, 0 uses one per core"},
+	{"get_thread_count", GOL_get_thread_count, METH_NOARGS, "Get the amount of threads used by the multithreaded functions"},
+	{"pack_NpArr", GOL_pack_NpArr, METH_VARARGS, "Pack a 2D numpy array into a bit-packed board of uint64 words"},
+	{"unpack_NpArr", GOL_unpack_NpArr, METH_VARARGS, "Unpack a bit-packed board into a 2D uint8 numpy array"},
+	{"step_packed", (PyCFunction)(void(*)(void))GOL_step_packed, METH_VARARGS | METH_KEYWORDS, "Run one step of the simulation on a bit-packed board"},
+	{"set_profiling", GOL_set_profiling, METH_VARARGS, "Enable or disable the profiling of the step functions, returns the previous state"},
+	{"get_profile", GOL_get_profile, METH_NOARGS, "Get the wall clock time and calls of every phase of the profiled step functions"},
+	{"reset_profile", GOL_reset_profile, METH_NOARGS, "Reset the profile of the step functions"},
+	{"set_simd", GOL_set_simd, METH_VARARGS, "Force the SIMD kernels of the step functions, returns the previous variant"},
+	{"get_simd", GOL_get_simd, METH_NOARGS, "Get the SIMD kernels used by the step functions"},
+	{"simd_variants", GOL_simd_variants, METH_NOARGS, "Get the SIMD kernels the CPU supports"},
 	// Add more methods here if needed
 	{NULL, NULL, 0, NULL} // Sentinel
 };
@@ -89,5 +397,17 @@ PyMODINIT_FUNC PyInit_core(void) {
 		return NULL;
 	}
 	import_array();
+	// the best kernels of the CPU the module is imported on
+	simd_init();
+	if (PyType_Ready(&StepperType) < 0) {
+		Py_DECREF(module);
+		return NULL;
+	}
+	Py_INCREF(&StepperType);
+	if (PyModule_AddObject(module, "Stepper", (PyObject*)&StepperType) < 0) {
+		Py_DECREF(&StepperType);
+		Py_DECREF(module);
+		return NULL;
+	}
 	return module;
 }
@@ -0,0 +1,138 @@
+#include "profile.h"
+
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <time.h>
+#endif
+
+struct profile_totals {
+	double seconds;
+	long long calls;
+	double phase_seconds[PROFILE_PHASE_COUNT];
+	long long phase_calls[PROFILE_PHASE_COUNT];
+};
+
+static const char* backend_names[PROFILE_BACKEND_COUNT] = {
+	"step_NpArr", "step_NpArr_multithread", "step_n", "step_list_multithread", "step_tiled", "step_packed",
+	"Stepper.step", "Stepper.step_n"
+};
+static const char* phase_names[PROFILE_PHASE_COUNT] = {
+	"check", "copy_in", "partial_sum", "next_step", "copy_out"
+};
+
+// only changed while holding the GIL
+static int profiling_enabled = 0;
+static struct profile_totals totals[PROFILE_BACKEND_COUNT];
+
+
+double profile_clock(void) {
+#ifdef _WIN32
+	static LARGE_INTEGER frequency = {0};
+	LARGE_INTEGER counter;
+	if (frequency.QuadPart == 0) {
+		QueryPerformanceFrequency(&frequency);
+	}
+	QueryPerformanceCounter(&counter);
+	return (double)counter.QuadPart / (double)frequency.QuadPart;
+#else
+	struct timespec now;
+	clock_gettime(CLOCK_MONOTONIC, &now);
+	return (double)now.tv_sec + (double)now.tv_nsec * 1e-9;
+#endif
+}
+
+
+void profile_begin(struct profile_timer* timer, enum profile_backend backend) {
+	timer->enabled = profiling_enabled;
+	if (!timer->enabled) {
+		return;
+	}
+	timer->backend = backend;
+	for (int i = 0; i < PROFILE_PHASE_COUNT; i++) {
+		timer->seconds[i] = 0;
+		timer->calls[i] = 0;
+	}
+	timer->start = timer->last = profile_clock();
+}
+
+
+void profile_end(struct profile_timer* timer) {
+	if (!timer->enabled) {
+		return;
+	}
+	struct profile_totals* total = &totals[timer->backend];
+	total->seconds += profile_clock() - timer->start;
+	total->calls++;
+	for (int i = 0; i < PROFILE_PHASE_COUNT; i++) {
+		total->phase_seconds[i] += timer->seconds[i];
+		total->phase_calls[i] += timer->calls[i];
+	}
+}
+
+
+int profile_set_enabled(int enabled) {
+	int previous = profiling_enabled;
+	profiling_enabled = enabled;
+	return previous;
+}
+
+
+void profile_reset(void) {
+	memset(totals, 0, sizeof(totals));
+}
+
+
+static int set_item(PyObject* dict, const char* key, PyObject* value) {
+	// Steals the reference to value
+	if (value == NULL) {
+		return -1;
+	}
+	int err = PyDict_SetItemString(dict, key, value);
+	Py_DECREF(value);
+	return err;
+}
+
+
+static PyObject* timing_dict(double seconds, long long calls) {
+	return Py_BuildValue("{sdsL}", "seconds", seconds, "calls", calls);
+}
+
+
+PyObject* profile_to_dict(void) {
+	// {backend: {"seconds": s, "calls": n, "phases": {phase: {"seconds": s, "calls": n}}}}
+	PyObject* result = PyDict_New();
+	if (result == NULL) {
+		return NULL;
+	}
+	for (int backend = 0; backend < PROFILE_BACKEND_COUNT; backend++) {
+		struct profile_totals* total = &totals[backend];
+		if (total->calls == 0) {
+			continue;
+		}
+		// the entry is borrowed from result once it is set
+		PyObject* entry = timing_dict(total->seconds, total->calls);
+		if (set_item(result, backend_names[backend], entry) < 0) {
+			Py_DECREF(result);
+			return NULL;
+		}
+		PyObject* phases = PyDict_New();
+		if (phases == NULL) {
+			Py_DECREF(result);
+			return NULL;
+		}
+		for (int phase = 0; phase < PROFILE_PHASE_COUNT; phase++) {
+			if (total->phase_calls[phase] > 0 && set_item(phases, phase_names[phase],
+					timing_dict(total->phase_seconds[phase], total->phase_calls[phase])) < 0) {
+				Py_DECREF(phases);
+				Py_DECREF(result);
+				return NULL;
+			}
+		}
+		if (set_item(entry, "phases", phases) < 0) {
+			Py_DECREF(result);
+			return NULL;
+		}
+	}
+	return result;
+}
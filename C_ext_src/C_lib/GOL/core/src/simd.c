@@ -0,0 +1,407 @@
+#include <string.h>
+#include "simd.h"
+
+#if defined(__x86_64__) || defined(_M_X64) || defined(__i386__) || defined(_M_IX86)
+#define SIMD_X86 1
+#include <immintrin.h>
+#ifdef _MSC_VER
+#include <intrin.h>
+#endif
+#endif
+
+#if defined(__GNUC__) || defined(__clang__)
+// every variant is compiled for its own instruction set, so no compiler flags are needed
+#define SIMD_TARGET(isa) __attribute__((target(isa)))
+#else
+// MSVC compiles the intrinsics of every instruction set without flags
+#define SIMD_TARGET(isa)
+#endif
+
+
+static inline int popcount64(uint64_t x) {
+#if defined(__GNUC__) || defined(__clang__)
+	return __builtin_popcountll(x);
+#else
+	x = x - ((x >> 1) & 0x5555555555555555ULL);
+	x = (x & 0x3333333333333333ULL) + ((x >> 2) & 0x3333333333333333ULL);
+	x = (x + (x >> 4)) & 0x0F0F0F0F0F0F0F0FULL;
+	return (int)((x * 0x0101010101010101ULL) >> 56);
+#endif
+}
+
+
+void simd_rule_init(const struct step_config* config, struct simd_rule* rule) {
+	rule_table(config, rule->table);
+	rule->birth_count = 0;
+	rule->survive_count = 0;
+	for (int n = 0; n <= 8; n++) {
+		if (config->birth >> n & 1) {
+			rule->birth[rule->birth_count++] = (int8_t)n;
+		}
+		if (config->survive >> n & 1) {
+			rule->survive[rule->survive_count++] = (int8_t)n;
+		}
+	}
+}
+
+
+static void sum_row_scalar(const int8_t* row, int8_t* partial, long long start, long long end) {
+	// the compiler vectorizes this loop for the instruction set the module is built for
+	for (long long j = start; j < end; j++) {
+		partial[j] = row[j - 1] + row[j] + row[j + 1];
+	}
+}
+
+
+// The portable kernel works on 8 cells at once in a uint64_t (SWAR),
+// the byte operations never carry into the next byte, so every cell value gives the same result
+// as the vector kernels
+#define BYTES_01 0x0101010101010101ULL
+#define BYTES_7F 0x7F7F7F7F7F7F7F7FULL
+#define BYTES_80 0x8080808080808080ULL
+
+static inline uint64_t load_word(const int8_t* bytes) {
+	uint64_t word;
+	memcpy(&word, bytes, sizeof(word));
+	return word;
+}
+
+static inline uint64_t add_bytes(uint64_t a, uint64_t b) {
+	return ((a & BYTES_7F) + (b & BYTES_7F)) ^ ((a ^ b) & BYTES_80);
+}
+
+static inline uint64_t sub_bytes(uint64_t a, uint64_t b) {
+	return ((a | BYTES_80) - (b & BYTES_7F)) ^ ((a ^ ~b) & BYTES_80);
+}
+
+static inline uint64_t nonzero_bytes(uint64_t x) {
+	// 0x80 in every byte of x that isn't 0
+	return (((x & BYTES_7F) + BYTES_7F) | x) & BYTES_80;
+}
+
+static inline uint64_t equal_bytes(uint64_t x, int8_t n) {
+	// 0x01 in every byte of x that equals n
+	return (~nonzero_bytes(x ^ (BYTES_01 * (uint8_t)n)) & BYTES_80) >> 7;
+}
+
+
+static long long rule_row_scalar(
+		const int8_t* up, const int8_t* mid, const int8_t* down, const int8_t* src, int8_t* dst,
+		long long count, const struct simd_rule* rule) {
+	long long flips = 0;
+	long long j = 0;
+	for (; j + 8 <= count; j += 8) {
+		uint64_t cell = load_word(src + j);
+		uint64_t n = sub_bytes(add_bytes(add_bytes(load_word(up + j), load_word(mid + j)), load_word(down + j)), cell);
+		uint64_t born = 0;
+		uint64_t survived = 0;
+		for (int k = 0; k < rule->birth_count; k++) {
+			born |= equal_bytes(n, rule->birth[k]);
+		}
+		for (int k = 0; k < rule->survive_count; k++) {
+			survived |= equal_bytes(n, rule->survive[k]);
+		}
+		uint64_t alive = equal_bytes(cell, 1);
+		uint64_t next = (born & ~alive) | (survived & alive);
+		memcpy(dst + j, &next, sizeof(next));
+		flips += popcount64(nonzero_bytes(next ^ cell));
+	}
+	// the last cells of this and the vector kernels
+	const int8_t* table = rule->table;
+	for (; j < count; j++) {
+		int8_t cell = src[j];
+		int8_t n = up[j] + mid[j] + down[j] - cell;
+		// counts outside of 0-8 only happen if the board holds values other than 0 and 1
+		int8_t next = (uint8_t)n <= 8 ? table[(cell == 1) * 9 + n] : 0;
+		dst[j] = next;
+		flips += next != cell;
+	}
+	return flips;
+}
+
+
+#ifdef SIMD_X86
+
+SIMD_TARGET("sse2")
+static void sum_row_sse2(const int8_t* row, int8_t* partial, long long start, long long end) {
+	if (end - start < 16) {
+		sum_row_scalar(row, partial, start, end);
+		return;
+	}
+	// the last vector overlaps the one before it, the sums are written to another buffer than the row
+	for (long long j = start; j < end; j += 16) {
+		if (j > end - 16) {
+			j = end - 16;
+		}
+		__m128i left = _mm_loadu_si128((const __m128i*)(row + j - 1));
+		__m128i center = _mm_loadu_si128((const __m128i*)(row + j));
+		__m128i right = _mm_loadu_si128((const __m128i*)(row + j + 1));
+		_mm_storeu_si128((__m128i*)(partial + j), _mm_add_epi8(_mm_add_epi8(left, center), right));
+	}
+}
+
+
+SIMD_TARGET("sse2")
+static long long rule_row_sse2(
+		const int8_t* up, const int8_t* mid, const int8_t* down, const int8_t* src, int8_t* dst,
+		long long count, const struct simd_rule* rule) {
+	// the counts are broadcast once, in locals that the stores to dst can't alias
+	__m128i birth[9], survive[9];
+	int birth_count = rule->birth_count, survive_count = rule->survive_count;
+	for (int k = 0; k < birth_count; k++) {
+		birth[k] = _mm_set1_epi8(rule->birth[k]);
+	}
+	for (int k = 0; k < survive_count; k++) {
+		survive[k] = _mm_set1_epi8(rule->survive[k]);
+	}
+	const __m128i one = _mm_set1_epi8(1);
+	long long flips = 0;
+	long long j = 0;
+	for (; j + 16 <= count; j += 16) {
+		__m128i cell = _mm_loadu_si128((const __m128i*)(src + j));
+		__m128i n = _mm_sub_epi8(_mm_add_epi8(_mm_add_epi8(
+			_mm_loadu_si128((const __m128i*)(up + j)),
+			_mm_loadu_si128((const __m128i*)(mid + j))),
+			_mm_loadu_si128((const __m128i*)(down + j))), cell);
+		__m128i born = _mm_setzero_si128();
+		__m128i survived = _mm_setzero_si128();
+		for (int k = 0; k < birth_count; k++) {
+			born = _mm_or_si128(born, _mm_cmpeq_epi8(n, birth[k]));
+		}
+		for (int k = 0; k < survive_count; k++) {
+			survived = _mm_or_si128(survived, _mm_cmpeq_epi8(n, survive[k]));
+		}
+		__m128i alive = _mm_cmpeq_epi8(cell, one);
+		__m128i next = _mm_and_si128(_mm_or_si128(_mm_andnot_si128(alive, born), _mm_and_si128(alive, survived)), one);
+		_mm_storeu_si128((__m128i*)(dst + j), next);
+		flips += popcount64((uint32_t)_mm_movemask_epi8(_mm_cmpeq_epi8(next, cell)) ^ 0xFFFFu);
+	}
+	return flips + rule_row_scalar(up + j, mid + j, down + j, src + j, dst + j, count - j, rule);
+}
+
+
+SIMD_TARGET("avx2")
+static void sum_row_avx2(const int8_t* row, int8_t* partial, long long start, long long end) {
+	if (end - start < 32) {
+		sum_row_scalar(row, partial, start, end);
+		return;
+	}
+	for (long long j = start; j < end; j += 32) {
+		if (j > end - 32) {
+			j = end - 32;
+		}
+		__m256i left = _mm256_loadu_si256((const __m256i*)(row + j - 1));
+		__m256i center = _mm256_loadu_si256((const __m256i*)(row + j));
+		__m256i right = _mm256_loadu_si256((const __m256i*)(row + j + 1));
+		_mm256_storeu_si256((__m256i*)(partial + j), _mm256_add_epi8(_mm256_add_epi8(left, center), right));
+	}
+}
+
+
+SIMD_TARGET("avx2")
+static long long rule_row_avx2(
+		const int8_t* up, const int8_t* mid, const int8_t* down, const int8_t* src, int8_t* dst,
+		long long count, const struct simd_rule* rule) {
+	__m256i birth[9], survive[9];
+	int birth_count = rule->birth_count, survive_count = rule->survive_count;
+	for (int k = 0; k < birth_count; k++) {
+		birth[k] = _mm256_set1_epi8(rule->birth[k]);
+	}
+	for (int k = 0; k < survive_count; k++) {
+		survive[k] = _mm256_set1_epi8(rule->survive[k]);
+	}
+	const __m256i one = _mm256_set1_epi8(1);
+	long long flips = 0;
+	long long j = 0;
+	for (; j + 32 <= count; j += 32) {
+		__m256i cell = _mm256_loadu_si256((const __m256i*)(src + j));
+		__m256i n = _mm256_sub_epi8(_mm256_add_epi8(_mm256_add_epi8(
+			_mm256_loadu_si256((const __m256i*)(up + j)),
+			_mm256_loadu_si256((const __m256i*)(mid + j))),
+			_mm256_loadu_si256((const __m256i*)(down + j))), cell);
+		__m256i born = _mm256_setzero_si256();
+		__m256i survived = _mm256_setzero_si256();
+		for (int k = 0; k < birth_count; k++) {
+			born = _mm256_or_si256(born, _mm256_cmpeq_epi8(n, birth[k]));
+		}
+		for (int k = 0; k < survive_count; k++) {
+			survived = _mm256_or_si256(survived, _mm256_cmpeq_epi8(n, survive[k]));
+		}
+		__m256i alive = _mm256_cmpeq_epi8(cell, one);
+		__m256i next = _mm256_and_si256(
+			_mm256_or_si256(_mm256_andnot_si256(alive, born), _mm256_and_si256(alive, survived)), one);
+		_mm256_storeu_si256((__m256i*)(dst + j), next);
+		flips += popcount64(~(uint32_t)_mm256_movemask_epi8(_mm256_cmpeq_epi8(next, cell)) & 0xFFFFFFFFu);
+	}
+	return flips + rule_row_sse2(up + j, mid + j, down + j, src + j, dst + j, count - j, rule);
+}
+
+
+SIMD_TARGET("avx512f,avx512bw")
+static void sum_row_avx512(const int8_t* row, int8_t* partial, long long start, long long end) {
+	if (end - start < 64) {
+		sum_row_scalar(row, partial, start, end);
+		return;
+	}
+	for (long long j = start; j < end; j += 64) {
+		if (j > end - 64) {
+			j = end - 64;
+		}
+		__m512i left = _mm512_loadu_si512((const void*)(row + j - 1));
+		__m512i center = _mm512_loadu_si512((const void*)(row + j));
+		__m512i right = _mm512_loadu_si512((const void*)(row + j + 1));
+		_mm512_storeu_si512((void*)(partial + j), _mm512_add_epi8(_mm512_add_epi8(left, center), right));
+	}
+}
+
+
+SIMD_TARGET("avx512f,avx512bw")
+static long long rule_row_avx512(
+		const int8_t* up, const int8_t* mid, const int8_t* down, const int8_t* src, int8_t* dst,
+		long long count, const struct simd_rule* rule) {
+	__m512i birth[9], survive[9];
+	int birth_count = rule->birth_count, survive_count = rule->survive_count;
+	for (int k = 0; k < birth_count; k++) {
+		birth[k] = _mm512_set1_epi8(rule->birth[k]);
+	}
+	for (int k = 0; k < survive_count; k++) {
+		survive[k] = _mm512_set1_epi8(rule->survive[k]);
+	}
+	const __m512i one = _mm512_set1_epi8(1);
+	long long flips = 0;
+	for (long long j = 0; j < count; j += 64) {
+		// the last cells are loaded and stored with a mask, the cells past count are never touched
+		__mmask64 lanes = count - j >= 64 ? ~(__mmask64)0 : ((__mmask64)1 << (count - j)) - 1;
+		__m512i cell = _mm512_maskz_loadu_epi8(lanes, src + j);
+		__m512i n = _mm512_sub_epi8(_mm512_add_epi8(_mm512_add_epi8(
+			_mm512_maskz_loadu_epi8(lanes, up + j),
+			_mm512_maskz_loadu_epi8(lanes, mid + j)),
+			_mm512_maskz_loadu_epi8(lanes, down + j)), cell);
+		// the comparisons give bit masks, one bit per cell
+		__mmask64 born = 0;
+		__mmask64 survived = 0;
+		for (int k = 0; k < birth_count; k++) {
+			born |= _mm512_cmpeq_epi8_mask(n, birth[k]);
+		}
+		for (int k = 0; k < survive_count; k++) {
+			survived |= _mm512_cmpeq_epi8_mask(n, survive[k]);
+		}
+		__mmask64 alive = _mm512_cmpeq_epi8_mask(cell, one);
+		__m512i next = _mm512_maskz_mov_epi8((born & ~alive) | (survived & alive), one);
+		_mm512_mask_storeu_epi8(dst + j, lanes, next);
+		flips += popcount64(_mm512_mask_cmpneq_epi8_mask(lanes, next, cell));
+	}
+	return flips;
+}
+
+#endif
+
+
+static const struct simd_kernels variants[SIMD_VARIANT_COUNT] = {
+	{"scalar", sum_row_scalar, rule_row_scalar},
+#ifdef SIMD_X86
+	{"sse2", sum_row_sse2, rule_row_sse2},
+	{"avx2", sum_row_avx2, rule_row_avx2},
+	{"avx512", sum_row_avx512, rule_row_avx512},
+#else
+	{"sse2", NULL, NULL},
+	{"avx2", NULL, NULL},
+	{"avx512", NULL, NULL},
+#endif
+};
+
+// changed while holding the GIL, a step that is running keeps the kernels it started with
+static enum simd_variant selected = SIMD_SCALAR;
+
+
+#if defined(SIMD_X86) && defined(_MSC_VER)
+static int os_saves(unsigned long long state) {
+	// whether the OS saves the given XSAVE state components, so the registers can be used
+	int info[4];
+	__cpuid(info, 1);
+	if (!(info[2] & (1 << 27))) {
+		return 0;
+	}
+	return (_xgetbv(0) & state) == state;
+}
+#endif
+
+
+int simd_supported(enum simd_variant variant) {
+	if (variant == SIMD_SCALAR) {
+		return 1;
+	}
+#if defined(SIMD_X86) && (defined(__GNUC__) || defined(__clang__))
+	// the builtins check the support of the OS as well
+	__builtin_cpu_init();
+	switch (variant) {
+	case SIMD_SSE2:
+		return __builtin_cpu_supports("sse2");
+	case SIMD_AVX2:
+		return __builtin_cpu_supports("avx2");
+	case SIMD_AVX512:
+		return __builtin_cpu_supports("avx512f") && __builtin_cpu_supports("avx512bw");
+	default:
+		return 0;
+	}
+#elif defined(SIMD_X86) && defined(_MSC_VER)
+	int info[4];
+	__cpuid(info, 0);
+	int max_leaf = info[0];
+	switch (variant) {
+	case SIMD_SSE2:
+		__cpuid(info, 1);
+		return (info[3] >> 26) & 1;
+	case SIMD_AVX2:
+		if (max_leaf < 7 || !os_saves(0x6)) {
+			return 0;
+		}
+		__cpuidex(info, 7, 0);
+		return (info[1] >> 5) & 1;
+	case SIMD_AVX512:
+		if (max_leaf < 7 || !os_saves(0xE6)) {
+			return 0;
+		}
+		__cpuidex(info, 7, 0);
+		return ((info[1] >> 16) & 1) && ((info[1] >> 30) & 1);
+	default:
+		return 0;
+	}
+#else
+	return 0;
+#endif
+}
+
+
+const struct simd_kernels* simd_kernels(void) {
+	return &variants[selected];
+}
+
+
+enum simd_variant simd_selected(void) {
+	return selected;
+}
+
+
+const char* simd_variant_name(enum simd_variant variant) {
+	return variants[variant].name;
+}
+
+
+int simd_select(enum simd_variant variant) {
+	if (variant < 0 || variant >= SIMD_VARIANT_COUNT || !simd_supported(variant)) {
+		return 0;
+	}
+	selected = variant;
+	return 1;
+}
+
+
+void simd_init(void) {
+	for (int variant = SIMD_VARIANT_COUNT - 1; variant > SIMD_SCALAR; variant--) {
+		if (simd_select((enum simd_variant)variant)) {
+			return;
+		}
+	}
+	selected = SIMD_SCALAR;
+}
@@ -0,0 +1,94 @@
+#include "step_config.h"
+
+
+void rule_table(const struct step_config* config, int8_t* table) {
+	for (int n = 0; n < 9; n++) {
+		table[n] = (int8_t)((config->birth >> n) & 1);
+		table[9 + n] = (int8_t)((config->survive >> n) & 1);
+	}
+}
+
+
+int is_conway(const struct step_config* config) {
+	return config->birth == RULE_CONWAY_BIRTH && config->survive == RULE_CONWAY_SURVIVE;
+}
+
+
+// Parses a rule in B/S notation like "B36/S23" into the birth and survive masks of the config
+// Returns 0 on success, -1 if the rule is invalid or not supported (B0)
+int parse_rule(const char* text, struct step_config* config) {
+	uint16_t birth = 0;
+	uint16_t survive = 0;
+	uint16_t* current = NULL;
+	int seen_birth = 0;
+	int seen_survive = 0;
+	for (const char* c = text; *c != '\0'; c++) {
+		if (*c == 'B' || *c == 'b') {
+			if (seen_birth) {
+				return -1;
+			}
+			seen_birth = 1;
+			current = &birth;
+		} else if (*c == 'S' || *c == 's') {
+			if (seen_survive) {
+				return -1;
+			}
+			seen_survive = 1;
+			current = &survive;
+		} else if (*c >= '0' && *c <= '8' && current != NULL) {
+			*current |= (uint16_t)(1 << (*c - '0'));
+		} else if (*c != '/' && *c != ' ') {
+			return -1;
+		}
+	}
+	// the dead background would come alive with B0
+	if (!seen_birth || !seen_survive || (birth & 1)) {
+		return -1;
+	}
+	config->birth = birth;
+	config->survive = survive;
+	return 0;
+}
+
+
+int topology_converter(PyObject* obj, void* topology) {
+	if (!PyUnicode_Check(obj)) {
+		PyErr_SetString(PyExc_TypeError, "Topology must be a string");
+		return 0;
+	}
+	if (PyUnicode_CompareWithASCIIString(obj, "bounded") == 0) {
+		*(enum topology*)topology = TOPOLOGY_BOUNDED;
+	} else if (PyUnicode_CompareWithASCIIString(obj, "torus") == 0) {
+		*(enum topology*)topology = TOPOLOGY_TORUS;
+	} else {
+		PyErr_SetString(PyExc_ValueError, "Topology must be 'bounded' or 'torus'");
+		return 0;
+	}
+	return 1;
+}
+
+
+int rule_converter(PyObject* obj, void* config) {
+	if (obj == Py_None) {
+		((struct step_config*)config)->birth = RULE_CONWAY_BIRTH;
+		((struct step_config*)config)->survive = RULE_CONWAY_SURVIVE;
+		return 1;
+	}
+	// rules.Rule objects convert to their B/S notation
+	PyObject* text = PyObject_Str(obj);
+	if (text == NULL) {
+		return 0;
+	}
+	const char* utf8 = PyUnicode_AsUTF8(text);
+	if (utf8 == NULL) {
+		Py_DECREF(text);
+		return 0;
+	}
+	if (parse_rule(utf8, (struct step_config*)config) != 0) {
+		PyErr_Format(PyExc_ValueError, "Invalid or unsupported rule: %s, rules must be in B/S notation without B0", utf8);
+		Py_DECREF(text);
+		return 0;
+	}
+	Py_DECREF(text);
+	return 1;
+}
@@ -0,0 +1,33 @@
+#include "step_stats.h"
+
+
+void step_stats_clear(struct step_stats* stats) {
+	stats->population = 0;
+	stats->births = 0;
+	stats->deaths = 0;
+	stats->x_min = -1;
+	stats->x_max = -1;
+	stats->y_min = -1;
+	stats->y_max = -1;
+}
+
+
+void step_stats_merge(struct step_stats* into, const struct step_stats* from) {
+	into->population += from->population;
+	into->births += from->births;
+	into->deaths += from->deaths;
+	if (from->x_min < 0) {
+		return;
+	}
+	if (into->x_min < 0) {
+		into->x_min = from->x_min;
+		into->x_max = from->x_max;
+		into->y_min = from->y_min;
+		into->y_max = from->y_max;
+		return;
+	}
+	into->x_min = from->x_min < into->x_min ? from->x_min : into->x_min;
+	into->x_max = from->x_max > into->x_max ? from->x_max : into->x_max;
+	into->y_min = from->y_min < into->y_min ? from->y_min : into->y_min;
+	into->y_max = from->y_max > into->y_max ? from->y_max : into->y_max;
+}
@@ -0,0 +1,555 @@
+#define PY_SSIZE_T_CLEAN
+// the numpy API is imported by core_main.c
+#define PY_ARRAY_UNIQUE_SYMBOL GOL_ARRAY_API
+#define NO_IMPORT_ARRAY
+#include <numpy/ndarrayobject.h>
+#include <pythread.h>
+#include "stepper.h"
+#include "array_operations.h"
+#include "board_buffer.h"
+#include "thread_pool.h"
+#include "step_config.h"
+#include "step_stats.h"
+
+// generations step_n runs at once while the stepper gathers their statistics itself
+#define STEPPER_STATS_BATCH 256
+// steppers kept for the module level step functions
+#define STEPPER_CACHE_SIZE 8
+
+struct stepper {
+	PyObject_HEAD
+	long long dims[2];
+	struct step_config config;
+	// scratch memory for the partial sums of the boards
+	struct partial_sum par;
+	int multithread;
+	// pool of this stepper, NULL if it uses the shared worker pool or runs on the calling thread
+	struct thread_pool* pool;
+	int collect_stats;
+	// statistics of the last generation, if the stepper gathers them and has run a step
+	struct step_stats stats;
+	int has_stats;
+	// statistics of the generations of a step_n batch, when they aren't written into an array
+	struct step_stats* batch_stats;
+	// held while stepping, so the scratch memory is only used by one thread at a time
+	PyThread_type_lock lock;
+};
+
+
+static struct stepper* stepper_create(PyTypeObject* type, const long long* dims, const struct step_config* config,
+		int multithread, int threads, int collect_stats) {
+	// Returns a new stepper or NULL with an exception set
+	struct stepper* self = (struct stepper*)type->tp_alloc(type, 0);
+	if (self == NULL) {
+		return NULL;
+	}
+	self->dims[0] = dims[0];
+	self->dims[1] = dims[1];
+	self->config = *config;
+	self->multithread = multithread || threads > 0;
+	self->collect_stats = collect_stats;
+	self->lock = PyThread_allocate_lock();
+	self->par = partial_sum_alloc(dims, config, threads > 0 ? threads : 1);
+	if (collect_stats) {
+		self->batch_stats = (struct step_stats*)malloc(STEPPER_STATS_BATCH * sizeof(struct step_stats));
+	}
+	if (self->lock == NULL || self->par.arr == NULL || (collect_stats && self->batch_stats == NULL)) {
+		Py_DECREF(self);
+		PyErr_SetString(PyExc_MemoryError, "Could not allocate memory");
+		return NULL;
+	}
+	if (threads > 0) {
+		self->pool = thread_pool_create(threads);
+		if (self->pool == NULL) {
+			Py_DECREF(self);
+			PyErr_SetString(PyExc_MemoryError, "Could not create the thread pool");
+			return NULL;
+		}
+	}
+	return self;
+}
+
+
+static int shape_converter(PyObject* obj, void* dims) {
+	// "O&" converter for a (rows, columns) board shape
+	PyObject* shape = PySequence_Tuple(obj);
+	if (shape == NULL) {
+		return 0;
+	}
+	int parsed = PyArg_ParseTuple(shape, "LL;shape must be (rows, columns)", &((long long*)dims)[0],
+		&((long long*)dims)[1]);
+	Py_DECREF(shape);
+	if (!parsed) {
+		return 0;
+	}
+	if (((long long*)dims)[0] < 3 || ((long long*)dims)[1] < 3) {
+		PyErr_SetString(PyExc_ValueError, "The board must have at least 3 rows and 3 columns");
+		return 0;
+	}
+	return 1;
+}
+
+
+static PyObject* stepper_new(PyTypeObject* type, PyObject* args, PyObject* kwargs) {
+	static char* keywords[] = {"shape", "topology", "rule", "multithread", "threads", "stats", NULL};
+	long long dims[2];
+	struct step_config config = STEP_CONFIG_DEFAULT;
+	int multithread = 0;
+	int threads = 0;
+	int collect_stats = 0;
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O&|$O&O&pip", keywords,
+			shape_converter, dims, topology_converter, &config.topology, rule_converter, &config,
+			&multithread, &threads, &collect_stats)) {
+		return NULL;
+	}
+	if (threads < 0) {
+		PyErr_SetString(PyExc_ValueError, "threads must not be negative");
+		return NULL;
+	}
+	return (PyObject*)stepper_create(type, dims, &config, multithread, threads, collect_stats);
+}
+
+
+static void stepper_dealloc(struct stepper* self) {
+	// nothing is stepping, every step holds a reference to the stepper
+	partial_sum_free(&self->par);
+	free(self->batch_stats);
+	if (self->pool != NULL) {
+		thread_pool_destroy(self->pool);
+	}
+	if (self->lock != NULL) {
+		PyThread_free_lock(self->lock);
+	}
+	Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+
+static void stepper_lock(struct stepper* self) {
+	// Waits for the lock without holding the GIL, so a step in another thread can finish
+	if (!PyThread_acquire_lock(self->lock, NOWAIT_LOCK)) {
+		Py_BEGIN_ALLOW_THREADS
+		PyThread_acquire_lock(self->lock, WAIT_LOCK);
+		Py_END_ALLOW_THREADS
+	}
+}
+
+
+static long long stepper_run(struct stepper* self, struct board_buffer* board, struct board_buffer* out,
+		long long n, int stop_when_stable, uint64_t* hashes, struct step_stats* stats, struct profile_timer* timer) {
+	// Runs up to n steps from board into out without the GIL, see calculate_n_steps
+	// Returns the amount of steps that were run, or -1 with an exception set
+	struct thread_pool* pool = self->pool;
+	if (self->multithread && pool == NULL) {
+		pool = default_thread_pool();
+		if (pool == NULL) {
+			PyErr_SetString(PyExc_MemoryError, "Could not create the thread pool");
+			return -1;
+		}
+	}
+	// without a stats array the stepper gathers the statistics in batches, only the last one is kept
+	int own_stats = stats == NULL && self->collect_stats;
+	long long generations = 0;
+	Py_BEGIN_ALLOW_THREADS
+	PyThread_acquire_lock(self->lock, WAIT_LOCK);
+	const int8_t* src = (int8_t*)board->view.buf;
+	int8_t* dst = (int8_t*)out->view.buf;
+	long long batch, run;
+	do {
+		batch = own_stats && n - generations > STEPPER_STATS_BATCH ? STEPPER_STATS_BATCH : n - generations;
+		struct step_stats* batch_stats = own_stats ? self->batch_stats : stats != NULL ? stats + generations : NULL;
+		run = calculate_n_steps(src, dst, board->dims, board->strides, &self->config, &self->par,
+			batch, stop_when_stable, pool, hashes != NULL ? hashes + generations : NULL, batch_stats, timer);
+		if (self->collect_stats && run > 0) {
+			self->stats = batch_stats[run - 1];
+			self->has_stats = 1;
+		}
+		generations += run;
+		src = dst;
+	} while (run == batch && generations < n);
+	PyThread_release_lock(self->lock);
+	Py_END_ALLOW_THREADS
+	return generations;
+}
+
+
+static int stats_array_check(PyObject* statsOb, long long count, struct step_stats** stats) {
+	// Checks the stats argument, a record array with the layout of struct step_stats (GOL.STATS_DTYPE)
+	// that has room for count generations. None leaves stats NULL.
+	// Returns 0 with an exception set if the array doesn't fit
+	*stats = NULL;
+	if (statsOb == Py_None) {
+		return 1;
+	}
+	if (!PyArray_Check(statsOb) || !PyDataType_HASFIELDS(PyArray_DESCR((PyArrayObject*)statsOb)) ||
+			PyArray_ITEMSIZE((PyArrayObject*)statsOb) != sizeof(struct step_stats) ||
+			PyArray_NDIM((PyArrayObject*)statsOb) != 1 ||
+			!PyArray_ISCARRAY((PyArrayObject*)statsOb)) {
+		PyErr_SetString(PyExc_TypeError, "Stats must be a writeable, contiguous 1D array of GOL.STATS_DTYPE");
+		return 0;
+	}
+	if (PyArray_DIM((PyArrayObject*)statsOb, 0) < count) {
+		PyErr_Format(PyExc_ValueError, "Stats must have room for %lld generations", count);
+		return 0;
+	}
+	*stats = (struct step_stats*)PyArray_DATA((PyArrayObject*)statsOb);
+	return 1;
+}
+
+
+static int hashes_array_check(PyObject* hashesOb, long long count, uint64_t** hashes) {
+	// Checks the hashes argument, a uint64 array with room for count hashes. None leaves hashes NULL.
+	// Returns 0 with an exception set if the array doesn't fit
+	*hashes = NULL;
+	if (hashesOb == Py_None) {
+		return 1;
+	}
+	if (!PyArray_Check(hashesOb) || PyArray_TYPE((PyArrayObject*)hashesOb) != NPY_UINT64 ||
+			PyArray_NDIM((PyArrayObject*)hashesOb) != 1 ||
+			!PyArray_ISCARRAY((PyArrayObject*)hashesOb)) {
+		PyErr_SetString(PyExc_TypeError, "Hashes must be a writeable, contiguous 1D array of uint64s");
+		return 0;
+	}
+	if (PyArray_DIM((PyArrayObject*)hashesOb, 0) < count) {
+		PyErr_SetString(PyExc_ValueError, "Hashes must have room for n hashes");
+		return 0;
+	}
+	*hashes = (uint64_t*)PyArray_DATA((PyArrayObject*)hashesOb);
+	return 1;
+}
+
+
+static PyObject* step_board(struct stepper* self, struct board_buffer* board, PyObject* outOb,
+		long long n, int stop_when_stable, int return_hash, uint64_t* hashes, struct step_stats* stats,
+		struct profile_timer* timer) {
+	// Steps the board n times into out and releases it, shared by all the step functions.
+	// n = -1 is a single step that returns the stepped board, and its hash with return_hash.
+	// Otherwise the stepped board and the amount of steps are returned
+	struct board_buffer out_storage;
+	struct board_buffer* out;
+	if (!board_out_get(outOb, board, &out, &out_storage)) {
+		board_buffer_release(board);
+		return NULL;
+	}
+	profile_lap(timer, PROFILE_COPY_IN);
+	uint64_t hash = 0;
+	long long generations = stepper_run(self, board, out, n < 0 ? 1 : n, stop_when_stable,
+		return_hash ? &hash : hashes, stats, timer);
+	PyObject* result = out->object;
+	Py_INCREF(result);
+	board_out_release(board, out);
+	if (generations < 0) {
+		Py_DECREF(result);
+		return NULL;
+	}
+	profile_end(timer);
+	if (n >= 0) {
+		return Py_BuildValue("NL", result, generations);
+	}
+	if (return_hash) {
+		return Py_BuildValue("NK", result, (unsigned long long)hash);
+	}
+	return result;
+}
+
+
+static PyObject* stepper_step(struct stepper* self, PyObject* args, PyObject* kwargs) {
+	static char* keywords[] = {"arr", "out", "return_hash", "stats", NULL};
+	struct profile_timer timer;
+	profile_begin(&timer, PROFILE_STEPPER_STEP);
+	PyObject* inputOb;
+	PyObject* outOb = Py_None;
+	PyObject* statsOb = Py_None;
+	int return_hash = 0;
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|$OpO", keywords, &inputOb, &outOb, &return_hash, &statsOb)) {
+		return NULL;
+	}
+	struct step_stats* stats;
+	if (!stats_array_check(statsOb, 1, &stats)) {
+		return NULL;
+	}
+	profile_lap(&timer, PROFILE_CHECK);
+	struct board_buffer board;
+	if (!board_buffer_get_dims(inputOb, self->dims, 1, "Input", &board)) {
+		return NULL;
+	}
+	return step_board(self, &board, outOb, -1, 0, return_hash, NULL, stats, &timer);
+}
+
+
+static PyObject* stepper_step_n(struct stepper* self, PyObject* args, PyObject* kwargs) {
+	static char* keywords[] = {"arr", "n", "stop_when_stable", "hashes", "stats", "out", NULL};
+	struct profile_timer timer;
+	profile_begin(&timer, PROFILE_STEPPER_STEP_N);
+	PyObject* inputOb;
+	long long n;
+	int stop_when_stable = 0;
+	PyObject* hashesOb = Py_None;
+	PyObject* statsOb = Py_None;
+	PyObject* outOb = Py_None;
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OL|p$OOO", keywords,
+			&inputOb, &n, &stop_when_stable, &hashesOb, &statsOb, &outOb)) {
+		return NULL;
+	}
+	if (n < 0) {
+		PyErr_SetString(PyExc_ValueError, "n must not be negative");
+		return NULL;
+	}
+	uint64_t* hashes;
+	struct step_stats* stats;
+	if (!hashes_array_check(hashesOb, n, &hashes) || !stats_array_check(statsOb, n, &stats)) {
+		return NULL;
+	}
+	profile_lap(&timer, PROFILE_CHECK);
+	struct board_buffer board;
+	if (!board_buffer_get_dims(inputOb, self->dims, 1, "Input", &board)) {
+		return NULL;
+	}
+	return step_board(self, &board, outOb, n, stop_when_stable, 0, hashes, stats, &timer);
+}
+
+
+static PyObject* stepper_get_shape(struct stepper* self, void* closure) {
+	return Py_BuildValue("(LL)", self->dims[0], self->dims[1]);
+}
+
+
+static PyObject* stepper_get_topology(struct stepper* self, void* closure) {
+	return PyUnicode_FromString(self->config.topology == TOPOLOGY_TORUS ? "torus" : "bounded");
+}
+
+
+static PyObject* stepper_get_rule(struct stepper* self, void* closure) {
+	// the rule in B/S notation
+	char text[24];
+	int length = 0;
+	text[length++] = 'B';
+	for (int n = 0; n <= 8; n++) {
+		if (self->config.birth >> n & 1) {
+			text[length++] = (char)('0' + n);
+		}
+	}
+	text[length++] = '/';
+	text[length++] = 'S';
+	for (int n = 0; n <= 8; n++) {
+		if (self->config.survive >> n & 1) {
+			text[length++] = (char)('0' + n);
+		}
+	}
+	return PyUnicode_FromStringAndSize(text, length);
+}
+
+
+static PyObject* stepper_get_threads(struct stepper* self, void* closure) {
+	if (self->pool != NULL) {
+		return PyLong_FromLong(thread_pool_size(self->pool));
+	}
+	if (!self->multithread) {
+		return PyLong_FromLong(1);
+	}
+	struct thread_pool* pool = default_thread_pool();
+	if (pool == NULL) {
+		PyErr_SetString(PyExc_MemoryError, "Could not create the thread pool");
+		return NULL;
+	}
+	return PyLong_FromLong(thread_pool_size(pool));
+}
+
+
+static PyObject* stepper_get_stats(struct stepper* self, void* closure) {
+	stepper_lock(self);
+	int has_stats = self->has_stats;
+	struct step_stats stats = self->stats;
+	PyThread_release_lock(self->lock);
+	if (!has_stats) {
+		Py_RETURN_NONE;
+	}
+	return Py_BuildValue("{sLsLsLsLsLsLsL}",
+		"population", stats.population, "births", stats.births, "deaths", stats.deaths,
+		"x_min", stats.x_min, "x_max", stats.x_max, "y_min", stats.y_min, "y_max", stats.y_max);
+}
+
+
+static PyObject* stepper_repr(struct stepper* self) {
+	PyObject* rule = stepper_get_rule(self, NULL);
+	if (rule == NULL) {
+		return NULL;
+	}
+	PyObject* repr = PyUnicode_FromFormat("Stepper((%lld, %lld), topology='%s', rule='%U')",
+		self->dims[0], self->dims[1], self->config.topology == TOPOLOGY_TORUS ? "torus" : "bounded", rule);
+	Py_DECREF(rule);
+	return repr;
+}
+
+
+static PyMethodDef stepper_methods[] = {
+	{"step", (PyCFunction)(void(*)(void))stepper_step, METH_VARARGS | METH_KEYWORDS,
+		"step(arr, *, out=None, return_hash=False, stats=None)\n"
+		"Steps the board once, in place or into out, and returns the stepped board (and its hash with return_hash)"},
+	{"step_n", (PyCFunction)(void(*)(void))stepper_step_n, METH_VARARGS | METH_KEYWORDS,
+		"step_n(arr, n, stop_when_stable=False, *, hashes=None, stats=None, out=None)\n"
+		"Steps the board n times, in place or into out, and returns the stepped board and the amount of steps"},
+	{NULL, NULL, 0, NULL}
+};
+
+
+static PyGetSetDef stepper_getset[] = {
+	{"shape", (getter)stepper_get_shape, NULL, "(rows, columns) of the boards that are stepped", NULL},
+	{"topology", (getter)stepper_get_topology, NULL, "\"bounded\" or \"torus\"", NULL},
+	{"rule", (getter)stepper_get_rule, NULL, "The rule in B/S notation", NULL},
+	{"threads", (getter)stepper_get_threads, NULL, "Amount of threads a step runs on", NULL},
+	{"stats", (getter)stepper_get_stats, NULL,
+		"Statistics of the last generation as a dict with the fields of GOL.STATS_DTYPE, "
+		"None before the first step or if the stepper doesn't gather them", NULL},
+	{NULL}
+};
+
+
+PyTypeObject StepperType = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	.tp_name = "GOL.core.Stepper",
+	.tp_doc = "Stepper(shape, *, topology=\"bounded\", rule=None, multithread=False, threads=0, stats=False)\n"
+		"Steps boards of the given shape with its own scratch memory.\n"
+		"The GIL is released while stepping, a stepper can be used from several threads at once,\n"
+		"their steps run one after the other. multithread runs the steps on the shared worker pool,\n"
+		"threads > 0 gives the stepper its own pool of that many threads.\n"
+		"With stats set the statistics of the last generation are kept in stats.",
+	.tp_basicsize = sizeof(struct stepper),
+	.tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,
+	.tp_new = stepper_new,
+	.tp_dealloc = (destructor)stepper_dealloc,
+	.tp_repr = (reprfunc)stepper_repr,
+	.tp_methods = stepper_methods,
+	.tp_getset = stepper_getset,
+};
+
+
+static struct stepper* stepper_cache[STEPPER_CACHE_SIZE];
+static int stepper_cache_next = 0;
+
+
+static struct stepper* stepper_cached(const long long* dims, const struct step_config* config, int multithread) {
+	// Returns a new reference to the stepper of the module level functions for the shape and options,
+	// the steppers of the last few are kept. Only called while holding the GIL
+	for (int i = 0; i < STEPPER_CACHE_SIZE; i++) {
+		struct stepper* stepper = stepper_cache[i];
+		if (stepper != NULL && stepper->dims[0] == dims[0] && stepper->dims[1] == dims[1] &&
+				stepper->config.topology == config->topology && stepper->config.birth == config->birth &&
+				stepper->config.survive == config->survive && stepper->multithread == multithread) {
+			Py_INCREF(stepper);
+			return stepper;
+		}
+	}
+	struct stepper* stepper = stepper_create(&StepperType, dims, config, multithread, 0, 0);
+	if (stepper == NULL) {
+		return NULL;
+	}
+	// a replaced stepper that is still stepping is kept alive by the reference of its step
+	Py_XSETREF(stepper_cache[stepper_cache_next], stepper);
+	stepper_cache_next = (stepper_cache_next + 1) % STEPPER_CACHE_SIZE;
+	Py_INCREF(stepper);
+	return stepper;
+}
+
+
+static PyObject* step_cached(struct board_buffer* board, PyObject* outOb, const struct step_config* config,
+		int multithread, long long n, int stop_when_stable, int return_hash, uint64_t* hashes,
+		struct step_stats* stats, struct profile_timer* timer) {
+	// Steps the board with the cached stepper for its shape, see step_board
+	struct stepper* stepper = stepper_cached(board->dims, config, multithread);
+	if (stepper == NULL) {
+		board_buffer_release(board);
+		return NULL;
+	}
+	PyObject* result = step_board(stepper, board, outOb, n, stop_when_stable, return_hash, hashes, stats, timer);
+	Py_DECREF(stepper);
+	return result;
+}
+
+
+PyObject* stepper_step_buffer(PyObject* inputOb, PyObject* outOb, PyObject* shapeOb, const struct step_config* config,
+		int multithread, struct profile_timer* timer) {
+	struct board_buffer board;
+	if (!board_buffer_get(inputOb, shapeOb, 1, &board)) {
+		return NULL;
+	}
+	return step_cached(&board, outOb, config, multithread, -1, 0, 0, NULL, NULL, timer);
+}
+
+
+int stepper_step_in_place(struct board_buffer* board, const struct step_config* config, int multithread,
+		struct profile_timer* timer) {
+	struct stepper* stepper = stepper_cached(board->dims, config, multithread);
+	if (stepper == NULL) {
+		return 0;
+	}
+	long long generations = stepper_run(stepper, board, board, 1, 0, NULL, NULL, timer);
+	Py_DECREF(stepper);
+	return generations >= 0;
+}
+
+
+PyObject* stepper_step_function(PyObject* args, PyObject* kwargs, int multithread, enum profile_backend backend) {
+	static char* keywords[] = {"arr", "topology", "rule", "return_hash", "stats", "out", "shape", NULL};
+	struct profile_timer timer;
+	profile_begin(&timer, backend);
+	PyObject* inputOb;
+	PyObject* statsOb = Py_None;
+	PyObject* outOb = Py_None;
+	PyObject* shapeOb = Py_None;
+	struct step_config config = STEP_CONFIG_DEFAULT;
+	int return_hash = 0;
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|$O&O&pOOO", keywords,
+			&inputOb, topology_converter, &config.topology, rule_converter, &config, &return_hash, &statsOb,
+			&outOb, &shapeOb)) {
+		return NULL;
+	}
+	struct step_stats* stats;
+	if (!stats_array_check(statsOb, 1, &stats)) {
+		return NULL;
+	}
+	profile_lap(&timer, PROFILE_CHECK);
+	// the board and out are used through the buffer protocol, so they are never copied
+	struct board_buffer board;
+	if (!board_buffer_get(inputOb, shapeOb, 1, &board)) {
+		return NULL;
+	}
+	return step_cached(&board, outOb, &config, multithread, -1, 0, return_hash, NULL, stats, &timer);
+}
+
+
+PyObject* stepper_step_n_function(PyObject* args, PyObject* kwargs) {
+	static char* keywords[] = {"arr", "n", "stop_when_stable", "multithread", "topology", "rule", "hashes", "stats",
+		"out", "shape", NULL};
+	struct profile_timer timer;
+	profile_begin(&timer, PROFILE_STEP_N);
+	PyObject* inputOb;
+	PyObject* hashesOb = Py_None;
+	PyObject* statsOb = Py_None;
+	PyObject* outOb = Py_None;
+	PyObject* shapeOb = Py_None;
+	long long n;
+	int stop_when_stable = 0;
+	int multithread = 0;
+	struct step_config config = STEP_CONFIG_DEFAULT;
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OL|ppO&O&OOOO", keywords,
+			&inputOb, &n, &stop_when_stable, &multithread, topology_converter, &config.topology,
+			rule_converter, &config, &hashesOb, &statsOb, &outOb, &shapeOb)) {
+		return NULL;
+	}
+	if (n < 0) {
+		PyErr_SetString(PyExc_ValueError, "n must not be negative");
+		return NULL;
+	}
+	// the hash and statistics of every generation are written into the arrays
+	uint64_t* hashes;
+	struct step_stats* stats;
+	if (!hashes_array_check(hashesOb, n, &hashes) || !stats_array_check(statsOb, n, &stats)) {
+		return NULL;
+	}
+	profile_lap(&timer, PROFILE_CHECK);
+	struct board_buffer board;
+	if (!board_buffer_get(inputOb, shapeOb, 1, &board)) {
+		return NULL;
+	}
+	return step_cached(&board, outOb, &config, multithread, n, stop_when_stable, 0, hashes, stats, &timer);
+}
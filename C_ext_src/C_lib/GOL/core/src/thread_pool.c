@@ -0,0 +1,284 @@
+#include "thread_pool.h"
+
+// A pool of worker threads that is created once and reused for every step.
+// thread_pool_run wakes the workers up, runs band 0 on the calling thread
+// and returns once every band has finished.
+
+#ifdef _WIN32
+#include <windows.h>
+#include <process.h>
+
+typedef HANDLE pool_thread_t;
+typedef CRITICAL_SECTION pool_mutex_t;
+typedef CONDITION_VARIABLE pool_cond_t;
+#define WORKER_RETURN unsigned __stdcall
+#define pool_mutex_init(m) InitializeCriticalSection(m)
+#define pool_mutex_destroy(m) DeleteCriticalSection(m)
+#define pool_mutex_lock(m) EnterCriticalSection(m)
+#define pool_mutex_unlock(m) LeaveCriticalSection(m)
+#define pool_cond_init(c) InitializeConditionVariable(c)
+#define pool_cond_destroy(c) ((void)(c))
+#define pool_cond_wait(c, m) SleepConditionVariableCS(c, m, INFINITE)
+#define pool_cond_broadcast(c) WakeAllConditionVariable(c)
+
+static int pool_thread_start(pool_thread_t* thread, unsigned (__stdcall *fn)(void*), void* arg) {
+	*thread = (HANDLE)_beginthreadex(NULL, 0, fn, arg, 0, NULL);
+	return *thread == 0 ? -1 : 0;
+}
+
+static void pool_thread_join(pool_thread_t thread) {
+	WaitForSingleObject(thread, INFINITE);
+	CloseHandle(thread);
+}
+
+int cpu_count(void) {
+	SYSTEM_INFO info;
+	GetSystemInfo(&info);
+	return info.dwNumberOfProcessors > 0 ? (int)info.dwNumberOfProcessors : 1;
+}
+
+#else
+#include <pthread.h>
+#include <unistd.h>
+
+typedef pthread_t pool_thread_t;
+typedef pthread_mutex_t pool_mutex_t;
+typedef pthread_cond_t pool_cond_t;
+#define WORKER_RETURN void*
+#define pool_mutex_init(m) pthread_mutex_init(m, NULL)
+#define pool_mutex_destroy(m) pthread_mutex_destroy(m)
+#define pool_mutex_lock(m) pthread_mutex_lock(m)
+#define pool_mutex_unlock(m) pthread_mutex_unlock(m)
+#define pool_cond_init(c) pthread_cond_init(c, NULL)
+#define pool_cond_destroy(c) pthread_cond_destroy(c)
+#define pool_cond_wait(c, m) pthread_cond_wait(c, m)
+#define pool_cond_broadcast(c) pthread_cond_broadcast(c)
+
+static int pool_thread_start(pool_thread_t* thread, void* (*fn)(void*), void* arg) {
+	return pthread_create(thread, NULL, fn, arg) == 0 ? 0 : -1;
+}
+
+static void pool_thread_join(pool_thread_t thread) {
+	pthread_join(thread, NULL);
+}
+
+int cpu_count(void) {
+	long count = sysconf(_SC_NPROCESSORS_ONLN);
+	return count > 0 ? (int)count : 1;
+}
+
+#endif
+
+
+struct pool_worker {
+	struct thread_pool* pool;
+	pool_thread_t thread;
+	int band;
+	unsigned long long seen_generation;
+};
+
+struct thread_pool {
+	// amount of bands, the calling thread works on band 0
+	int thread_count;
+	struct pool_worker* workers;
+	// only one caller can use the pool at a time
+	pool_mutex_t run_lock;
+	pool_mutex_t lock;
+	pool_cond_t work_ready;
+	pool_cond_t work_done;
+	// threads waiting in thread_pool_barrier, and the amount of times all of them arrived
+	pool_cond_t barrier_done;
+	int barrier_waiting;
+	unsigned long long barrier_generation;
+	unsigned long long generation;
+	int pending;
+	int shutdown;
+	pool_task_fn fn;
+	void* ctx;
+};
+
+
+static WORKER_RETURN worker_main(void* arg) {
+	struct pool_worker* worker = (struct pool_worker*)arg;
+	struct thread_pool* pool = worker->pool;
+	pool_mutex_lock(&pool->lock);
+	while (1) {
+		while (!pool->shutdown && pool->generation == worker->seen_generation) {
+			pool_cond_wait(&pool->work_ready, &pool->lock);
+		}
+		if (pool->shutdown) {
+			break;
+		}
+		worker->seen_generation = pool->generation;
+		pool_task_fn fn = pool->fn;
+		void* ctx = pool->ctx;
+		int band_count = pool->thread_count;
+		pool_mutex_unlock(&pool->lock);
+
+		fn(ctx, worker->band, band_count);
+
+		pool_mutex_lock(&pool->lock);
+		pool->pending--;
+		if (pool->pending == 0) {
+			pool_cond_broadcast(&pool->work_done);
+		}
+	}
+	pool_mutex_unlock(&pool->lock);
+	return 0;
+}
+
+
+static void stop_workers(struct thread_pool* pool) {
+	pool_mutex_lock(&pool->lock);
+	pool->shutdown = 1;
+	pool_cond_broadcast(&pool->work_ready);
+	pool_mutex_unlock(&pool->lock);
+	for (int i = 0; i < pool->thread_count - 1; i++) {
+		pool_thread_join(pool->workers[i].thread);
+	}
+	free(pool->workers);
+	pool->workers = NULL;
+	pool->thread_count = 1;
+	pool->shutdown = 0;
+}
+
+
+static int start_workers(struct thread_pool* pool, int thread_count) {
+	if (thread_count < 1) {
+		thread_count = cpu_count();
+	}
+	if (thread_count > THREAD_POOL_MAX_THREADS) {
+		thread_count = THREAD_POOL_MAX_THREADS;
+	}
+	pool->thread_count = 1;
+	if (thread_count == 1) {
+		return 0;
+	}
+	pool->workers = (struct pool_worker*)calloc(thread_count - 1, sizeof(struct pool_worker));
+	if (pool->workers == NULL) {
+		return -1;
+	}
+	for (int i = 0; i < thread_count - 1; i++) {
+		struct pool_worker* worker = &pool->workers[i];
+		worker->pool = pool;
+		worker->band = i + 1;
+		worker->seen_generation = pool->generation;
+		if (pool_thread_start(&worker->thread, worker_main, worker) != 0) {
+			// run with the threads that did start
+			break;
+		}
+		pool->thread_count++;
+	}
+	return 0;
+}
+
+
+struct thread_pool* thread_pool_create(int thread_count) {
+	struct thread_pool* pool = (struct thread_pool*)calloc(1, sizeof(struct thread_pool));
+	if (pool == NULL) {
+		return NULL;
+	}
+	pool_mutex_init(&pool->run_lock);
+	pool_mutex_init(&pool->lock);
+	pool_cond_init(&pool->work_ready);
+	pool_cond_init(&pool->work_done);
+	pool_cond_init(&pool->barrier_done);
+	if (start_workers(pool, thread_count) != 0) {
+		thread_pool_destroy(pool);
+		return NULL;
+	}
+	return pool;
+}
+
+
+void thread_pool_destroy(struct thread_pool* pool) {
+	stop_workers(pool);
+	pool_cond_destroy(&pool->barrier_done);
+	pool_cond_destroy(&pool->work_done);
+	pool_cond_destroy(&pool->work_ready);
+	pool_mutex_destroy(&pool->lock);
+	pool_mutex_destroy(&pool->run_lock);
+	free(pool);
+}
+
+
+// Changes the amount of threads, waits for a running step to finish first.
+// A thread_count below 1 uses one thread per core.
+int thread_pool_resize(struct thread_pool* pool, int thread_count) {
+	pool_mutex_lock(&pool->run_lock);
+	stop_workers(pool);
+	int err = start_workers(pool, thread_count);
+	pool_mutex_unlock(&pool->run_lock);
+	return err;
+}
+
+
+int thread_pool_size(struct thread_pool* pool) {
+	return pool->thread_count;
+}
+
+
+void thread_pool_run(struct thread_pool* pool, pool_task_fn fn, void* ctx) {
+	pool_mutex_lock(&pool->run_lock);
+	int band_count = pool->thread_count;
+	if (band_count > 1) {
+		pool_mutex_lock(&pool->lock);
+		pool->fn = fn;
+		pool->ctx = ctx;
+		pool->pending = band_count - 1;
+		pool->generation++;
+		pool_cond_broadcast(&pool->work_ready);
+		pool_mutex_unlock(&pool->lock);
+	}
+
+	fn(ctx, 0, band_count);
+
+	if (band_count > 1) {
+		pool_mutex_lock(&pool->lock);
+		while (pool->pending > 0) {
+			pool_cond_wait(&pool->work_done, &pool->lock);
+		}
+		pool_mutex_unlock(&pool->lock);
+	}
+	pool_mutex_unlock(&pool->run_lock);
+}
+
+
+// Waits until every band of the running task has called it, so a task can run in phases.
+// It must only be called from a task, by all of its bands
+void thread_pool_barrier(struct thread_pool* pool) {
+	// the amount of threads can't change while a task runs, resizing waits for the run_lock
+	if (pool->thread_count == 1) {
+		return;
+	}
+	pool_mutex_lock(&pool->lock);
+	unsigned long long generation = pool->barrier_generation;
+	if (++pool->barrier_waiting == pool->thread_count) {
+		pool->barrier_waiting = 0;
+		pool->barrier_generation++;
+		pool_cond_broadcast(&pool->barrier_done);
+	} else {
+		while (pool->barrier_generation == generation) {
+			pool_cond_wait(&pool->barrier_done, &pool->lock);
+		}
+	}
+	pool_mutex_unlock(&pool->lock);
+}
+
+
+// The pool shared by the module level functions.
+// It is created on first use, which happens while holding the GIL
+struct thread_pool* default_thread_pool(void) {
+	static struct thread_pool* pool = NULL;
+	if (pool == NULL) {
+		pool = thread_pool_create(0);
+	}
+	return pool;
+}
+
+
+// Splits `total` rows into contiguous bands so that every thread works on its own part of memory
+void band_range(long long total, int band, int band_count, long long* start, long long* end) {
+	*start = total * band / band_count;
+	*end = total * (band + 1) / band_count;
+}
@@ -0,0 +1,135 @@
+#include "tiled.h"
+
+// The board is split into tile_size x tile_size tiles.
+// active holds a flag for every tile that changed in the previous step,
+// only those tiles and their neighbours can change in the next step.
+// Everything else is skipped, which makes settled boards very cheap to step.
+
+
+static void tile_bounds(
+		long long tile, long long tile_size, long long size, const struct step_config* config,
+		long long* start, long long* end) {
+	// Range of the tile's cells, without the border cells of a bounded board
+	long long border = config->topology == TOPOLOGY_TORUS ? 0 : 1;
+	*start = tile * tile_size > border ? tile * tile_size : border;
+	*end = (tile + 1) * tile_size < size - border ? (tile + 1) * tile_size : size - border;
+}
+
+
+static inline int8_t next_cell(
+		const int8_t* up, const int8_t* mid, const int8_t* down,
+		long long left, long long j, long long right, const int8_t* table) {
+	int neighbours =
+		up[left] + up[j] + up[right] +
+		mid[left] + mid[right] +
+		down[left] + down[j] + down[right];
+	// counts outside of 0-8 only happen if the board holds values other than 0 and 1
+	return neighbours >= 0 && neighbours <= 8 ? table[(mid[j] == 1) * 9 + neighbours] : 0;
+}
+
+
+static int step_tile(
+		const int8_t* arr, int8_t* scratch, long long rows, long long cols,
+		long long row_start, long long row_end, long long col_start, long long col_end,
+		const int8_t* table) {
+	// Writes the next state of the cells in the tile into scratch
+	// Neighbours wrap around the edges, on a bounded board the tile never touches them
+	// Returns 1 if any cell changed
+	int changed = 0;
+	long long inner_start = col_start > 1 ? col_start : 1;
+	long long inner_end = col_end < cols - 1 ? col_end : cols - 1;
+	for (long long i = row_start; i < row_end; i++) {
+		const int8_t* up = arr + ((i - 1 + rows) % rows) * cols;
+		const int8_t* mid = arr + i * cols;
+		const int8_t* down = arr + ((i + 1) % rows) * cols;
+		int8_t* out = scratch + i * cols;
+		for (long long j = inner_start; j < inner_end; j++) {
+			int8_t next = next_cell(up, mid, down, j - 1, j, j + 1, table);
+			changed |= next != mid[j];
+			out[j] = next;
+		}
+		// the first and last column of a torus
+		if (col_start == 0) {
+			out[0] = next_cell(up, mid, down, cols - 1, 0, 1, table);
+			changed |= out[0] != mid[0];
+		}
+		if (col_end == cols) {
+			out[cols - 1] = next_cell(up, mid, down, cols - 2, cols - 1, 0, table);
+			changed |= out[cols - 1] != mid[cols - 1];
+		}
+	}
+	return changed;
+}
+
+
+// Steps the board in place, using scratch (same size as the board) for the new tiles.
+// On a bounded board the outer ring of cells is left untouched like in calculate_next_step.
+// Returns the amount of tiles that were calculated or -1 if memory could not be allocated
+long long step_tiled(
+		int8_t* arr, int8_t* scratch, uint8_t* active,
+		long long rows, long long cols, long long tile_size, const struct step_config* config) {
+	int torus = config->topology == TOPOLOGY_TORUS;
+	int8_t table[RULE_TABLE_SIZE];
+	rule_table(config, table);
+	long long tiles_x = (rows + tile_size - 1) / tile_size;
+	long long tiles_y = (cols + tile_size - 1) / tile_size;
+	uint8_t* work = (uint8_t*)calloc(tiles_x * tiles_y, sizeof(uint8_t));
+	if (work == NULL) {
+		return -1;
+	}
+
+	// a tile has to be calculated if it or any of its neighbours changed,
+	// on a torus the tiles on opposite edges are neighbours
+	for (long long tx = 0; tx < tiles_x; tx++) {
+		for (long long ty = 0; ty < tiles_y; ty++) {
+			if (!active[tx * tiles_y + ty]) {
+				continue;
+			}
+			for (long long nx = tx - 1; nx <= tx + 1; nx++) {
+				for (long long ny = ty - 1; ny <= ty + 1; ny++) {
+					if (torus) {
+						work[((nx + tiles_x) % tiles_x) * tiles_y + (ny + tiles_y) % tiles_y] = 1;
+					} else if (nx >= 0 && nx < tiles_x && ny >= 0 && ny < tiles_y) {
+						work[nx * tiles_y + ny] = 1;
+					}
+				}
+			}
+		}
+	}
+
+	long long calculated = 0;
+	for (long long tx = 0; tx < tiles_x; tx++) {
+		for (long long ty = 0; ty < tiles_y; ty++) {
+			long long t = tx * tiles_y + ty;
+			active[t] = 0;
+			if (!work[t]) {
+				continue;
+			}
+			calculated++;
+			long long row_start, row_end, col_start, col_end;
+			tile_bounds(tx, tile_size, rows, config, &row_start, &row_end);
+			tile_bounds(ty, tile_size, cols, config, &col_start, &col_end);
+			if (row_start < row_end && col_start < col_end) {
+				active[t] = (uint8_t)step_tile(arr, scratch, rows, cols, row_start, row_end, col_start, col_end, table);
+			}
+		}
+	}
+
+	// every tile has been calculated from the old board, now the changed ones can be copied back
+	for (long long tx = 0; tx < tiles_x; tx++) {
+		for (long long ty = 0; ty < tiles_y; ty++) {
+			if (!active[tx * tiles_y + ty]) {
+				continue;
+			}
+			long long row_start, row_end, col_start, col_end;
+			tile_bounds(tx, tile_size, rows, config, &row_start, &row_end);
+			tile_bounds(ty, tile_size, cols, config, &col_start, &col_end);
+			for (long long i = row_start; i < row_end; i++) {
+				memcpy(arr + i * cols + col_start, scratch + i * cols + col_start, (col_end - col_start) * sizeof(int8_t));
+			}
+		}
+	}
+
+	free(work);
+	return calculated;
+}
@@ -12,6 +12,8 @@ python_include_dir = sysconfig.get_paths()["include"]
 file_path = os.path.abspath(__file__)
 folder_path = os.path.dirname(file_path)
 GOLCore_include_path = os.path.join(folder_path, "GOL/core/include")
+# the worker pool uses pthreads everywhere but on Windows
+thread_args = [] if os.name == 'nt' else ['-pthread']
 
 setup(
 	packages=["GOL"],
@@ -24,6 +26,8 @@ setup(
 				np.get_include()
 			],
 			sources=files,  # all sources are compiled into a single binary file
+			extra_compile_args=thread_args,
+			extra_link_args=thread_args,
 		)
 	],
 	name="GOL"
@@ -0,0 +1,227 @@
+"""This module contains a benchmark suite for the step functions in gol_step
+
+Every backend is run headless (see headless.py) on random boards of several sizes and densities,
+from boards that fit into the L2 cache up to boards that only fit into RAM.
+Each case gets warm-up runs before the timed repetitions, which are measured with time.perf_counter.
+Results are reported in cells per second with their standard deviation,
+and can be saved as JSON and compared against a saved baseline to catch regressions.
+
+Usage:
+	python benchmark.py --json results.json
+	python benchmark.py --baseline results.json --tolerance 0.1
+	python benchmark.py --check-simd
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import numpy as np
+
+from gol_step import BACKENDS, HAS_C_EXTENSION, TOPOLOGIES
+from headless import parse_size, run
+from rules import get_rule
+
+# 16 KiB fits into L2, 256 KiB into a large L2, 4 MiB into L3 and 64 MiB only into RAM
+SIZES = ((128, 128), (512, 512), (2048, 2048), (8192, 8192))
+DENSITIES = (0.1, 0.5)
+if HAS_C_EXTENSION:
+	DEFAULT_BACKENDS = ('py_partial_sums', 'c_numpy', 'c_numpy_multithread', 'c_bitpacked', 'tiled')
+else:
+	DEFAULT_BACKENDS = ('py_simple', 'py_partial_sums')
+# boards the SIMD variants are checked on, the widths are no multiple of the vector sizes
+# so the tails of the rows are stepped as well
+SIMD_CHECK_SIZES = ((3, 3), (4, 7), (9, 15), (17, 31), (33, 63), (65, 65), (40, 127), (30, 129), (20, 257), (64, 1001))
+# without a fixed amount of generations, every repetition calculates about this many cells
+_TARGET_CELLS = 1 << 26
+_MAX_GENERATIONS = 1000
+
+
+def _generations_for(width:int, height:int) -> int:
+	return max(1, min(_MAX_GENERATIONS, _TARGET_CELLS // (width*height)))
+
+
+def benchmark_case(backend:str, width:int, height:int, density:float, generations:int=None,
+		repetitions:int=5, warmup:int=1, topology:str="bounded", rule=None, seed:int=0) -> dict:
+	"""Times a single backend on a random board
+
+	Every repetition starts from the same board, without a fixed amount of generations
+	it is chosen so that every repetition calculates about the same amount of cells.
+	Returns a dict with the parameters of the case, the time of every repetition
+	and the mean and standard deviation of the cells per second.
+	"""
+	if generations is None:
+		generations = _generations_for(width, height)
+	board = (np.random.default_rng(seed).random((width, height)) < density).view(np.uint8)
+	for _ in range(warmup):
+		run(board, generations, backend, topology, rule)
+	seconds = [run(board, generations, backend, topology, rule)['seconds'] for _ in range(repetitions)]
+	cells_per_second = [width*height*generations/s for s in seconds]
+	return {
+		'backend': backend,
+		'width': width,
+		'height': height,
+		'density': density,
+		'topology': topology,
+		'rule': str(get_rule(rule)),
+		'generations': generations,
+		'seconds': seconds,
+		'cells_per_second': statistics.mean(cells_per_second),
+		'cells_per_second_stdev': statistics.stdev(cells_per_second) if len(cells_per_second) > 1 else 0.0,
+	}
+
+
+def run_suite(backends=DEFAULT_BACKENDS, sizes=SIZES, densities=DENSITIES, progress:callable=None, **kwargs) -> dict:
+	"""Runs every combination of backend, size and density
+
+	Other keyword arguments are passed on to benchmark_case,
+	progress is called with the result of every case as soon as it is done.
+	Returns a JSON serializable dict with information about the machine and the results.
+	"""
+	results = []
+	for backend in backends:
+		for width, height in sizes:
+			for density in densities:
+				result = benchmark_case(backend, width, height, density, **kwargs)
+				results.append(result)
+				if progress is not None:
+					progress(result)
+	return {'machine': machine_info(), 'results': results}
+
+
+def check_simd(sizes=SIMD_CHECK_SIZES, densities=DENSITIES, generations:int=8, seed:int=0) -> list:
+	"""Runs the C step functions with every SIMD variant the CPU supports and compares them with the scalar kernels
+
+	step_NpArr, step_NpArr_multithread and step_n (single and multithreaded) are run on random boards
+	of every size, density and topology. The selected variant is restored afterwards.
+	Returns a list of (variant, function, size, density, topology) for every result that differs.
+	"""
+	import GOL
+	functions = {
+		'step_NpArr': lambda board, topology: GOL.step_NpArr(board, topology=topology),
+		'step_NpArr_multithread': lambda board, topology: GOL.step_NpArr_multithread(board, topology=topology),
+		'step_n': lambda board, topology: GOL.step_n(board, generations, topology=topology)[0],
+		'step_n multithread': lambda board, topology: GOL.step_n(board, generations, multithread=True, topology=topology)[0],
+	}
+	rng = np.random.default_rng(seed)
+	mismatches = []
+	selected = GOL.get_simd()
+	try:
+		for size in sizes:
+			for density in densities:
+				board = (rng.random(size) < density).view(np.uint8)
+				for topology in TOPOLOGIES:
+					GOL.set_simd('scalar')
+					expected = {name: function(board.copy(), topology) for name, function in functions.items()}
+					for variant in GOL.simd_variants():
+						GOL.set_simd(variant)
+						for name, function in functions.items():
+							if not np.array_equal(function(board.copy(), topology), expected[name]):
+								mismatches.append((variant, name, size, density, topology))
+	finally:
+		GOL.set_simd(selected)
+	return mismatches
+
+
+def machine_info() -> dict:
+	"""Returns the information needed to tell if two benchmark results are comparable"""
+	info = {
+		'platform': platform.platform(),
+		'processor': platform.processor(),
+		'cpu_count': os.cpu_count(),
+		'python': platform.python_version(),
+		'numpy': np.__version__,
+		'c_extension': HAS_C_EXTENSION,
+	}
+	if HAS_C_EXTENSION:
+		import GOL
+		info['thread_count'] = GOL.get_thread_count()
+	return info
+
+
+def _case_key(result:dict) -> tuple:
+	return (result['backend'], result['width'], result['height'], result['density'], result['topology'], result['rule'])
+
+
+def compare(suite:dict, baseline:dict, tolerance:float=0.1) -> list:
+	"""Compares the results of a suite with a baseline suite
+
+	Returns a list of (result, baseline result, relative change) for every case
+	that got slower by more than tolerance, cases missing in the baseline are skipped.
+	"""
+	baseline_results = {_case_key(result): result for result in baseline['results']}
+	regressions = []
+	for result in suite['results']:
+		old = baseline_results.get(_case_key(result))
+		if old is None:
+			continue
+		change = result['cells_per_second']/old['cells_per_second'] - 1
+		if change < -tolerance:
+			regressions.append((result, old, change))
+	return regressions
+
+
+def format_result(result:dict) -> str:
+	return '%-22s %5dx%-5d density %.2f: %10.4g cells/s +- %4.1f%% (%d generations)' % (
+		result['backend'], result['width'], result['height'], result['density'],
+		result['cells_per_second'], 100*result['cells_per_second_stdev']/result['cells_per_second'],
+		result['generations'])
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description='Benchmarks the game of life step functions')
+	parser.add_argument('-b', '--backends', nargs='+', choices=list(BACKENDS), default=DEFAULT_BACKENDS)
+	parser.add_argument('-s', '--sizes', nargs='+', type=parse_size, default=SIZES, metavar='WIDTHxHEIGHT')
+	parser.add_argument('-d', '--densities', nargs='+', type=float, default=DENSITIES)
+	parser.add_argument('-n', '--generations', type=int, help='generations per repetition, by default it depends on the size')
+	parser.add_argument('-r', '--repetitions', type=int, default=5)
+	parser.add_argument('-w', '--warmup', type=int, default=1, help='untimed runs before the repetitions')
+	parser.add_argument('-t', '--topology', choices=TOPOLOGIES, default="bounded")
+	parser.add_argument('--rule', help='rule in B/S notation, defaults to conway\'s game of life')
+	parser.add_argument('--seed', type=int, default=0, help='seed of the random boards')
+	parser.add_argument('--json', help='file the results are saved to')
+	parser.add_argument('--baseline', help='results of an earlier run to compare with')
+	parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative slowdown compared to the baseline')
+	parser.add_argument('--check-simd', action='store_true', help='compares every SIMD variant with the scalar kernels instead of benchmarking')
+	return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+	"""Runs the benchmark from the command line, returns 1 if there are regressions or SIMD mismatches"""
+	args = parse_args(argv)
+	if args.check_simd:
+		if not HAS_C_EXTENSION:
+			print('--check-simd needs the C extension')
+			return 1
+		import GOL
+		mismatches = check_simd(seed=args.seed)
+		for variant, function, size, density, topology in mismatches:
+			print('MISMATCH %s %s %dx%d density %.2f %s' % (variant, function, size[0], size[1], density, topology))
+		if mismatches:
+			return 1
+		print('%s match the scalar kernels' % ', '.join(GOL.simd_variants()))
+		return 0
+	suite = run_suite(args.backends, args.sizes, args.densities, progress=lambda result: print(format_result(result)),
+		generations=args.generations, repetitions=args.repetitions, warmup=args.warmup,
+		topology=args.topology, rule=args.rule, seed=args.seed)
+	if args.json:
+		with open(args.json, 'w') as write_file:
+			json.dump(suite, write_file, indent='\t')
+	if args.baseline:
+		with open(args.baseline) as read_file:
+			baseline = json.load(read_file)
+		if baseline['machine'] != suite['machine']:
+			print('Warning: the baseline was measured on a different machine or setup')
+		regressions = compare(suite, baseline, args.tolerance)
+		for result, old, change in regressions:
+			print('REGRESSION %s: %.1f%% slower than the baseline (%.4g cells/s)' % (
+				format_result(result), -100*change, old['cells_per_second']))
+		if regressions:
+			return 1
+		print('No regressions compared to the baseline')
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,171 @@
+"""This module contains background checkpointing for long simulations
+
+The board is copied once in the simulation thread and handed to a writer thread,
+which compresses and writes it as a snapshot (see snapshot.py) while the simulation keeps stepping.
+The queue between them is bounded, so a slow disk blocks the simulation instead of piling up copies of the board.
+
+Checkpoints are written to a temporary file first and renamed when complete,
+so a crash never leaves a half written checkpoint behind.
+"""
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+import snapshot
+from rules import get_rule
+
+CHECKPOINT_PREFIX = 'checkpoint_'
+
+
+def checkpoint_path(directory:str, generation:int) -> str:
+	"""Returns the file name of the checkpoint of a generation"""
+	return os.path.join(directory, '%s%012d%s' % (CHECKPOINT_PREFIX, generation, snapshot.EXTENSION))
+
+
+def checkpoint_generation(file_name:str):
+	"""Returns the generation of a checkpoint file name, None if it is not a checkpoint"""
+	name = os.path.basename(file_name)
+	if not name.startswith(CHECKPOINT_PREFIX) or not name.endswith(snapshot.EXTENSION):
+		return None
+	generation = name[len(CHECKPOINT_PREFIX):len(name)-len(snapshot.EXTENSION)]
+	return int(generation) if generation.isdigit() else None
+
+
+def list_checkpoints(directory:str) -> list:
+	"""Returns the checkpoint files in the directory, oldest generation first
+
+	They are ordered by the generation in their name, which gets longer after 10**12 generations
+	"""
+	if not os.path.isdir(directory):
+		return []
+	checkpoints = []
+	for name in os.listdir(directory):
+		generation = checkpoint_generation(name)
+		if generation is not None:
+			checkpoints.append((generation, os.path.join(directory, name)))
+	return [file_name for _, file_name in sorted(checkpoints)]
+
+
+def latest_checkpoint(directory:str):
+	"""Returns the file name of the newest checkpoint in the directory, None if there is none"""
+	checkpoints = list_checkpoints(directory)
+	return checkpoints[-1] if checkpoints else None
+
+
+def load_checkpoint(file_name:str) -> tuple:
+	"""Loads a checkpoint, returns the board and the metadata
+
+	The metadata contains the generation, rule, topology, unbounded and origin of the simulation
+	"""
+	board, header = snapshot.load_snapshot(file_name, mmap_mode=None, return_header=True)
+	metadata = dict(header['metadata'])
+	metadata.setdefault('rule', header['rule'])
+	return board, metadata
+
+
+class Checkpointer:
+	"""Writes checkpoints of a simulation in a background thread
+
+	A checkpoint is due every every_generations generations or every_seconds seconds, whichever comes first,
+	either can be None to disable it. Only the newest keep checkpoints are kept, None keeps all of them.
+	At most max_pending boards wait for the writer, further checkpoints block until there is room.
+	"""
+	def __init__(self, directory:str, every_generations:int=None, every_seconds:float=None,
+			encoding:str='packed+zlib', keep:int=3, max_pending:int=2) -> None:
+		if every_generations is None and every_seconds is None:
+			raise ValueError('either every_generations or every_seconds must be specified')
+		if encoding not in snapshot.ENCODINGS:
+			raise ValueError('encoding must be one of %s' % ', '.join(snapshot.ENCODINGS))
+		if keep is not None and keep < 1:
+			raise ValueError('keep must be at least 1, or None to keep every checkpoint')
+		os.makedirs(directory, exist_ok=True)
+		self.directory = directory
+		self.every_generations = every_generations
+		self.every_seconds = every_seconds
+		self.encoding = encoding
+		self.keep = keep
+		self._queue = queue.Queue(maxsize=max(1, max_pending))
+		self._error = None
+		self._last_generation = None
+		self._last_time = time.monotonic()
+		self._thread = threading.Thread(target=self._writer, name='checkpoint writer', daemon=True)
+		self._thread.start()
+
+	def reset(self, generation:int=0):
+		"""Starts counting the intervals from this generation and from now"""
+		self._last_generation = generation
+		self._last_time = time.monotonic()
+
+	def is_due(self, generation:int) -> bool:
+		"""Checks if a checkpoint should be written at this generation"""
+		if self._last_generation is None:
+			self.reset(generation)
+		if self.every_generations is not None and generation - self._last_generation >= self.every_generations:
+			return True
+		return self.every_seconds is not None and time.monotonic() - self._last_time >= self.every_seconds
+
+	def maybe_checkpoint(self, board:np.ndarray, generation:int, **metadata) -> bool:
+		"""Writes a checkpoint if one is due, returns whether one was written"""
+		if not self.is_due(generation):
+			return False
+		self.checkpoint(board, generation, **metadata)
+		return True
+
+	def checkpoint(self, board:np.ndarray, generation:int, rule=None, topology:str="bounded", **metadata):
+		"""Queues a copy of the board to be written
+
+		Extra keyword arguments are stored in the metadata of the snapshot, they must be JSON serializable.
+		Blocks while the queue is full.
+		"""
+		self._raise_error()
+		metadata.update(generation=int(generation), rule=str(get_rule(rule)), topology=topology)
+		self._queue.put((np.array(board, dtype=np.uint8), metadata))
+		self._last_generation = generation
+		self._last_time = time.monotonic()
+
+	def flush(self):
+		"""Waits until every queued checkpoint is written"""
+		self._queue.join()
+		self._raise_error()
+
+	def close(self):
+		"""Writes the queued checkpoints and stops the writer thread"""
+		if self._thread.is_alive():
+			self._queue.put(None)
+			self._thread.join()
+		self._raise_error()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def _raise_error(self):
+		"""Raises the error of a failed write in the simulation thread"""
+		if self._error is not None:
+			error, self._error = self._error, None
+			raise RuntimeError('writing a checkpoint failed') from error
+
+	def _writer(self):
+		while True:
+			item = self._queue.get()
+			try:
+				if item is None:
+					return
+				self._write(*item)
+			except Exception as error:
+				self._error = error
+			finally:
+				self._queue.task_done()
+
+	def _write(self, board, metadata):
+		file_name = checkpoint_path(self.directory, metadata['generation'])
+		temp_name = file_name + '.tmp'
+		snapshot.save_snapshot(temp_name, board, self.encoding, rule=metadata['rule'], metadata=metadata)
+		os.replace(temp_name, file_name)
+		if self.keep is not None:
+			for old in list_checkpoints(self.directory)[:-self.keep]:
+				os.remove(old)
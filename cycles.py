@@ -0,0 +1,93 @@
+"""This module contains a detector for boards that settled into a still life or an oscillator
+
+Every generation is identified by its board hash (see gol_step.board_hash),
+which the C step functions compute while stepping, so no board has to be copied or compared per generation.
+Only the hashes of a bounded number of recent generations are kept.
+"""
+import collections
+import numpy as np
+
+from gol_step import HAS_C_EXTENSION, board_hash, get_backend, get_step_n_function
+
+
+class Cycle(collections.namedtuple('Cycle', ('start', 'period'))):
+	"""The board of generation start repeats every period generations, a period of 1 is a still life"""
+	__slots__ = ()
+
+	def __str__(self) -> str:
+		return 'stable after generation %d with period %d' % (self.start, self.period)
+
+
+class CycleDetector:
+	"""Finds the first generation that repeats an earlier one
+
+	The hashes of the last max_history generations are remembered, longer periods are not found.
+	A repeated hash is verified by running a copy of the board for one period with step_n_function
+	and comparing it, so a hash collision is never reported as a cycle.
+	step_n_function must be a dense step_n function that keeps no state between calls, it defaults to the
+	c_numpy backend (py_partial_sums without the C extension). The stateful backends (tiled, hashlife, sparse)
+	can't verify, they would switch to the copy of the board.
+	The observed generations are generations_per_step apart (hashlife runs several generations per step),
+	step_kwargs (topology, rule) are passed on to step_n_function, the topology is also used for hashing.
+	"""
+	def __init__(self, step_n_function:callable=None, max_history:int=4096, generations_per_step:int=1, **step_kwargs) -> None:
+		if step_n_function is None:
+			step_n_function = get_step_n_function(get_backend('c_numpy' if HAS_C_EXTENSION else 'py_partial_sums'))
+		self.step_n_function = step_n_function
+		self.max_history = max_history
+		self.generations_per_step = generations_per_step
+		self.step_kwargs = step_kwargs
+		self.topology = step_kwargs.get('topology', "bounded")
+		self.reset()
+
+	def reset(self):
+		"""Forgets every generation seen so far"""
+		self.cycle = None
+		# hash -> latest generation with that hash, and the generations in the order they were seen
+		self._generations = {}
+		self._history = collections.deque()
+
+	def observe(self, board:np.ndarray, generation:int, hash_value:int=None) -> Cycle:
+		"""Records the board of a generation, hashing it if hash_value is not given
+
+		Returns the cycle once one is found, None before that.
+		"""
+		if hash_value is None:
+			hash_value = board_hash(board, self.topology)
+		return self.observe_hashes(board, (hash_value,), generation)
+
+	def observe_hashes(self, board:np.ndarray, hashes, first_generation:int) -> Cycle:
+		"""Records consecutive generations from the hashes a step_n function wrote
+
+		hashes[i] belongs to generation first_generation + i*generations_per_step,
+		board is the board of the last of them.
+		Returns the cycle once one is found, None before that.
+		"""
+		if self.cycle is not None:
+			return self.cycle
+		for index, hash_value in enumerate(hashes):
+			generation = first_generation + index*self.generations_per_step
+			previous = self._record(int(hash_value), generation)
+			# the board is later than both generations, so it is part of the cycle if there is one
+			if previous is not None and self._verify(board, generation-previous):
+				self.cycle = Cycle(previous, generation-previous)
+				return self.cycle
+		return None
+
+	def _record(self, hash_value:int, generation:int) -> int:
+		"""Remembers the hash of a generation, returns the previous generation with the same hash"""
+		previous = self._generations.get(hash_value)
+		self._generations[hash_value] = generation
+		self._history.append((hash_value, generation))
+		while len(self._history) > self.max_history:
+			old_hash, old_generation = self._history.popleft()
+			if self._generations.get(old_hash) == old_generation:
+				del self._generations[old_hash]
+		return previous
+
+	def _verify(self, board:np.ndarray, period:int) -> bool:
+		"""Checks that the board is the same after period more generations"""
+		if period <= 0:
+			return False
+		later, steps_run = self.step_n_function(np.array(board), period, **self.step_kwargs)
+		return steps_run == period and np.array_equal(later, board)
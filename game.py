@@ -8,12 +8,19 @@ It attempts to use the C extension if it is available, otherwise it uses a pytho
 Both implementations utilize numpy's stride manipulation to speed up the neighbor summation.
 
 The python implementation is around 2 times slower than the C implementation.
+
+With threaded set, the simulation runs in a worker thread and the display shows the latest generation
+at its own rate, so a slow display doesn't slow down the simulation.
 """
+import threading
 import time
 import pygame
 import numpy as np
 
-from gol_step import gol_c_numpy_api as game_of_life_step
+from gol_step import gol_c_numpy_api as game_of_life_step, get_step_n_function, supports_stats, STATS_DTYPE
+from rules import CONWAY, get_rule
+from checkpoint import latest_checkpoint, load_checkpoint
+from cycles import CycleDetector
 
 
 
@@ -29,18 +36,119 @@ class GameOfLifeSim:
 	# size of the board in cells
 	_width = 1200
 	_height = 800
+	# size of the visible area in cells when not zoomed in
+	_view_width = 1200
+	_view_height = 800
+	# board index of the cell that was at (0, 0) when the simulation started,
+	# changes when an unbounded board grows to the left or top
+	_origin_x = 0
+	_origin_y = 0
+	# live cells closer than this to the edge of an unbounded board make it grow
+	_grow_margin = 8
+	_live_bounds = None
 	_scale = 1
+	# board sized 8 bit surface, the cell values are palette indices, so the board is copied into it as is
+	_board_surface = None
+	# the visible part of the board scaled to the screen, reused between frames
+	_scaled_surface = None
+	# set when the board or the viewport changed since the last frame, nothing is drawn otherwise
+	_board_changed = True
+	_view_changed = True
+	# origin and size in cells (like _width and _height) of the board that was drawn last,
+	# the view moves along when an unbounded board grows.
+	# The renderer only uses these, the worker thread may already have grown the board
+	_shown_origin = None
+	_shown_size = None
+	# latest generation published by the worker thread for the renderer and its origin, None once it was taken
+	_frame = None
+	# single steps requested with the space key, run by the worker thread
+	_requested_steps = 0
+	# cells the window of a step function with move_window should move by, requested by the renderer
+	# and applied by the thread that steps, and the moves that weren't drawn yet
+	_requested_move = (0, 0)
+	_pending_move = (0, 0)
+	# exception that stopped the worker thread, raised again by close()
+	_worker_error = None
+	# longest time the renderer waits for a new generation before handling events again
+	_render_wait = 1/120
+	# fps and generations per second are printed every this many seconds
+	_report_interval = 5
+	_report_time = 0
+	_report_tick = 0
+	# generations per second measured over the last report interval
+	generations_per_second = 0
 	_last_frame = 0
 	_board = None
 	_frame_number = 0
-	_frame_time = 0
 	_min_loop_wait = 1
 	_last_loop_time = 0
 	_paused = False
 	_game_tick = 0
+	# game tick the simulation starts at, not 0 when resumed from a checkpoint
+	_start_tick = 0
+	# how long a single step takes, used to limit the steps run per frame
+	_step_time = 0
+	# at most this much time is spent stepping per frame when catching up
+	_max_step_time_per_frame = 1/30
+	# cycles.Cycle the board settled into, None until one is found or without cycle detection
+	cycle = None
+	_cycle_detector = None
+	# the step_n function writes the board hash of every generation into it
+	_hashes = None
+	# statistics of the latest generation (a STATS_DTYPE record), None until the first step or without statistics
+	stats = None
+	_collect_stats = False
+	# the step_n function writes the statistics of every generation into it
+	_stats = None
 
-	def __init__(self, width=None, height=None, display_size=None, board=None, step_function: callable = game_of_life_step) -> None:
+	def __init__(self, width=None, height=None, display_size=None, board=None, step_function: callable = game_of_life_step,
+			step_n_function: callable = None, unbounded=False, topology="bounded", rule=None,
+			checkpointer=None, threaded=False, detect_cycles=False, stop_on_cycle=False, show_stats=False) -> None:
 		self.step_function = step_function
+		# with threaded set the simulation runs in a worker thread and the renderer only shows
+		# the latest generation it published, the C step functions release the GIL while stepping
+		self.threaded = threaded
+		self._worker = None
+		self._frame_lock = threading.Lock()
+		self._frame_ready = threading.Event()
+		# buffers the published generations are copied into, handed back by the renderer
+		self._free_frames = []
+		# checkpoint.Checkpointer that writes the board in the background, None disables checkpoints
+		self.checkpointer = checkpointer
+		# an unbounded board grows whenever live cells get close to its edge, unless the step function
+		# keeps the cells itself and renders a window of them into the board (sparse.SparseStep),
+		# then the board keeps its size and the window moves along when the view leaves it.
+		# Cycle detection and checkpoints only see the window, like they only see the board
+		self.unbounded = unbounded
+		self._moves_window = unbounded and hasattr(step_function, 'move_window')
+		# on a torus the edges of the board wrap around instead of being a dead border
+		self.topology = topology
+		if topology == "torus" and unbounded:
+			raise ValueError('a torus can not be unbounded')
+		# life-like rule in B/S notation, None is conway's game of life
+		self.rule = rule
+		# the step functions only get the topology and rule when they are not the default,
+		# so that step functions without support for them keep working
+		self._step_kwargs = {}
+		if topology != "bounded":
+			self._step_kwargs['topology'] = topology
+		if rule is not None and get_rule(rule) != CONWAY:
+			# in B/S notation, which every step function reads, the C extension doesn't read S/B notation
+			self._step_kwargs['rule'] = str(get_rule(rule))
+		# runs several steps at once when the target rate is higher than the frame rate
+		if step_n_function is None:
+			step_n_function = get_step_n_function(step_function)
+		self.step_n_function = step_n_function
+		# population, births and deaths are gathered by the step kernels and shown in the window title,
+		# an unbounded board gets the bounds of its live cells from them when the step function supports them
+		self.show_stats = show_stats
+		self._collect_stats = show_stats or (unbounded and supports_stats(step_function))
+		# with cycle detection or statistics every step goes through step_n_function,
+		# which has to accept hashes and stats
+		self.stop_on_cycle = stop_on_cycle
+		if detect_cycles or stop_on_cycle:
+			self._cycle_detector = CycleDetector(generations_per_step=self._generations_per_step(),
+				**self._step_kwargs)
 		if board is not None:
 			self._width = board.shape[0]
 			self._height = board.shape[1]
@@ -55,7 +163,13 @@ class GameOfLifeSim:
 			self._display_size = (self._width, self._height)
 		else:
 			self._display_size = display_size
-		self._board = np.pad(self._board, 1, mode='constant', constant_values=0)
+		self._view_width = self._width
+		self._view_height = self._height
+		self._shown_size = (self._width, self._height)
+		if topology != "torus":
+			self._board = np.pad(self._board, 1, mode='constant', constant_values=0)
+		if self.unbounded:
+			self._live_bounds = self._find_live_bounds()
 		self.running = False
 		self.display = pygame.display.set_mode(size=self._display_size)
 		self._last_loop_time = time.time()
@@ -71,7 +185,7 @@ class GameOfLifeSim:
 	def get_prescaler(self):
 		"""Returns the prescaler that the board
 		needs to be scaled by to fit the screen"""
-		return min(self._display_size[0]/self._width, self._display_size[1]/self._height)
+		return min(self._display_size[0]/self._view_width, self._display_size[1]/self._view_height)
 
 	def handle_pygame_events(self):
 		for event in pygame.event.get():
@@ -89,7 +203,11 @@ class GameOfLifeSim:
 				if event.key == pygame.K_ESCAPE:
 					self.running = False
 				elif event.key == pygame.K_SPACE:
-					self._board = self.step_function(self._board)
+					if self.threaded:
+						with self._frame_lock:
+							self._requested_steps += 1
+					else:
+						self._advance(1)
 				elif event.key == pygame.K_COMMA:
 					self._min_loop_wait *= 2
 					print('Target fps: %3.3f' % (1/self._min_loop_wait))
@@ -114,60 +232,385 @@ class GameOfLifeSim:
 		close() should be called after the last call to loop()
 		"""
 		self.handle_pygame_events()
-		
-		# calculate the time since the last frame
-		tim = time.time()
-		delta_time = tim-self._last_loop_time
-		if delta_time > self._min_loop_wait and not self._paused:
-			self._board = self.step_function(self._board)
-			self._last_loop_time = self._last_loop_time + self._min_loop_wait
-			self._game_tick += 1
-
-		# size of the visible board in cells
-		calc_width = round(self._width*self._scale)
-		calc_height = round(self._height*self._scale)
-		# offset of the visible board in cells
-		calc_offset_x = round(self._offset_x*self._scale)
-		calc_offset_y = round(self._offset_y*self._scale)
-
-		# crop the board to the visible area
-		cropped_board = self._board[calc_offset_x:calc_offset_x+calc_width, calc_offset_y:calc_offset_y+calc_height]
-		# convert to surface of black and white pixels
-		surf = pygame.surfarray.make_surface(cropped_board*255)
-		# scale the surface to fit the screen
-		surf = pygame.transform.scale_by(surf, 1/(self._scale/self.get_prescaler()))
-		
-		# fill the screen with gray to prevent artifacts
-		self.display.fill((0,0,0))
+		self._report()
 
-		# draw the surface
-		self.display.blit(surf, (0,0), (0,0,self._display_size[0], self._display_size[1]))
+		if self.threaded:
+			board, origin = self._take_frame()
+			if board is None and not self._view_changed:
+				# nothing to redraw, wait a little for the next generation instead of spinning
+				self._frame_ready.wait(self._render_wait)
+				return self.running
+		else:
+			self._apply_requested_move()
+			# calculate the time since the last frame
+			tim = time.time()
+			delta_time = tim-self._last_loop_time
+			if delta_time > self._min_loop_wait and not self._paused:
+				self._run_due_steps(delta_time)
+			if not self._board_changed and not self._view_changed:
+				# nothing to redraw
+				return self.running
+			board = self._board if self._board_changed else None
+			origin = (self._origin_x, self._origin_y)
+		self._render(board, origin)
+		if self.show_stats and board is not None:
+			self._show_stats()
+		if self.threaded and board is not None:
+			# the board was copied into the board surface, the buffer can be reused
+			with self._frame_lock:
+				self._free_frames.append(board)
 
-		# wait for the next frame, if necessary
-		tim = time.time()
-		self._last_frame = tim
-		#self.frame_time += delta_time
+		self._last_frame = time.time()
 		self._frame_number += 1
-		if self._frame_number == 1000:
-			print('fps: %3.3f' % (self._frame_number/(tim-self._frame_time)))
-			self._frame_number = 0
-			self._frame_time = tim
 
 		pygame.display.update()
 		return self.running
 
+	def _report(self):
+		"""Prints the frame rate and the simulation throughput every report interval"""
+		tim = time.time()
+		if tim-self._report_time < self._report_interval:
+			return
+		if self._report_time:
+			elapsed = tim-self._report_time
+			self.generations_per_second = (self._game_tick-self._report_tick)/elapsed
+			report = 'fps: %3.3f, generations/s: %3.3f' % (self._frame_number/elapsed, self.generations_per_second)
+			if self.show_stats and self.stats is not None:
+				report += ', population: %d' % self.stats['population']
+			print(report)
+		self._frame_number = 0
+		self._report_time = tim
+		self._report_tick = self._game_tick
+
+	def _show_stats(self):
+		"""Shows the generation and the statistics of the latest step in the window title"""
+		stats = self.stats
+		if stats is None:
+			return
+		pygame.display.set_caption('generation %d, population %d, births %d, deaths %d' % (
+			self._game_tick, stats['population'], stats['births'], stats['deaths']))
+
+	def _simulate(self):
+		"""Runs the simulation in the worker thread until the simulation stops
+
+		After every batch of steps the board is published for the renderer,
+		generations are dropped while the renderer hasn't taken the last one yet.
+		"""
+		try:
+			self._simulate_until_stopped()
+		except BaseException as error:
+			self._worker_error = error
+			self.running = False
+
+	def _simulate_until_stopped(self):
+		unpublished = False
+		while self.running:
+			with self._frame_lock:
+				requested, self._requested_steps = self._requested_steps, 0
+			if self._apply_requested_move():
+				unpublished = True
+			delta_time = time.time()-self._last_loop_time
+			if requested:
+				self._advance(requested)
+			elif delta_time > self._min_loop_wait and not self._paused:
+				self._run_due_steps(delta_time)
+			else:
+				if unpublished:
+					unpublished = not self._publish()
+				time.sleep(min(max(self._min_loop_wait-delta_time, 0), 0.005) if not self._paused else 0.005)
+				continue
+			unpublished = not self._publish()
+
+	def _publish(self) -> bool:
+		"""Copies the board into the frame slot, unless the renderer hasn't taken the last frame
+
+		Returns whether the board was published
+		"""
+		with self._frame_lock:
+			if self._frame is not None:
+				return False
+			buffer = self._free_frames.pop() if self._free_frames else None
+		if buffer is None or buffer.shape != self._board.shape:
+			buffer = np.empty(self._board.shape, dtype=np.uint8)
+		np.copyto(buffer, self._board, casting='unsafe')
+		with self._frame_lock:
+			# the origin is published with the board, its size is the shape of the buffer
+			self._frame = (buffer, (self._origin_x, self._origin_y))
+		self._frame_ready.set()
+		return True
+
+	def _take_frame(self):
+		"""Takes the latest published generation and its origin, (None, None) if there is no new one"""
+		with self._frame_lock:
+			frame, self._frame = self._frame, None
+			self._frame_ready.clear()
+		return frame if frame is not None else (None, None)
+
+	def _palette_surface(self, size):
+		"""Returns an 8 bit surface that shows cells with the value 0 as black and 1 as white"""
+		surface = pygame.Surface(size, 0, 8)
+		surface.set_palette([(0, 0, 0), (255, 255, 255)] + [(0, 0, 0)]*254)
+		return surface
+
+	def _render(self, board, origin):
+		"""Draws the visible part of the board onto the display
+
+		The board is copied into the persistent board surface only if it changed (board is None otherwise),
+		the visible part is scaled into a reused surface, so no surfaces are allocated between frames
+		unless the board grows or the zoom changes.
+		"""
+		if board is not None:
+			if self._shown_origin is None:
+				self._shown_origin = origin
+			border = 0 if self.topology == "torus" else 2
+			self._shown_size = (board.shape[0]-border, board.shape[1]-border)
+			if origin != self._shown_origin:
+				# keep the same cells in view after the board grew to the left or top, or the window moved
+				self._offset_x += (origin[0]-self._shown_origin[0])/self._scale
+				self._offset_y += (origin[1]-self._shown_origin[1])/self._scale
+				if self._moves_window:
+					self._pending_move = (self._pending_move[0]-(self._shown_origin[0]-origin[0]),
+						self._pending_move[1]-(self._shown_origin[1]-origin[1]))
+				self._shown_origin = origin
+				self.clamp_offset()
+			if self._board_surface is None or self._board_surface.get_size() != board.shape:
+				self._board_surface = self._palette_surface(board.shape)
+				self._view_changed = True
+			pygame.surfarray.blit_array(self._board_surface, board)
+		elif self._board_surface is None:
+			return
+
+		# offset of the visible board in cells, the view can be ahead of the shown board while it grows
+		# or while the window it moved to isn't drawn yet
+		board_width, board_height = self._board_surface.get_size()
+		calc_offset_x = min(max(0, round(self._offset_x*self._scale)), board_width-1)
+		calc_offset_y = min(max(0, round(self._offset_y*self._scale)), board_height-1)
+		# size of the visible board in cells, rounding must not leave the board
+		calc_width = min(round(self._view_width*self._scale), board_width-calc_offset_x)
+		calc_height = min(round(self._view_height*self._scale), board_height-calc_offset_y)
+		# crop the board to the visible area, a subsurface shares the pixels of the board surface
+		cropped = self._board_surface.subsurface((calc_offset_x, calc_offset_y, calc_width, calc_height))
+		# scale the visible area to fit the screen
+		factor = self.get_prescaler()/self._scale
+		scaled_size = (max(1, round(calc_width*factor)), max(1, round(calc_height*factor)))
+		if self._scaled_surface is None or self._scaled_surface.get_size() != scaled_size:
+			self._scaled_surface = self._palette_surface(scaled_size)
+		pygame.transform.scale(cropped, scaled_size, self._scaled_surface)
+
+		if self._view_changed:
+			# fill the screen with black to prevent artifacts
+			self.display.fill((0,0,0))
+		# draw the surface
+		self.display.blit(self._scaled_surface, (0,0), (0,0,self._display_size[0], self._display_size[1]))
+		self._board_changed = False
+		self._view_changed = False
+
+	def _run_due_steps(self, delta_time):
+		"""Runs all the steps that should have happened since the last step
+
+		Steps are batched into a single call of the step_n function,
+		as many as fit into the time budget of a frame, the rest are dropped
+		"""
+		steps = int(delta_time // self._min_loop_wait)
+		max_steps = max(1, int(self._max_step_time_per_frame/self._step_time)) if self._step_time > 0 else 1
+		start_time = time.perf_counter()
+		if steps > max_steps:
+			# the simulation can't keep up, don't try to catch up later
+			steps = max_steps
+			self._last_loop_time = time.time()
+		else:
+			self._last_loop_time = self._last_loop_time + steps*self._min_loop_wait
+		steps = self._advance(steps)
+		self._step_time = (time.perf_counter()-start_time)/max(steps, 1)
+
+	def _advance(self, steps):
+		"""Runs the given amount of steps, making room for them first on an unbounded board
+
+		Returns the amount of steps that were run
+		"""
+		if self.unbounded and not self._moves_window:
+			self._ensure_room(steps*self._generations_per_step())
+		# the hashes and statistics of the generations are gathered by the step_n function while stepping
+		outputs = {}
+		if self._cycle_detector is not None:
+			self._hashes = self._output_buffer(self._hashes, steps, np.uint64)
+			outputs['hashes'] = self._hashes
+		if self._collect_stats:
+			self._stats = self._output_buffer(self._stats, steps, STATS_DTYPE)
+			outputs['stats'] = self._stats
+		first_generation = self._game_tick + self._generations_per_step()
+		if steps > 1 or outputs:
+			self._board, steps = self.step_n_function(self._board, steps, **outputs, **self._step_kwargs)
+		else:
+			self._board = self.step_function(self._board, **self._step_kwargs)
+		self._game_tick += steps*self._generations_per_step()
+		self._board_changed = True
+		if self._collect_stats:
+			self.stats = self._stats[steps-1].copy()
+		if self._cycle_detector is not None:
+			self._observe_cycles(first_generation, steps)
+		if self.unbounded and not self._moves_window:
+			self._live_bounds = self._stats_live_bounds() if self._collect_stats else self._find_live_bounds()
+		if self.checkpointer is not None and self.checkpointer.is_due(self._game_tick):
+			self.save_checkpoint()
+		return steps
+
+	@staticmethod
+	def _output_buffer(buffer, steps, dtype):
+		"""Returns the buffer if it has room for the given amount of steps, a new one otherwise"""
+		if buffer is None or buffer.size < steps:
+			buffer = np.zeros(max(steps, 64), dtype=dtype)
+		return buffer
+
+	def _observe_cycles(self, first_generation, steps):
+		"""Hands the hashes of the last steps to the cycle detector, pauses on a new cycle if stop_on_cycle is set"""
+		if self.cycle is None:
+			self.cycle = self._cycle_detector.observe_hashes(self._board, self._hashes[:steps], first_generation)
+			if self.cycle is not None:
+				print(str(self.cycle).capitalize())
+				if self.stop_on_cycle:
+					self._paused = True
+
+	def _stats_live_bounds(self):
+		"""Bounds of the live cells like _find_live_bounds, from the statistics of the last step"""
+		if self.stats['population'] == 0:
+			return None
+		return (int(self.stats['x_min']), int(self.stats['x_max']), int(self.stats['y_min']), int(self.stats['y_max']))
+
+	def save_checkpoint(self):
+		"""Hands a copy of the board to the checkpointer, without the dead border"""
+		board = self._board if self.topology == "torus" else self._board[1:-1, 1:-1]
+		self.checkpointer.checkpoint(board, self._game_tick, rule=self.rule, topology=self.topology,
+			unbounded=self.unbounded, origin=[int(self._origin_x), int(self._origin_y)])
+
+	@classmethod
+	def resume(cls, directory, display_size=None, step_function: callable = game_of_life_step,
+			step_n_function: callable = None, checkpointer=None) -> 'GameOfLifeSim':
+		"""Creates a simulation from the newest checkpoint in the directory
+
+		The generation, rule, topology and unbounded mode are restored from the checkpoint
+		"""
+		file_name = latest_checkpoint(directory)
+		if file_name is None:
+			raise FileNotFoundError('no checkpoint in %s' % directory)
+		board, metadata = load_checkpoint(file_name)
+		sim = cls(display_size=display_size, board=board, step_function=step_function, step_n_function=step_n_function,
+			unbounded=metadata.get('unbounded', False), topology=metadata.get('topology', "bounded"),
+			rule=metadata.get('rule'), checkpointer=checkpointer)
+		sim._start_tick = sim._game_tick = metadata['generation']
+		sim._origin_x, sim._origin_y = metadata.get('origin', (0, 0))
+		return sim
+
+	def _find_live_bounds(self):
+		"""Returns (x_min, x_max, y_min, y_max) of the live cells on the board, None if there are none"""
+		xs = np.flatnonzero(self._board.any(axis=1))
+		if xs.size == 0:
+			return None
+		# only the rows that contain live cells have to be searched for the columns
+		ys = np.flatnonzero(self._board[xs[0]:xs[-1]+1].any(axis=0))
+		return (xs[0], xs[-1], ys[0], ys[-1])
+
+	def _ensure_room(self, generations):
+		"""Grows the board so that the live cells can't reach the dead border in the given amount of generations
+
+		Cells spread at most one cell per generation, the board grows by at least half its size
+		on every side that is too close, so reallocations get rarer as the pattern grows.
+		"""
+		if self._live_bounds is None:
+			return
+		x_min, x_max, y_min, y_max = self._live_bounds
+		room = generations + self._grow_margin
+		shape = self._board.shape
+		def grow_by(size, low, high):
+			if low > room and high < size-1-room:
+				return (0, 0)
+			amount = max(size//2, room)
+			return (amount if low <= room else 0, amount if high >= size-1-room else 0)
+		left, right = grow_by(shape[0], x_min, x_max)
+		top, bottom = grow_by(shape[1], y_min, y_max)
+		if left == right == top == bottom == 0:
+			return
+		board = np.zeros((shape[0]+left+right, shape[1]+top+bottom), dtype=self._board.dtype)
+		board[left:left+shape[0], top:top+shape[1]] = self._board
+		self._board = board
+		self._width += left+right
+		self._height += top+bottom
+		self._origin_x += left
+		self._origin_y += top
+		self._live_bounds = (x_min+left, x_max+left, y_min+top, y_max+top)
+		# the view follows the origin when this board is drawn, see _render
+
+	def _move_window_to_view(self):
+		"""Requests a move of the window once the view leaves it, so that the view is centered in it afterwards
+
+		Called by the renderer, the offset isn't clamped, the window catches up with it instead
+		"""
+		width, height = self._shown_size
+		def move_by(offset, pending, size, view_size):
+			# offset of the view in the window after the moves that weren't drawn yet
+			offset = offset - pending
+			if 0 <= offset <= size-view_size:
+				return 0
+			return round(offset - (size-view_size)/2)
+		dx = move_by(self._offset_x*self._scale, self._pending_move[0], width, self._view_width*self._scale)
+		dy = move_by(self._offset_y*self._scale, self._pending_move[1], height, self._view_height*self._scale)
+		if dx == dy == 0:
+			return
+		self._pending_move = (self._pending_move[0]+dx, self._pending_move[1]+dy)
+		with self._frame_lock:
+			self._requested_move = (self._requested_move[0]+dx, self._requested_move[1]+dy)
+
+	def _apply_requested_move(self):
+		"""Moves the window by the moves the renderer requested, returns whether it moved"""
+		with self._frame_lock:
+			(dx, dy), self._requested_move = self._requested_move, (0, 0)
+		if dx == dy == 0:
+			return False
+		self._board = self.step_function.move_window(self._board, dx, dy)
+		self._origin_x -= dx
+		self._origin_y -= dy
+		self._board_changed = True
+		if self._cycle_detector is not None and self.cycle is None:
+			# the hashes seen so far are those of another window
+			self._cycle_detector.reset()
+			self._cycle_detector.observe(self._board, self._game_tick)
+		return True
+
+	def _generations_per_step(self):
+		"""Amount of generations a single call of the step function advances, more than 1 for HashLife"""
+		return getattr(self.step_function, 'generations_per_call', 1)
+
 	def _init(self):
 		"""Initializes pygame and the game of life simulation"""
 		pygame.init()
 		self.display = pygame.display.set_mode(size=self._display_size)
 		self._last_frame = time.time()
+		self._view_changed = True
 		self.running = True
-		self._game_tick = 0
+		self._game_tick = self._start_tick
+		if self.checkpointer is not None:
+			self.checkpointer.reset(self._game_tick)
+		if self._cycle_detector is not None:
+			self._cycle_detector.reset()
+			self.cycle = self._cycle_detector.observe(self._board, self._game_tick)
+		self._last_loop_time = time.time()
+		if self.threaded:
+			self._publish()
+			self._worker = threading.Thread(target=self._simulate, name='simulation', daemon=True)
+			self._worker.start()
 	
 	def _close(self):
 		"""Closes pygame and the game of life simulation"""
-		pygame.quit()
 		self.running = False
+		if self._worker is not None:
+			self._worker.join()
+			self._worker = None
+		pygame.quit()
+		if self.checkpointer is not None:
+			self.checkpointer.close()
+		if self._worker_error is not None:
+			error, self._worker_error = self._worker_error, None
+			raise RuntimeError('the simulation thread failed') from error
 
 
 	def start(self):
@@ -193,16 +636,23 @@ class GameOfLifeSim:
 	def clamp_offset(self):
 		"""Clamps the offset to the visible area
 		This is necessary to constrain the surface to the screen,
-		otherwise not all of the pixels would be redrawn, resulting in artifacts
+		otherwise not all of the pixels would be redrawn, resulting in artifacts.
+		A window that moves along with the view is moved instead.
 		"""
+		if self._moves_window:
+			self._move_window_to_view()
+			self._view_changed = True
+			return
 		self._offset_x = max(0, self._offset_x)
 		self._offset_y = max(0, self._offset_y)
 		cell_offset_x = self._offset_x*self._scale
 		cell_offset_y = self._offset_y*self._scale
-		cell_offset_x = min(cell_offset_x, self._width-self._width*self._scale)
-		cell_offset_y = min(cell_offset_y, self._height-self._height*self._scale)
+		# the shown board, the board of the worker thread may have grown since it was drawn
+		cell_offset_x = min(cell_offset_x, self._shown_size[0]-self._view_width*self._scale)
+		cell_offset_y = min(cell_offset_y, self._shown_size[1]-self._view_height*self._scale)
 		self._offset_x = (cell_offset_x/self._scale)
 		self._offset_y = (cell_offset_y/self._scale)
+		self._view_changed = True
 
 
 	def zoom_in(self, pos):
@@ -240,3 +690,7 @@ class GameOfLifeSim:
 	def get_current_tick(self):
 		"""Returns the current game tick"""
 		return self._game_tick
+
+	def get_origin(self):
+		"""Returns the board index of the cell that was at (0, 0) when the simulation started"""
+		return (self._origin_x, self._origin_y)
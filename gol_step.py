@@ -1,102 +1,394 @@
 
+import functools
+import hashlib
 import numpy as np
+from rules import get_rule, rule_table
+from hashlife import HashLifeStep
+from sparse import SparseStep
 
-def gol_py_slooow(board:np.ndarray) -> np.ndarray:
+# "bounded" boards have a dead border that is never changed, on a "torus" the edges wrap around
+TOPOLOGIES = ("bounded", "torus")
+
+# statistics of a generation, the same layout as GOL.STATS_DTYPE
+# the bounding box of the live cells includes both ends and is -1 if there are none
+STATS_DTYPE = np.dtype([
+	('population', np.int64),
+	('births', np.int64),
+	('deaths', np.int64),
+	('x_min', np.int64),
+	('x_max', np.int64),
+	('y_min', np.int64),
+	('y_max', np.int64),
+])
+
+def _is_torus(topology:str) -> bool:
+	if topology not in TOPOLOGIES:
+		raise ValueError("Topology must be 'bounded' or 'torus'")
+	return topology == "torus"
+
+def gol_py_slooow(board:np.ndarray, topology:str="bounded", rule=None) -> np.ndarray:
 	l = board.tolist()
+	table = rule_table(rule).tolist()
 	lout = [[0 for x in range(len(l[0]))] for y in range(len(l))]
-	for x in range(1, len(l)-1):
-		for y in range(1, len(l[x])-1):
+	border = 0 if _is_torus(topology) else 1
+	width, height = len(l), len(l[0])
+	for x in range(border, width-border):
+		for y in range(border, height-border):
+			# the indices only wrap around on a torus, the border cells are skipped otherwise
+			xm, xp = (x-1) % width, (x+1) % width
+			ym, yp = (y-1) % height, (y+1) % height
 			conv_sum = (
-				l[x-1][y-1] + l[x-1][y] + l[x-1][y+1] + 
-				l[x][y-1] + l[x][y+1] +
-				l[x+1][y-1] + l[x+1][y] + l[x+1][y+1])
-			lout[x][y] = l[x][y]
-			if l[x][y] == 1:
-				if conv_sum != 2 and conv_sum != 3:
-					lout[x][y] = 0
-			else:
-				if conv_sum == 3:
-					lout[x][y] = 1
+				l[xm][ym] + l[xm][y] + l[xm][yp] + 
+				l[x][ym] + l[x][yp] +
+				l[xp][ym] + l[xp][y] + l[xp][yp])
+			lout[x][y] = table[(l[x][y] == 1)*9 + conv_sum]
 	return np.array(lout, dtype=np.uint8)
 
-def gol_py_trivial(board:np.ndarray) -> np.ndarray:
+def gol_py_trivial(board:np.ndarray, topology:str="bounded", rule=None) -> np.ndarray:
 	"""This is the trivial implementation of the game of life, it is very slow
 
 	It is included for comparison purposes only
 	"""
 	next_board = np.array(board, dtype=np.uint8)
-	for x in range(1, board.shape[0]-1):
-		for y in range(1, board.shape[1]-1):
+	table = rule_table(rule)
+	border = 0 if _is_torus(topology) else 1
+	width, height = board.shape
+	for x in range(border, width-border):
+		for y in range(border, height-border):
+			xm, xp = (x-1) % width, (x+1) % width
+			ym, yp = (y-1) % height, (y+1) % height
 			conv_sum = (
-				board[x-1,y-1] + board[x-1,y] + board[x-1,y+1] +
-				board[x,y-1] + board[x,y+1] +
-				board[x+1,y-1] + board[x+1,y] + board[x+1,y+1]
+				board[xm,ym] + board[xm,y] + board[xm,yp] +
+				board[x,ym] + board[x,yp] +
+				board[xp,ym] + board[xp,y] + board[xp,yp]
 			)
-			next_board[x,y] = board[x,y]
-			if board[x,y] == 1:
-				if conv_sum != 2 and conv_sum != 3:
-					next_board[x,y] = 0
-			else:
-				if conv_sum == 3:
-					next_board[x,y] = 1
+			next_board[x,y] = table[(board[x,y] == 1)*9 + conv_sum]
 	return next_board
 
-def gol_py_simple(board:np.ndarray) -> np.ndarray:
+def _torus_neighbour_counts(board:np.ndarray) -> np.ndarray:
+	"""Returns the amount of alive neighbours of every cell with the edges wrapping around
+
+	The wrapped cells are added from slices of the board, so the board is never padded.
+	"""
+	# one byte boards are read as uint8 without a copy, so that the sums can be done in place
+	board = board.view(np.uint8) if board.dtype.itemsize == 1 else board.astype(np.uint8)
+	# sums of the 3 cells in the same column, the first and last column wrap around
+	partial = np.empty(board.shape, dtype=np.uint8)
+	np.add(board[:, :-2], board[:, 1:-1], out=partial[:, 1:-1])
+	partial[:, 1:-1] += board[:, 2:]
+	partial[:, 0] = board[:, -1] + board[:, 0] + board[:, 1]
+	partial[:, -1] = board[:, -2] + board[:, -1] + board[:, 0]
+	# sums of the 3 partial sums in the same row, the first and last row wrap around
+	conv_sum = np.empty(board.shape, dtype=np.uint8)
+	np.add(partial[:-2], partial[1:-1], out=conv_sum[1:-1])
+	conv_sum[1:-1] += partial[2:]
+	conv_sum[0] = partial[-1] + partial[0] + partial[1]
+	conv_sum[-1] = partial[-2] + partial[-1] + partial[0]
+	conv_sum -= board
+	return conv_sum
+
+def gol_py_stats(previous:np.ndarray, board:np.ndarray, topology:str="bounded", stats:np.ndarray=None) -> np.ndarray:
+	"""Statistics of the step from previous to board, written to stats[0] (a STATS_DTYPE array)
+
+	Like in the C kernels only the cells that are stepped are counted.
+	Returns stats, a new array if it is not given.
+	"""
+	if stats is None:
+		stats = np.zeros(1, dtype=STATS_DTYPE)
+	border = 0 if _is_torus(topology) else 1
+	cells = (slice(border, board.shape[0]-border), slice(border, board.shape[1]-border))
+	alive = board[cells] != 0
+	was_alive = previous[cells] != 0
+	changed = alive != was_alive
+	births = np.count_nonzero(changed & alive)
+	xs = np.flatnonzero(alive.any(axis=1))
+	if xs.size == 0:
+		bounds = (-1, -1, -1, -1)
+	else:
+		ys = np.flatnonzero(alive[xs[0]:xs[-1]+1].any(axis=0))
+		bounds = (xs[0]+border, xs[-1]+border, ys[0]+border, ys[-1]+border)
+	stats[0] = (np.count_nonzero(alive), births, np.count_nonzero(changed)-births) + bounds
+	return stats
+
+def _apply_rule(board:np.ndarray, conv_sum:np.ndarray, rule, topology:str="bounded", stats:np.ndarray=None) -> np.ndarray:
+	"""Sets every cell to its next state, looked up by alive*9+neighbours in the rule table
+
+	If stats is given, the statistics of the step are written to it before the board is overwritten
+	"""
+	index = (board == 1).view(np.uint8) * np.uint8(9)
+	np.add(index, conv_sum, out=index, casting='unsafe')
+	if stats is None:
+		board[...] = rule_table(rule)[index]
+	else:
+		next_board = rule_table(rule)[index]
+		gol_py_stats(board, next_board, topology, stats)
+		board[...] = next_board
+	return board
+
+def gol_py_simple(board:np.ndarray, topology:str="bounded", rule=None, stats:np.ndarray=None) -> np.ndarray:
 	"""This is the old version of the neighbour summation, it is slower but slightly easier to understand"""
 		
-	# create a 4d array with the 3x3 neighborhood of each cell in the board
-	# This is just a view of the board, so no additional memory is used
-	conv = np.lib.stride_tricks.as_strided(board, shape=(board.shape[0]-2, board.shape[1]-2,3,3),
-		strides=(board.strides[0], board.strides[1], board.strides[0], board.strides[1]))
-	# sum the neighborhood of each cell resulting in a 2d array with the amount of neighbors of each cell
-	conv_sum = np.pad(np.sum(conv, axis=(2,3)) - board[1:-1,1:-1], 1, mode='constant', constant_values=0)
+	if _is_torus(topology):
+		conv_sum = _torus_neighbour_counts(board)
+	else:
+		# create a 4d array with the 3x3 neighborhood of each cell in the board
+		# This is just a view of the board, so no additional memory is used
+		conv = np.lib.stride_tricks.as_strided(board, shape=(board.shape[0]-2, board.shape[1]-2,3,3),
+			strides=(board.strides[0], board.strides[1], board.strides[0], board.strides[1]))
+		# sum the neighborhood of each cell resulting in a 2d array with the amount of neighbors of each cell
+		conv_sum = np.pad(np.sum(conv, axis=(2,3)) - board[1:-1,1:-1], 1, mode='constant', constant_values=0)
 	
 	# apply the game of life rules
-	alive = board == 1
-	is_three = conv_sum == 3
-	is_two = conv_sum == 2
-	board[alive & (np.logical_not(is_two | is_three))] = 0
-	board[np.logical_not(alive) & is_three] = 1
-	return board
+	return _apply_rule(board, conv_sum, rule, topology, stats)
 
 
-def gol_py_partial_sums(board:np.ndarray) -> np.ndarray:
+def gol_py_partial_sums(board:np.ndarray, topology:str="bounded", rule=None, stats:np.ndarray=None) -> np.ndarray:
 	"""This is the new version of the neighbour summation, it is faster but slightly harder to understand"""
 
-	# create a 3d array with the 3x1 neighborhood of each non-border cell in the board
-	conv = np.lib.stride_tricks.as_strided(board, shape=(board.shape[0]-2, board.shape[1],3),
-		strides=(board.strides[0], board.strides[1], board.strides[0]))
-	# sum the neighborhood of each cell resulting in a 2d array with the amount of alive horizontal neighbors of each cell
-	conv_sum: np.ndarray = np.sum(conv, axis=2, dtype=np.uint8)
-	assert isinstance(conv_sum, np.ndarray)
-	# create a 3d array with the 3x3 neighborhood of each non-border cell in the board
-	# because we already have the horizontal neighbors, the 1x3 neighborhood represents the whole 3x3 neighborhood
-	conv_sum = np.lib.stride_tricks.as_strided(conv_sum, shape=(conv_sum.shape[0],conv_sum.shape[1]-2,3),
-		strides=(conv_sum.strides[0], conv_sum.strides[1], conv_sum.strides[1]))
-	
-	# sum the neighborhood of each cell resulting in a 2d array with the amount of total alive neighbors of each cell
-	conv_sum = np.pad(np.sum(conv_sum, axis=2) - board[1:-1,1:-1], 1, mode='constant', constant_values=0)
+	if _is_torus(topology):
+		conv_sum = _torus_neighbour_counts(board)
+	else:
+		# create a 3d array with the 3x1 neighborhood of each non-border cell in the board
+		conv = np.lib.stride_tricks.as_strided(board, shape=(board.shape[0]-2, board.shape[1],3),
+			strides=(board.strides[0], board.strides[1], board.strides[0]))
+		# sum the neighborhood of each cell resulting in a 2d array with the amount of alive horizontal neighbors of each cell
+		conv_sum: np.ndarray = np.sum(conv, axis=2, dtype=np.uint8)
+		assert isinstance(conv_sum, np.ndarray)
+		# create a 3d array with the 3x3 neighborhood of each non-border cell in the board
+		# because we already have the horizontal neighbors, the 1x3 neighborhood represents the whole 3x3 neighborhood
+		conv_sum = np.lib.stride_tricks.as_strided(conv_sum, shape=(conv_sum.shape[0],conv_sum.shape[1]-2,3),
+			strides=(conv_sum.strides[0], conv_sum.strides[1], conv_sum.strides[1]))
+		
+		# sum the neighborhood of each cell resulting in a 2d array with the amount of total alive neighbors of each cell
+		conv_sum = np.pad(np.sum(conv_sum, axis=2) - board[1:-1,1:-1], 1, mode='constant', constant_values=0)
 	
 	# apply the game of life rules
-	alive = board == 1
-	is_three = conv_sum == 3
-	is_two = conv_sum == 2
-	board[alive & (np.logical_not(is_two | is_three))] = 0
-	board[np.logical_not(alive) & is_three] = 1
-	return board
+	return _apply_rule(board, conv_sum, rule, topology, stats)
+
+def gol_py_tiled(board:np.ndarray, scratch:np.ndarray, active:np.ndarray, tile_size:int,
+		topology:str="bounded", rule=None) -> int:
+	"""Steps the board in place, only calculating the tiles that can change
+
+	active has a flag for every tile that changed in the previous step, it is updated for the next step.
+	scratch is a board sized array the new tiles are written to before they are copied back.
+	Returns the amount of tiles that were calculated.
+	"""
+	torus = _is_torus(topology)
+	border = 0 if torus else 1
+	table = rule_table(rule)
+	# a tile can only change if it or one of its neighbours changed,
+	# on a torus the tiles on opposite edges are neighbours
+	padded = np.pad(active, 1, mode='wrap' if torus else 'constant')
+	work = np.zeros(active.shape, dtype=bool)
+	for dx in range(3):
+		for dy in range(3):
+			work |= padded[dx:dx+active.shape[0], dy:dy+active.shape[1]] != 0
+	active[...] = 0
+	tiles = np.argwhere(work)
+	regions = []
+	for tx, ty in tiles:
+		# the tile without the border cells of the board
+		x0, x1 = max(tx*tile_size, border), min((tx+1)*tile_size, board.shape[0]-border)
+		y0, y1 = max(ty*tile_size, border), min((ty+1)*tile_size, board.shape[1]-border)
+		if x0 >= x1 or y0 >= y1:
+			continue
+		if torus:
+			# the ring of cells around the tile, wrapping around the edges
+			xs = np.arange(x0-1, x1+1) % board.shape[0]
+			ys = np.arange(y0-1, y1+1) % board.shape[1]
+			neighbours = board[np.ix_(xs, ys)].astype(np.uint8)
+		else:
+			neighbours = (board[x0-1:x1+1, y0-1:y1+1]).astype(np.uint8)
+		counts = (
+			neighbours[:-2, :-2] + neighbours[:-2, 1:-1] + neighbours[:-2, 2:] +
+			neighbours[1:-1, :-2] + neighbours[1:-1, 2:] +
+			neighbours[2:, :-2] + neighbours[2:, 1:-1] + neighbours[2:, 2:])
+		alive = board[x0:x1, y0:y1] == 1
+		scratch[x0:x1, y0:y1] = table[alive*9 + counts]
+		if np.any(scratch[x0:x1, y0:y1] != board[x0:x1, y0:y1]):
+			active[tx, ty] = 1
+			regions.append((x0, x1, y0, y1))
+	# copy back after all the tiles are calculated from the old board
+	for x0, x1, y0, y1 in regions:
+		board[x0:x1, y0:y1] = scratch[x0:x1, y0:y1]
+	return len(tiles)
+
+def gol_py_board_hash(board:np.ndarray, topology:str="bounded") -> int:
+	"""64 bit hash of the cells that are stepped, the dead border of a bounded board is left out"""
+	cells = board if _is_torus(topology) else board[1:-1, 1:-1]
+	digest = hashlib.blake2b(np.ascontiguousarray(cells).view(np.uint8), digest_size=8)
+	digest.update(np.array(board.shape, dtype=np.int64).tobytes())
+	return int.from_bytes(digest.digest(), 'little')
+
+def gol_py_step_n(board:np.ndarray, n:int, step_function:callable=gol_py_partial_sums,
+		stop_when_stable:bool=False, hashes:np.ndarray=None, stats:np.ndarray=None, **kwargs) -> tuple:
+	"""Runs n steps with the given step function
+
+	If stop_when_stable is set, it stops early once a step does not change the board.
+	If hashes is given, the board_hash of every generation is written to it.
+	If stats is a STATS_DTYPE array, the statistics of every generation are written to it,
+	by the step function if it supports_stats, from a comparison with the previous board otherwise.
+	Other keyword arguments (like topology) are passed on to the step function.
+	Returns the board and the amount of steps that were run.
+	"""
+	compare_stats = stats is not None and not supports_stats(step_function)
+	# a single scratch board is reused for comparing, instead of copying every step
+	previous = np.empty_like(board) if stop_when_stable or compare_stats else None
+	for generation in range(n):
+		if previous is not None:
+			np.copyto(previous, board)
+		if stats is not None and not compare_stats:
+			board = step_function(board, stats=stats[generation:generation+1], **kwargs)
+		else:
+			board = step_function(board, **kwargs)
+		if compare_stats:
+			gol_py_stats(previous, board, kwargs.get('topology', "bounded"), stats[generation:generation+1])
+		if hashes is not None:
+			hashes[generation] = board_hash(board, kwargs.get('topology', "bounded"))
+		if stop_when_stable and np.array_equal(previous, board):
+			return board, generation+1
+	return board, n
+
+@functools.lru_cache(maxsize=64)
+def _c_rule(rule):
+	"""The C extension only reads B/S notation, rules in S/B notation or Rule objects are converted to it"""
+	return None if rule is None else str(get_rule(rule))
 
 # attempt to import the C extension
 try:
 	import GOL
-	gol_c_numpy_api: callable(np.ndarray) = GOL.step_NpArr
-	def gol_c_pylist_multithread(arr:np.ndarray) -> np.ndarray:
-		listed = arr.tolist()
-		GOL.step_list_multithread(listed)
-		return np.array(listed, dtype=np.uint8)
+	def gol_c_numpy_api(arr:np.ndarray, topology:str="bounded", rule=None, **kwargs) -> np.ndarray:
+		"""Steps the board with GOL.step_NpArr, the other keyword arguments are passed on"""
+		return GOL.step_NpArr(arr, topology, _c_rule(rule), **kwargs)
+	def gol_c_numpy_multithread(arr:np.ndarray, topology:str="bounded", rule=None, **kwargs) -> np.ndarray:
+		"""Steps the board with GOL.step_NpArr_multithread, the other keyword arguments are passed on"""
+		return GOL.step_NpArr_multithread(arr, topology, _c_rule(rule), **kwargs)
+	def gol_c_pylist_multithread(arr:np.ndarray, topology:str="bounded", rule=None) -> np.ndarray:
+		"""Steps the board with the list kernel, which takes the array's buffer directly instead of a list"""
+		return GOL.step_list_multithread(np.ascontiguousarray(arr, dtype=np.uint8), topology, _c_rule(rule))
+	def gol_c_bitpacked(arr:np.ndarray, topology:str="bounded", rule=None) -> np.ndarray:
+		"""Steps the board using the bit-packed C kernel
+
+		The board is packed and unpacked every call,
+		for long runs keep a GOL.BitBoard around instead.
+		"""
+		board = GOL.BitBoard.from_array(arr, topology, _c_rule(rule))
+		board.step()
+		return board.to_array()
+	def gol_c_step_n(arr:np.ndarray, n:int, stop_when_stable:bool=False, multithread:bool=False,
+			topology:str="bounded", rule=None, **kwargs) -> tuple:
+		"""Runs n steps with GOL.step_n, the other keyword arguments are passed on"""
+		return GOL.step_n(arr, n, stop_when_stable, multithread, topology, _c_rule(rule), **kwargs)
+	def gol_c_tiled(board:np.ndarray, scratch:np.ndarray, active:np.ndarray, tile_size:int,
+			topology:str="bounded", rule=None) -> int:
+		"""Steps the board in place with GOL.step_tiled, see gol_py_tiled"""
+		return GOL.step_tiled(board, scratch, active, tile_size, topology=topology, rule=_c_rule(rule))
+	# the C step functions compute the same hash while stepping
+	board_hash: callable = GOL.board_hash
 	HAS_C_EXTENSION = True
 except ImportError:
 	print("C extension not found, using python implementation")
 	gol_c_numpy_api = gol_py_partial_sums
+	gol_c_numpy_multithread = gol_py_partial_sums
 	gol_c_pylist_multithread = gol_py_partial_sums
+	gol_c_bitpacked = gol_py_partial_sums
+	gol_c_step_n = gol_py_step_n
+	gol_c_tiled = gol_py_tiled
+	board_hash = gol_py_board_hash
 	HAS_C_EXTENSION = False
 
+
+class TiledStepper:
+	"""Step function that keeps track of which tiles of the board are active
+
+	Only tiles that changed in the previous step, or whose neighbours did, are calculated again,
+	so boards that settled into still lifes and blinkers are stepped much faster.
+	The board is stepped in place, if a different board is passed in, all tiles are active again.
+	"""
+	# amount of tiles calculated in the last step
+	active_tiles = 0
+
+	def __init__(self, tile_size:int=64, topology:str="bounded", rule=None) -> None:
+		self.tile_size = tile_size
+		self.topology = topology
+		self.rule = rule
+		self._board = None
+		self._scratch = None
+		self._active = None
+
+	def reset(self, board:np.ndarray):
+		"""Marks every tile as active, needed after the board was changed from outside"""
+		tiles = (-(-board.shape[0]//self.tile_size), -(-board.shape[1]//self.tile_size))
+		self._board = board
+		self._scratch = np.zeros(board.shape, dtype=board.dtype)
+		self._active = np.ones(tiles, dtype=np.uint8)
+
+	def __call__(self, board:np.ndarray, topology:str=None, rule=None) -> np.ndarray:
+		if topology is not None and topology != self.topology:
+			self.topology = topology
+			self._board = None
+		if rule is not None and rule != self.rule:
+			self.rule = rule
+			self._board = None
+		if board is not self._board:
+			if board.dtype.itemsize != 1 or not board.flags.c_contiguous:
+				board = np.ascontiguousarray(board, dtype=np.uint8)
+			self.reset(board)
+		self.active_tiles = gol_c_tiled(board, self._scratch, self._active, self.tile_size, topology=self.topology, rule=self.rule)
+		return board
+
+
+# step functions that take a stats argument (see STATS_DTYPE)
+_STATS_STEP_FUNCTIONS = {gol_py_simple, gol_py_partial_sums, gol_c_numpy_api, gol_c_numpy_multithread}
+
+# step functions by name, for choosing a backend from the command line or a config
+# without the C extension the C backends fall back to the python implementation
+BACKENDS = {
+	'py_slooow': gol_py_slooow,
+	'py_trivial': gol_py_trivial,
+	'py_simple': gol_py_simple,
+	'py_partial_sums': gol_py_partial_sums,
+	'c_numpy': gol_c_numpy_api,
+	'c_numpy_multithread': gol_c_numpy_multithread,
+	'c_pylist_multithread': gol_c_pylist_multithread,
+	'c_bitpacked': gol_c_bitpacked,
+	'tiled': TiledStepper,
+	'hashlife': HashLifeStep,
+	'sparse': SparseStep,
+}
+
+# backends with an unbounded universe, they ignore the dead border of a bounded board and step the cells on it,
+# so their boards only match the other backends while the pattern stays away from the edges
+UNBOUNDED_BACKENDS = ('hashlife', 'sparse')
+
+def get_backend(name:str) -> callable:
+	"""Returns the step function of a backend in BACKENDS
+
+	Stateful backends (tiled, hashlife, sparse) are classes, they get a new instance on every call
+	"""
+	if name not in BACKENDS:
+		raise ValueError('Unknown backend %r, must be one of %s' % (name, ', '.join(BACKENDS)))
+	backend = BACKENDS[name]
+	if isinstance(backend, type):
+		return backend()
+	return backend
+
+def supports_stats(step_function:callable) -> bool:
+	"""Returns whether the step function gathers the statistics of a step itself when given stats"""
+	return step_function in _STATS_STEP_FUNCTIONS
+
+def get_step_n_function(step_function:callable) -> callable:
+	"""Returns a function that runs n steps at once with the same kernel as step_function
+
+	The C kernels get the batched C implementation,
+	step functions with their own step_n method (like hashlife.HashLifeStep) use it,
+	every other step function is called in a loop.
+	"""
+	if hasattr(step_function, 'step_n'):
+		return step_function.step_n
+	if HAS_C_EXTENSION and step_function is gol_c_numpy_api:
+		return gol_c_step_n
+	if HAS_C_EXTENSION and step_function is gol_c_numpy_multithread:
+		return functools.partial(gol_c_step_n, multithread=True)
+	return functools.partial(gol_py_step_n, step_function=step_function)
+
@@ -0,0 +1,333 @@
+"""This module contains a HashLife engine for the game of life
+
+The universe is stored as a quadtree of canonical (hash-consed) nodes,
+so identical regions of the board are stored and simulated only once.
+The result of advancing a node is memoized, which lets structured patterns
+run for billions of generations in the time the dense engines need for a few.
+
+Unlike the dense step functions the universe is unbounded,
+cells that leave the exported window keep being simulated.
+"""
+import numpy as np
+from rules import get_rule, rule_table
+
+
+class Node:
+	"""Square of 2**level x 2**level cells
+
+	Nodes are immutable and must only be created through HashLife.join,
+	so that equal squares are always the same object.
+	The children nw, ne, sw and se are indexed as [x, y] like the boards:
+	nw has the low x and y coordinates, se the high ones.
+	"""
+	__slots__ = ('nw', 'ne', 'sw', 'se', 'level', 'population')
+
+	def __init__(self, nw, ne, sw, se, level, population) -> None:
+		self.nw = nw
+		self.ne = ne
+		self.sw = sw
+		self.se = se
+		self.level = level
+		self.population = population
+
+
+DEAD = Node(None, None, None, None, 0, 0)
+ALIVE = Node(None, None, None, None, 0, 1)
+
+
+class HashLife:
+	"""HashLife universe
+
+	The universe advances in jumps of 2**step_log2 generations.
+	When the node cache grows beyond max_nodes, everything that is not part of
+	the current pattern is dropped between jumps, which also forgets memoized results.
+	The rule is any life-like rule, see rules.get_rule.
+	"""
+	step_log2 = 0
+	generation = 0
+	max_nodes = 1_000_000
+
+	def __init__(self, step_log2=0, max_nodes=None, rule=None) -> None:
+		self.step_log2 = step_log2
+		self.rule = get_rule(rule)
+		self._table = rule_table(self.rule)
+		if max_nodes is not None:
+			self.max_nodes = max_nodes
+		self._nodes = {}
+		self._results = {}
+		self._empty = [DEAD]
+		self._level2 = {}
+		self.root = self.empty(2)
+		# board coordinates of the top left corner of the root node
+		self.origin = (0, 0)
+
+	def join(self, nw, ne, sw, se) -> Node:
+		"""Returns the canonical node with the given children"""
+		key = (nw, ne, sw, se)
+		node = self._nodes.get(key)
+		if node is None:
+			node = Node(nw, ne, sw, se, nw.level+1, nw.population+ne.population+sw.population+se.population)
+			self._nodes[key] = node
+		return node
+
+	def empty(self, level) -> Node:
+		"""Returns the canonical dead node of the given level"""
+		while len(self._empty) <= level:
+			e = self._empty[-1]
+			self._empty.append(self.join(e, e, e, e))
+		return self._empty[level]
+
+	def _level2_node(self, code) -> Node:
+		"""Returns the 4x4 node whose cells are the bits of code, bit x+4*y is cell (x, y)"""
+		node = self._level2.get(code)
+		if node is None:
+			cells = [ALIVE if code >> i & 1 else DEAD for i in range(16)]
+			def quadrant(x, y):
+				return self.join(cells[x+4*y], cells[x+1+4*y], cells[x+4*(y+1)], cells[x+1+4*(y+1)])
+			node = self.join(quadrant(0, 0), quadrant(2, 0), quadrant(0, 2), quadrant(2, 2))
+			self._level2[code] = node
+		return node
+
+	def _life_4x4(self, node) -> Node:
+		"""Advances the center 2x2 cells of a 4x4 node by a single generation"""
+		cells = np.zeros((4, 4), dtype=np.uint8)
+		for qx, qy, quadrant in ((0, 0, node.nw), (2, 0, node.ne), (0, 2, node.sw), (2, 2, node.se)):
+			cells[qx, qy] = quadrant.nw.population
+			cells[qx+1, qy] = quadrant.ne.population
+			cells[qx, qy+1] = quadrant.sw.population
+			cells[qx+1, qy+1] = quadrant.se.population
+		def next_cell(x, y):
+			neighbours = int(cells[x-1:x+2, y-1:y+2].sum()) - cells[x, y]
+			return ALIVE if self._table[cells[x, y]*9 + neighbours] else DEAD
+		return self.join(next_cell(1, 1), next_cell(2, 1), next_cell(1, 2), next_cell(2, 2))
+
+	def _centre(self, node) -> Node:
+		"""Returns the centre node of half the size"""
+		return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+	def _successor(self, node, step_log2) -> Node:
+		"""Returns the centre of the node, half its size, advanced 2**step_log2 generations
+
+		step_log2 is limited to node.level-2, which is as far as the centre can be known
+		"""
+		step_log2 = min(step_log2, node.level-2)
+		if node.population == 0:
+			return self.empty(node.level-1)
+		key = (node, step_log2)
+		result = self._results.get(key)
+		if result is not None:
+			return result
+
+		if node.level == 2:
+			result = self._life_4x4(node)
+		else:
+			nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+			# 9 overlapping sub-squares of half the size, advanced into quarter sized centres
+			c = [
+				self._successor(nw, step_log2),
+				self._successor(self.join(nw.ne, ne.nw, nw.se, ne.sw), step_log2),
+				self._successor(ne, step_log2),
+				self._successor(self.join(nw.sw, nw.se, sw.nw, sw.ne), step_log2),
+				self._successor(self.join(nw.se, ne.sw, sw.ne, se.nw), step_log2),
+				self._successor(self.join(ne.sw, ne.se, se.nw, se.ne), step_log2),
+				self._successor(sw, step_log2),
+				self._successor(self.join(sw.ne, se.nw, sw.se, se.sw), step_log2),
+				self._successor(se, step_log2),
+			]
+			if step_log2 < node.level-2:
+				# the time is already spent, only combine the centres
+				result = self.join(
+					self._centre(self.join(c[0], c[1], c[3], c[4])),
+					self._centre(self.join(c[1], c[2], c[4], c[5])),
+					self._centre(self.join(c[3], c[4], c[6], c[7])),
+					self._centre(self.join(c[4], c[5], c[7], c[8])))
+			else:
+				# advance the combined centres a second time
+				result = self.join(
+					self._successor(self.join(c[0], c[1], c[3], c[4]), step_log2),
+					self._successor(self.join(c[1], c[2], c[4], c[5]), step_log2),
+					self._successor(self.join(c[3], c[4], c[6], c[7]), step_log2),
+					self._successor(self.join(c[4], c[5], c[7], c[8]), step_log2))
+		self._results[key] = result
+		return result
+
+	def _expand(self):
+		"""Doubles the size of the root, keeping the pattern in the centre"""
+		root = self.root
+		e = self.empty(root.level-1)
+		self.root = self.join(
+			self.join(e, e, e, root.nw),
+			self.join(e, e, root.ne, e),
+			self.join(e, root.sw, e, e),
+			self.join(root.se, e, e, e))
+		half = 1 << (root.level-1)
+		self.origin = (self.origin[0]-half, self.origin[1]-half)
+
+	def _is_padded(self) -> bool:
+		"""Checks that every live cell is in the centre quarter of the root"""
+		root = self.root
+		return (
+			root.nw.population == root.nw.se.se.population and
+			root.ne.population == root.ne.sw.sw.population and
+			root.sw.population == root.sw.ne.ne.population and
+			root.se.population == root.se.nw.nw.population)
+
+	def jump(self, step_log2=None) -> bool:
+		"""Advances the universe by 2**step_log2 generations, by default the step size of the universe
+
+		Returns whether the pattern changed, nodes are canonical,
+		so it did if the new root is not the centre of the old one
+		"""
+		if step_log2 is None:
+			step_log2 = self.step_log2
+		while self.root.level < step_log2+3 or not self._is_padded():
+			self._expand()
+		level = self.root.level
+		previous = self.root
+		self.root = self._successor(self.root, step_log2)
+		changed = self.root is not self._centre(previous)
+		quarter = 1 << (level-2)
+		self.origin = (self.origin[0]+quarter, self.origin[1]+quarter)
+		self.generation += 1 << step_log2
+		if len(self._nodes) > self.max_nodes:
+			self.collect()
+		return changed
+
+	def advance(self, generations):
+		"""Advances the universe by any amount of generations
+
+		Uses the largest jumps that add up to the amount of generations
+		"""
+		step_log2 = 0
+		while generations > 0:
+			if generations & 1:
+				self.jump(step_log2)
+			generations >>= 1
+			step_log2 += 1
+
+	def collect(self):
+		"""Drops every node that is not part of the current pattern and all memoized results"""
+		keep = set()
+		stack = [self.root] + self._empty
+		while stack:
+			node = stack.pop()
+			if node.level == 0 or node in keep:
+				continue
+			keep.add(node)
+			stack.extend((node.nw, node.ne, node.sw, node.se))
+		self._nodes = {key: node for key, node in self._nodes.items() if node in keep}
+		self._results = {}
+		self._level2 = {}
+
+	@property
+	def population(self) -> int:
+		"""Amount of live cells in the universe"""
+		return self.root.population
+
+	@classmethod
+	def from_array(cls, board, step_log2=0, max_nodes=None, rule=None) -> 'HashLife':
+		"""Creates a universe from a dense board, board[0, 0] is placed at the origin"""
+		universe = cls(step_log2, max_nodes, rule)
+		level = max(2, int(np.ceil(np.log2(max(board.shape)))))
+		size = 1 << level
+		padded = np.zeros((size, size), dtype=np.uint8)
+		padded[:board.shape[0], :board.shape[1]] = board != 0
+		# bit x+4*y of each 4x4 block, cells are [x, y]
+		blocks = padded.reshape(size//4, 4, size//4, 4).transpose(0, 2, 3, 1).reshape(size//4, size//4, 16)
+		codes = blocks.astype(np.uint32) @ (1 << np.arange(16, dtype=np.uint32))
+		grid = [[universe._level2_node(int(code)) for code in row] for row in codes]
+		# join 2x2 squares of nodes until a single node is left
+		while len(grid) > 1:
+			grid = [
+				[universe.join(grid[x][y], grid[x+1][y], grid[x][y+1], grid[x+1][y+1]) for y in range(0, len(grid), 2)]
+				for x in range(0, len(grid), 2)]
+		universe.root = grid[0][0]
+		return universe
+
+	def to_array(self, x=0, y=0, width=None, height=None, out=None) -> np.ndarray:
+		"""Exports a window of the universe into a dense board
+
+		The window starts at board coordinates (x, y),
+		if out is given, the window is written into it and it's size is used
+		"""
+		if out is None:
+			out = np.zeros((width, height), dtype=np.uint8)
+		else:
+			out[...] = 0
+		self._write_node(self.root, self.origin[0]-x, self.origin[1]-y, out)
+		return out
+
+	def _write_node(self, node, x, y, out):
+		"""Writes the live cells of a node at window position (x, y) into out"""
+		size = 1 << node.level
+		if node.population == 0 or x >= out.shape[0] or y >= out.shape[1] or x+size <= 0 or y+size <= 0:
+			return
+		if node.level == 0:
+			out[x, y] = 1
+			return
+		half = size // 2
+		self._write_node(node.nw, x, y, out)
+		self._write_node(node.ne, x+half, y, out)
+		self._write_node(node.sw, x, y+half, out)
+		self._write_node(node.se, x+half, y+half, out)
+
+
+class HashLifeStep:
+	"""Step function that runs the board with HashLife
+
+	Every call advances 2**step_log2 generations and writes the result back into the board.
+	The universe is kept between calls, as long as the same board and rule are passed back in.
+	"""
+	def __init__(self, step_log2=0, max_nodes=None, rule=None) -> None:
+		self.step_log2 = step_log2
+		self.max_nodes = max_nodes
+		self.rule = get_rule(rule)
+		self.generations_per_call = 1 << step_log2
+		self.universe = None
+		self._board = None
+
+	def _universe_for(self, board, topology, rule) -> HashLife:
+		if topology == "torus":
+			raise ValueError("HashLife does not support the torus topology, the universe is unbounded")
+		if rule is not None and get_rule(rule) != self.rule:
+			self.rule = get_rule(rule)
+			self.universe = None
+		if self.universe is None or board is not self._board:
+			self.universe = HashLife.from_array(board, self.step_log2, self.max_nodes, self.rule)
+			self._board = board
+		return self.universe
+
+	def __call__(self, board:np.ndarray, topology:str="bounded", rule=None) -> np.ndarray:
+		universe = self._universe_for(board, topology, rule)
+		universe.jump()
+		return universe.to_array(out=board)
+
+	def step_n(self, board:np.ndarray, n:int, stop_when_stable:bool=False, topology:str="bounded",
+			rule=None, hashes:np.ndarray=None, stats:np.ndarray=None) -> tuple:
+		"""Runs n calls worth of generations at once, see gol_step.get_step_n_function
+
+		If hashes is given, the board is exported after every call to hash it, see gol_step.board_hash
+		If stats is given, the board is exported after every call and compared with the one before,
+		see gol_step.gol_py_stats, so the births and deaths are those of all the generations of a call
+		If stop_when_stable is set, it stops after the first call that doesn't change the universe,
+		cells outside of the board count as well.
+		Returns the board and the amount of calls that were run.
+		"""
+		universe = self._universe_for(board, topology, rule)
+		if hashes is None and stats is None and not stop_when_stable:
+			universe.advance(n*self.generations_per_call)
+			return universe.to_array(out=board), n
+		from gol_step import board_hash, gol_py_stats
+		previous = board.copy() if stats is not None else None
+		for call in range(n):
+			changed = universe.jump()
+			if hashes is not None or stats is not None:
+				universe.to_array(out=board)
+			if hashes is not None:
+				hashes[call] = board_hash(board, topology)
+			if stats is not None:
+				gol_py_stats(previous, board, topology, stats[call:call+1])
+				np.copyto(previous, board)
+			if stop_when_stable and not changed:
+				return universe.to_array(out=board), call+1
+		return universe.to_array(out=board), n
@@ -0,0 +1,186 @@
+"""This module contains a headless game of life runner
+
+It runs a pattern for a number of generations without a display,
+so it works on machines without pygame, tkinter or a screen, and rendering is not part of the measured time.
+
+It can be used from the command line:
+	python headless.py pattern.rle -n 1000 --backend c_numpy -o result.rle
+or from python with run().
+"""
+import argparse
+import sys
+import time
+import numpy as np
+import snapshot
+
+from cycles import CycleDetector
+from gol_step import BACKENDS, HAS_C_EXTENSION, TOPOLOGIES, UNBOUNDED_BACKENDS, get_backend, get_step_n_function
+from rules import get_rule
+from state_loader import load_data, save_state
+
+# generations that are hashed per call while looking for cycles
+_CYCLE_BATCH = 256
+
+def run(board:np.ndarray, generations:int, backend:str='c_numpy', topology:str="bounded", rule=None,
+		stop_when_stable:bool=False, detect_cycles:bool=False, stop_on_cycle:bool=False, max_history:int=4096) -> dict:
+	"""Runs the board for the given amount of generations
+
+	The board is not modified. On a bounded board the cells on the edge stay dead like in GameOfLifeSim,
+	so the board is padded with a dead border while it runs. The backends in UNBOUNDED_BACKENDS (hashlife, sparse)
+	ignore that border: cells that reach it keep living and cells beyond it are still stepped, but not returned.
+	They only match the other backends while the pattern stays away from the edges.
+	With detect_cycles (or stop_on_cycle) the board hashes of the last max_history generations are kept
+	to find still lifes and oscillators, see cycles.CycleDetector.
+	stop_on_cycle stops at the end of the batch of generations the cycle was found in.
+	Returns a dict with the final board, the amount of generations that were run,
+	the time they took in seconds, generations per second, the population
+	and the cycles.Cycle that was found (None if there was none or detection was off).
+	"""
+	step_function = get_backend(backend)
+	step_n_function = get_step_n_function(step_function)
+	generations_per_call = getattr(step_function, 'generations_per_call', 1)
+	if generations % generations_per_call:
+		raise ValueError('the %s backend runs %d generations per step' % (backend, generations_per_call))
+	torus = topology == "torus"
+	if torus:
+		board = np.array(board, dtype=np.uint8)
+	else:
+		board = np.pad(np.asarray(board, dtype=np.uint8), 1, mode='constant', constant_values=0)
+
+	detector = None
+	if detect_cycles or stop_on_cycle:
+		detector = CycleDetector(max_history=max_history, generations_per_step=generations_per_call, topology=topology, rule=rule)
+		detector.observe(board, 0)
+
+	start_time = time.perf_counter()
+	if detector is None:
+		board, steps = step_n_function(board, generations // generations_per_call,
+			stop_when_stable=stop_when_stable, topology=topology, rule=rule)
+	else:
+		board, steps = _run_detecting_cycles(board, generations // generations_per_call, step_n_function, detector,
+			generations_per_call, stop_when_stable, stop_on_cycle, topology=topology, rule=rule)
+	seconds = time.perf_counter()-start_time
+
+	if not torus:
+		board = board[1:-1, 1:-1]
+	run_generations = steps*generations_per_call
+	return {
+		'board': board,
+		'generations': run_generations,
+		'seconds': seconds,
+		'generations_per_second': run_generations/seconds if seconds > 0 else float('inf'),
+		'population': int(np.count_nonzero(board)),
+		'cycle': detector.cycle if detector is not None else None,
+	}
+
+
+def _run_detecting_cycles(board, steps, step_n_function, detector, generations_per_call,
+		stop_when_stable, stop_on_cycle, **kwargs) -> tuple:
+	"""Runs the steps in batches, feeding the hashes of every generation to the detector"""
+	hashes = np.empty(_CYCLE_BATCH, dtype=np.uint64)
+	run_steps = 0
+	while run_steps < steps:
+		batch = min(_CYCLE_BATCH, steps-run_steps)
+		board, batch_steps = step_n_function(board, batch, stop_when_stable=stop_when_stable, hashes=hashes, **kwargs)
+		cycle = detector.observe_hashes(board, hashes[:batch_steps], (run_steps+1)*generations_per_call)
+		run_steps += batch_steps
+		if batch_steps < batch or (stop_on_cycle and cycle is not None):
+			break
+	return board, run_steps
+
+
+def format_profile(profile:dict) -> str:
+	"""Formats the result of GOL.get_profile, with the share of every phase in the time of its function"""
+	lines = []
+	for function, entry in profile.items():
+		lines.append('%s: %d calls, %.4f s' % (function, entry['calls'], entry['seconds']))
+		for phase, timing in entry['phases'].items():
+			share = timing['seconds']/entry['seconds'] if entry['seconds'] > 0 else 0
+			lines.append('  %-12s %8d calls %10.4f s %5.1f%%' % (phase, timing['calls'], timing['seconds'], 100*share))
+	return '\n'.join(lines)
+
+
+def parse_size(text:str) -> tuple:
+	"""Parses a WIDTHxHEIGHT command line argument"""
+	try:
+		width, height = (int(value) for value in text.lower().split('x'))
+	except ValueError:
+		raise argparse.ArgumentTypeError('size must be WIDTHxHEIGHT, not %r' % text) from None
+	return (width, height)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description='Runs a game of life pattern without a display')
+	source = parser.add_mutually_exclusive_group(required=True)
+	source.add_argument('pattern', nargs='?', help='pattern file (.rle, .golsnap or the text format)')
+	source.add_argument('--random', metavar='WIDTHxHEIGHT', type=parse_size, help='random board of the given size instead of a pattern')
+	parser.add_argument('-n', '--generations', type=int, default=100, help='amount of generations to run')
+	parser.add_argument('-b', '--backend', choices=list(BACKENDS), default='c_numpy', help='step function to use')
+	parser.add_argument('-t', '--topology', choices=TOPOLOGIES, default="bounded")
+	parser.add_argument('-r', '--rule', help='rule in B/S notation, defaults to the rule of the pattern')
+	parser.add_argument('--min-size', metavar='WIDTHxHEIGHT', type=parse_size, default=(0, 0), help='pads the pattern to at least this size')
+	parser.add_argument('--density', type=float, default=0.5, help='fraction of alive cells on a random board')
+	parser.add_argument('--seed', type=int, help='seed of the random board')
+	parser.add_argument('--stop-when-stable', action='store_true', help='stops once a step does not change the board')
+	parser.add_argument('--detect-cycles', action='store_true', help='reports when the board becomes a still life or oscillator')
+	parser.add_argument('--stop-on-cycle', action='store_true', help='stops once a cycle is found, implies --detect-cycles')
+	parser.add_argument('--max-history', type=int, default=4096, help='generations remembered for cycle detection')
+	parser.add_argument('--profile', action='store_true', help='prints how long every phase of the C step functions took')
+	parser.add_argument('--simd', choices=('scalar', 'sse2', 'avx2', 'avx512'), help='forces the SIMD kernels of the C step functions')
+	parser.add_argument('-o', '--output', help='file the final board is saved to (.rle or .golsnap)')
+	parser.add_argument('--encoding', choices=snapshot.ENCODINGS, default='packed+zlib', help='encoding of .golsnap output, raw snapshots can be memory mapped')
+	return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+	args = parse_args(argv)
+	if args.random is not None:
+		width, height = args.random
+		rng = np.random.default_rng(args.seed)
+		board = (rng.random((width, height)) < args.density).view(np.uint8)
+		rule = None
+	else:
+		board, rule = load_data(args.pattern, args.min_size, return_rule=True)
+	if args.rule is not None:
+		rule = args.rule
+	rule = get_rule(rule)
+
+	if (args.profile or args.simd) and not HAS_C_EXTENSION:
+		print('--profile and --simd need the C extension')
+		return 1
+	if args.simd:
+		import GOL
+		try:
+			GOL.set_simd(args.simd)
+		except ValueError as error:
+			print(error)
+			return 1
+	if args.profile:
+		import GOL
+		GOL.reset_profile()
+		GOL.set_profiling(True)
+	result = run(board, args.generations, args.backend, args.topology, rule, args.stop_when_stable,
+		args.detect_cycles, args.stop_on_cycle, args.max_history)
+	topology = 'unbounded' if args.backend in UNBOUNDED_BACKENDS else args.topology
+	print('board: %dx%d, rule: %s, topology: %s, backend: %s' % (board.shape[0], board.shape[1], rule, topology, args.backend))
+	if HAS_C_EXTENSION:
+		import GOL
+		print('simd: %s' % GOL.get_simd())
+	print('generations: %d in %.3f s (%.1f generations/s, %.3g cells/s)' % (
+		result['generations'], result['seconds'], result['generations_per_second'],
+		result['generations_per_second']*board.size))
+	print('population: %d' % result['population'])
+	if result['cycle'] is not None:
+		print(str(result['cycle']).capitalize())
+	elif args.detect_cycles or args.stop_on_cycle:
+		print('No cycle found')
+	if args.profile:
+		GOL.set_profiling(False)
+		print(format_profile(GOL.get_profile()))
+	if args.output:
+		save_state(args.output, result['board'], rule, encoding=args.encoding)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
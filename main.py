@@ -3,15 +3,14 @@ functions for running the game from a file, random layout or pattern maker.
 This is meant to be run, not imported.
 """
 import os
-import time
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import messagebox
 from game import GameOfLifeSim
 from state_loader import load_data, save_state
 from make_life import MakeLife
-from gol_step import (HAS_C_EXTENSION, gol_py_partial_sums, gol_py_simple, gol_py_trivial,
-	gol_py_slooow, gol_c_pylist_multithread, gol_c_numpy_api)
+from gol_step import HAS_C_EXTENSION
+from benchmark import benchmark_case
 
 root = tk.Tk()
 width_res_input = None
@@ -45,12 +44,16 @@ def run_game_from_file():
 		# Process the selected file
 		print("Selected file:", file_path)
 		try:
+			board, rule = load_data(
+				file_name=file_path, 
+				min_size=fetch_board_size(),
+				return_rule=True
+				)
 			game = GameOfLifeSim(
-				board=load_data(
-					file_name=file_path, 
-					min_size=fetch_board_size()
-					),
-				display_size=fetch_resolution()
+				board=board,
+				display_size=fetch_resolution(),
+				rule=rule,
+				threaded=True
 				)
 		except FileNotFoundError as e:
 			print("Error loading file:", e)
@@ -73,14 +76,25 @@ def run_game_from_random():
 	root.withdraw()
 	display_size = fetch_resolution()
 	board_size = fetch_board_size()
-	GameOfLifeSim(board_size[0], board_size[1], display_size=display_size).start()
+	GameOfLifeSim(board_size[0], board_size[1], display_size=display_size, threaded=True).start()
 	root.deiconify()
 
+def choose_pattern():
+	"""Asks for a pattern file that the pattern maker pastes, returns None if there is none"""
+	file_path = filedialog.askopenfilename(initialdir=os.getcwd())
+	if not file_path:
+		return None
+	try:
+		return load_data(file_name=file_path)
+	except (OSError, ValueError) as e:
+		print("Error loading file:", e)
+		return None
+
 def run_pattern_maker():
 	resolution = fetch_resolution()
 	board_size = fetch_board_size()
 	root.withdraw()
-	pattern = MakeLife(board_size[0], board_size[1], resolution).start()
+	pattern = MakeLife(board_size[0], board_size[1], resolution, choose_pattern=choose_pattern).start()
 	file_name = filedialog.asksaveasfilename(initialdir=os.getcwd(), defaultextension='.rle', filetypes=[('RLE files', '*.rle')])
 	if file_name:
 		save_state(file_name, pattern)
@@ -92,67 +106,35 @@ def run_edit_pattern():
 	root.withdraw()
 	file_path = filedialog.askopenfilename(initialdir=os.getcwd(), filetypes=[('RLE files', '*.rle')])
 	if file_path:
-		pattern = load_data(file_name=file_path, min_size=board_size)
-		pattern = MakeLife(pattern.shape[0], pattern.shape[1], resolution, pattern).start()
-		save_state(file_path, pattern)
+		pattern, rule = load_data(file_name=file_path, min_size=board_size, return_rule=True)
+		pattern = MakeLife(pattern.shape[0], pattern.shape[1], resolution, pattern, choose_pattern).start()
+		save_state(file_path, pattern, rule)
 	root.deiconify()
 
 def run_benchmaster():
-	"""This function is used to benchmark the different step functions"""
+	"""This function is used to benchmark the different step functions
+
+	The step functions are run headless, see benchmark.py for the full suite
+	"""
 	root.withdraw()
 	steps_to_benchmark = 100
-	result_string = f"Benchmark results (time for {steps_to_benchmark} steps):\n"
-
-	game = GameOfLifeSim(width=120, height=80, display_size=(1200,800), step_function=gol_py_slooow)
-	game.set_frame_rate(10000)
-	start_time = time.time()
-	with game as tick:
-		while game.get_current_tick() < 100:
-			tick()
-	result_string += f"- solution of 2 for loops through a list (100x smaller board): {time.time() - start_time}\n"
-
-	game = GameOfLifeSim(width=120, height=80, display_size=(1200, 800), step_function=gol_py_trivial)
-	game.set_frame_rate(10000)
-	start_time = time.time()
-	with game as tick:
-		while game.get_current_tick() < 100:
-			tick()
-	result_string += f"- solution of 2 for loops through a numpy array (100x smaller board): {time.time() - start_time}\n"
-
-
-	game = GameOfLifeSim(width=1200, height=800, step_function=gol_py_simple)
-	game.set_frame_rate(10000)
-	start_time = time.time()
-	with game as tick:
-		while game.get_current_tick() < 100:
-			tick()
-	result_string += f"- numpy stride tricks: {time.time() - start_time}\n"
-
-	game = GameOfLifeSim(width=1200, height=800, step_function=gol_py_partial_sums)
-	game.set_frame_rate(10000)
-	start_time = time.time()
-	with game as tick:
-		while game.get_current_tick() < 100:
-			tick()
-	result_string += f"- numpy stride tricks with partial sums: {time.time() - start_time}\n"
-
+	result_string = f"Benchmark results ({steps_to_benchmark} steps, mean of 3 runs):\n"
+	cases = [
+		('py_slooow', (120, 80), "solution of 2 for loops through a list (100x smaller board)"),
+		('py_trivial', (120, 80), "solution of 2 for loops through a numpy array (100x smaller board)"),
+		('py_simple', (1200, 800), "numpy stride tricks"),
+		('py_partial_sums', (1200, 800), "numpy stride tricks with partial sums"),
+	]
 	if HAS_C_EXTENSION:
-		game = GameOfLifeSim(width=1200, height=800, step_function=gol_c_pylist_multithread)
-		game.set_frame_rate(10000)
-		start_time = time.time()
-		with game as tick:
-			while game.get_current_tick() < 100:
-				tick()
-		result_string += f"- C extension with python lists (utilizing partial sums): {time.time() - start_time}\n"
-
-
-		game = GameOfLifeSim(width=1200, height=800, step_function=gol_c_numpy_api)
-		game.set_frame_rate(10000)
-		start_time = time.time()
-		with game as tick:
-			while game.get_current_tick() < 100:
-				tick()
-		result_string += f"- C extension with numpy arrays (utilizing partial sums): {time.time() - start_time}\n"
+		cases += [
+			('c_pylist_multithread', (1200, 800), "C extension with python lists (utilizing partial sums)"),
+			('c_numpy', (1200, 800), "C extension with numpy arrays (utilizing partial sums)"),
+			('c_numpy_multithread', (1200, 800), "C extension with numpy arrays and a thread pool"),
+		]
+	for backend, (width, height), description in cases:
+		result = benchmark_case(backend, width, height, 0.5, generations=steps_to_benchmark, repetitions=3)
+		mean_time = sum(result['seconds'])/len(result['seconds'])
+		result_string += f"- {description}: {mean_time:.3f} s ({result['cells_per_second']:.3g} cells/s)\n"
 
 	messagebox.showinfo("Benchmark results", result_string)
 
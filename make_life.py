@@ -1,18 +1,22 @@
-
 import pygame
 import numpy as np
-import math
 from game import GameOfLifeSim
 
+# editing tools, selected with their first letter
+TOOLS = ('brush', 'line', 'fill')
+
 class MakeLife:
 	"""Game of life creation tool class
 	This class is responsible for handling the window
 	that allows the user to create a game of life pattern
-	
+
 	It controls pygame so that the simulation can be displayed on the screen
 	That means no other pygame should be used simultaneously.
 
 	It can also run the game of life on the current board for testing purposes
+
+	Edits write whole slices of the board at once and only the cells they touched are drawn again.
+	choose_pattern is called to pick a pattern for pasting, it should return a board or None.
 	"""
 	board = None
 	width = None
@@ -20,7 +24,24 @@ class MakeLife:
 	display = None
 	running = None
 	display_size = None
-	def __init__(self, width:int, height:int, display_size: (int, int), board=None) -> None:
+	tool = 'brush'
+	# cells within this distance of the cursor are painted by the brush and the line tool
+	brush_radius = 0
+	# pattern that is pasted at the cursor
+	clipboard = None
+	# board region (x0, x1, y0, y1) changed since the last frame, None if nothing changed
+	_dirty = None
+	# 8 bit display sized surface, the cell values are palette indices
+	_screen = None
+	# board index of every display column and row, the same mapping as to_indices
+	_pixel_x = None
+	_pixel_y = None
+	# cell where the current line or fill started, and the value it writes
+	_drag_start = None
+	_paint_value = 1
+	# cell of the previous brush position while a button is held
+	_last_cell = None
+	def __init__(self, width:int, height:int, display_size: (int, int), board=None, choose_pattern:callable=None) -> None:
 		pygame.init()
 		self.width = width
 		self.height = height
@@ -29,82 +50,180 @@ class MakeLife:
 			if board.shape[0] != self.width or board.shape[1] != self.height:
 				raise ValueError("board must have the same dimensions as the creation tool")
 			self.board = board
-		self.display = pygame.display.set_mode(display_size)
-		self.running = False
+		self.choose_pattern = choose_pattern
 		self.display_size = display_size
+		self._pixel_x = np.arange(display_size[0])*self.width//display_size[0]
+		self._pixel_y = np.arange(display_size[1])*self.height//display_size[1]
+		self._open_display()
+		self.running = False
+
+	def _open_display(self):
+		"""Creates the window and redraws the whole board"""
+		self.display = pygame.display.set_mode(self.display_size)
+		self._screen = pygame.Surface(self.display_size, 0, 8)
+		self._screen.set_palette([(0, 0, 0), (255, 255, 255)] + [(0, 0, 0)]*254)
+		self._mark_dirty(0, self.width, 0, self.height)
 
 	def loop(self):
 		"""Main loop of the game of life creation tool"""
 		while self.running:
-			for event in pygame.event.get():
+			events = pygame.event.get()
+			if not events and self._dirty is None:
+				# nothing to draw, sleep until the next event instead of polling
+				events = [pygame.event.wait()]
+			for event in events:
 				if event.type == pygame.QUIT:
 					self.running = False
 				elif event.type == pygame.MOUSEBUTTONDOWN:
-					if event.button == 1:
-						board_index = self.to_indices(event.pos)
-						#print(event.pos, board_index)
-						self.board[board_index[0], board_index[1]] = 1
-						#print(self.board)
-					elif event.button == 3:
-						board_index = self.to_indices(event.pos)
-						self.board[board_index[0],board_index[1]] = 0
-						#print(self.board)
+					if event.button in (1, 3):
+						self._paint_value = 1 if event.button == 1 else 0
+						cell = self.to_indices(event.pos)
+						if self.tool == 'brush':
+							self.draw_line(cell, cell, self._paint_value)
+							self._last_cell = cell
+						else:
+							self._drag_start = cell
+				elif event.type == pygame.MOUSEMOTION:
+					if self._last_cell is not None:
+						# a line from the previous position, so fast strokes don't leave gaps
+						cell = self.to_indices(event.pos)
+						self.draw_line(self._last_cell, cell, self._paint_value)
+						self._last_cell = cell
+				elif event.type == pygame.MOUSEBUTTONUP:
+					if event.button in (1, 3):
+						self._last_cell = None
+						if self._drag_start is not None:
+							cell = self.to_indices(event.pos)
+							if self.tool == 'line':
+								self.draw_line(self._drag_start, cell, self._paint_value)
+							elif self.tool == 'fill':
+								self.fill_rect(self._drag_start, cell, self._paint_value)
+							self._drag_start = None
 				elif event.type == pygame.KEYDOWN:
 					if event.key == pygame.K_ESCAPE:
 						self.running = False
 					elif event.key == pygame.K_r:
 						# Run the game of life on the current board
 						self.run_life()
-			
-			left_click, _, right_click = pygame.mouse.get_pressed()
-			if left_click:
-				board_index = self.to_indices(pygame.mouse.get_pos())
-				self.board[board_index[0], board_index[1]] = 1
-			elif right_click:
-				board_index = self.to_indices(pygame.mouse.get_pos())
-				self.board[board_index[0],board_index[1]] = 0
-
-
-			self.display.fill((0,0,0))
-			pixelsPerCell = (self.display_size[0]/self.width, self.display_size[1]/self.height)
-			surf = pygame.surface.Surface(self.display_size)
-			for i in range(self.width):
-				for j in range(self.height):
-					if self.board[i,j] == 1:
-						pygame.draw.rect(surf,(255,255,255),
-					   		(
-								i*pixelsPerCell[0],
-								j*pixelsPerCell[1],
-								pixelsPerCell[0],
-								pixelsPerCell[1]
-							))
-			self.display.blit(surf, (0,0))
-			pygame.display.update()
+					elif event.key == pygame.K_b:
+						self.tool = 'brush'
+					elif event.key == pygame.K_l:
+						self.tool = 'line'
+					elif event.key == pygame.K_f:
+						self.tool = 'fill'
+					elif event.key == pygame.K_RIGHTBRACKET:
+						self.brush_radius += 1
+					elif event.key == pygame.K_LEFTBRACKET:
+						self.brush_radius = max(0, self.brush_radius-1)
+					elif event.key == pygame.K_o:
+						if self.choose_pattern is not None:
+							pattern = self.choose_pattern()
+							if pattern is not None:
+								self.clipboard = pattern
+					elif event.key == pygame.K_v:
+						if self.clipboard is not None:
+							self.paste(self.clipboard, self.to_indices(pygame.mouse.get_pos()))
+					elif event.key == pygame.K_c:
+						self.clear()
+
+			self._render()
 		pygame.quit()
 		return self.board
-	
+
 	def start(self):
 		"""Starts the game of life creation tool"""
 		self.running = True
 		return self.loop()
-	
+
 	def to_indices(self, pos):
 		"""Converts a position on the screen to the corresponding indices on the board"""
 		unclamped_pos = (
-			math.floor(pos[0]/self.display_size[0]*self.width),
-			math.floor(pos[1]/self.display_size[1]*self.height)
+			pos[0]*self.width//self.display_size[0],
+			pos[1]*self.height//self.display_size[1]
 			)
 		return (
 			min(max(unclamped_pos[0], 0), self.width-1),
 			min(max(unclamped_pos[1], 0), self.height-1)
 			)
-	
+
+	def _mark_dirty(self, x0, x1, y0, y1):
+		"""Adds the cells x0:x1, y0:y1 to the region that is drawn in the next frame"""
+		if self._dirty is not None:
+			x0, x1 = min(x0, self._dirty[0]), max(x1, self._dirty[1])
+			y0, y1 = min(y0, self._dirty[2]), max(y1, self._dirty[3])
+		self._dirty = (x0, x1, y0, y1)
+
+	def _render(self):
+		"""Draws the cells that changed since the last frame
+
+		Every display pixel looks up its cell through the pixel to cell index maps,
+		only the pixels of the dirty region are written and updated on the screen.
+		"""
+		if self._dirty is None:
+			return
+		x0, x1, y0, y1 = self._dirty
+		self._dirty = None
+		# the pixels that show the dirty cells
+		px0, px1 = np.searchsorted(self._pixel_x, (x0, x1))
+		py0, py1 = np.searchsorted(self._pixel_y, (y0, y1))
+		if px0 >= px1 or py0 >= py1:
+			return
+		pixels = pygame.surfarray.pixels2d(self._screen)
+		pixels[px0:px1, py0:py1] = self.board[np.ix_(self._pixel_x[px0:px1], self._pixel_y[py0:py1])]
+		# the surface stays locked while the pixel view exists
+		del pixels
+		rect = pygame.Rect(px0, py0, px1-px0, py1-py0)
+		self.display.blit(self._screen, rect, rect)
+		pygame.display.update(rect)
+
+	def _brush_offsets(self):
+		"""Returns the x and y offsets of the cells covered by the brush"""
+		r = self.brush_radius
+		dx, dy = np.mgrid[-r:r+1, -r:r+1]
+		inside = dx*dx + dy*dy <= r*r
+		return dx[inside], dy[inside]
+
+	def draw_line(self, start, end, value):
+		"""Sets the cells on the line from start to end (including both) to value, using the brush"""
+		length = max(abs(end[0]-start[0]), abs(end[1]-start[1]))+1
+		xs = np.rint(np.linspace(start[0], end[0], length)).astype(np.intp)
+		ys = np.rint(np.linspace(start[1], end[1], length)).astype(np.intp)
+		dx, dy = self._brush_offsets()
+		xs = (xs[:, None]+dx).ravel()
+		ys = (ys[:, None]+dy).ravel()
+		inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+		xs, ys = xs[inside], ys[inside]
+		if xs.size == 0:
+			return
+		self.board[xs, ys] = value
+		self._mark_dirty(xs.min(), xs.max()+1, ys.min(), ys.max()+1)
+
+	def fill_rect(self, start, end, value):
+		"""Sets the cells of the rectangle with the corners start and end (including both) to value"""
+		x0, x1 = sorted((start[0], end[0]))
+		y0, y1 = sorted((start[1], end[1]))
+		self.board[x0:x1+1, y0:y1+1] = value
+		self._mark_dirty(x0, x1+1, y0, y1+1)
+
+	def paste(self, pattern, pos):
+		"""Copies a pattern onto the board with its top left corner at pos, cut off at the edges"""
+		x0, y0 = pos
+		x1 = min(x0+pattern.shape[0], self.width)
+		y1 = min(y0+pattern.shape[1], self.height)
+		self.board[x0:x1, y0:y1] = pattern[:x1-x0, :y1-y0] != 0
+		self._mark_dirty(x0, x1, y0, y1)
+
+	def clear(self):
+		"""Kills every cell on the board"""
+		self.board[...] = 0
+		self._mark_dirty(0, self.width, 0, self.height)
+
 
 	def run_life(self):
 		"""Run the game of life on the current board
-		
+
 		This function halts the creation tool and runs the game of life on the current board
-		
+
 		A new window is opened to display the game of life
 
 		After the game of life is finished, the creation tool is resumed
@@ -117,6 +236,6 @@ class MakeLife:
 		game.start()
 		if self.running:
 			pygame.init()
-			self.display = pygame.display.set_mode(self.display_size)
+			self._open_display()
 			self.running = True
 
@@ -0,0 +1,100 @@
+"""This module contains the rules of life-like cellular automata
+
+Rules are written in B/S notation, conway's game of life is B3/S23:
+a dead cell with 3 alive neighbours is born, an alive cell with 2 or 3 alive neighbours survives.
+
+The step functions don't compare the neighbour counts themselves,
+they look up the next state of every cell in a table indexed by alive*9+neighbours,
+so any life-like rule runs just as fast as conway's.
+"""
+import functools
+import re
+import numpy as np
+
+_BS_PATTERN = re.compile(r'^B([0-8]*)/?S([0-8]*)$', re.IGNORECASE)
+_SB_PATTERN = re.compile(r'^S?([0-8]*)/B?([0-8]*)$', re.IGNORECASE)
+
+
+class Rule:
+	"""Birth and survival conditions of a life-like rule
+
+	Rules that give birth to cells without neighbours (B0) are rejected,
+	all the step functions rely on the dead background staying dead.
+	"""
+	__slots__ = ('birth', 'survival')
+
+	def __init__(self, birth, survival) -> None:
+		birth = frozenset(int(n) for n in birth)
+		survival = frozenset(int(n) for n in survival)
+		if not birth <= set(range(9)) or not survival <= set(range(9)):
+			raise ValueError('neighbour counts must be between 0 and 8')
+		if 0 in birth:
+			raise ValueError('B0 rules are not supported, the dead background would come alive')
+		self.birth = birth
+		self.survival = survival
+
+	@property
+	def birth_mask(self) -> int:
+		"""Bit n is set if a dead cell with n neighbours is born"""
+		return sum(1 << n for n in self.birth)
+
+	@property
+	def survival_mask(self) -> int:
+		"""Bit n is set if an alive cell with n neighbours survives"""
+		return sum(1 << n for n in self.survival)
+
+	@property
+	def table(self) -> np.ndarray:
+		"""Next state of a cell, indexed by alive*9+neighbours"""
+		table = np.zeros(18, dtype=np.uint8)
+		table[list(self.birth)] = 1
+		table[[9+n for n in self.survival]] = 1
+		return table
+
+	def __str__(self) -> str:
+		return 'B%s/S%s' % (''.join(map(str, sorted(self.birth))), ''.join(map(str, sorted(self.survival))))
+
+	def __repr__(self) -> str:
+		return "Rule('%s')" % self
+
+	def __eq__(self, other) -> bool:
+		return isinstance(other, Rule) and self.birth == other.birth and self.survival == other.survival
+
+	def __hash__(self) -> int:
+		return hash((self.birth, self.survival))
+
+
+@functools.lru_cache(maxsize=64)
+def parse_rule(text:str) -> Rule:
+	"""Parses a rule in B/S notation (B36/S23) or the older S/B notation (23/36)"""
+	compact = ''.join(text.split())
+	match = _BS_PATTERN.match(compact)
+	if match is not None:
+		return Rule(match.group(1), match.group(2))
+	match = _SB_PATTERN.match(compact)
+	if match is not None:
+		return Rule(match.group(2), match.group(1))
+	raise ValueError('Invalid rule: %r' % text)
+
+
+CONWAY = parse_rule('B3/S23')
+HIGHLIFE = parse_rule('B36/S23')
+DAY_AND_NIGHT = parse_rule('B3678/S34678')
+SEEDS = parse_rule('B2/S')
+
+
+def get_rule(rule=None) -> Rule:
+	"""Returns the Rule for a Rule, a rule string or None, which is conway's game of life"""
+	if rule is None:
+		return CONWAY
+	if isinstance(rule, Rule):
+		return rule
+	return parse_rule(rule)
+
+
+@functools.lru_cache(maxsize=64)
+def rule_table(rule=None) -> np.ndarray:
+	"""Returns the read only lookup table of a rule, see Rule.table"""
+	table = get_rule(rule).table
+	table.flags.writeable = False
+	return table
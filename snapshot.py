@@ -0,0 +1,165 @@
+"""This module contains a compact binary snapshot format for game of life boards
+
+A snapshot file starts with the magic bytes, the length of the header as a little endian uint32
+and a JSON header. The cell data starts at header["data_offset"], which is aligned to 64 bytes.
+
+Encodings of the cell data:
+- raw: one uint8 per cell, [x, y] in C order. Can be opened with np.memmap without reading the file.
+- packed: one bit per cell, every x row packed with np.packbits along y.
+- packed+zlib / packed+lz4: the packed rows compressed in chunks of header["chunk_rows"] rows.
+  The compressed size of every chunk is stored as a little endian uint64 in the table at header["chunk_table_offset"],
+  which is written after the chunks. lz4 is only available if the lz4 package is installed.
+
+Only raw snapshots can be memory mapped, the other encodings are smaller but have to be decoded into memory.
+Version 1 snapshots, which kept the chunk sizes in header["chunk_sizes"], can still be loaded.
+"""
+import json
+import struct
+import zlib
+import numpy as np
+from rules import get_rule
+
+try:
+	import lz4.frame as lz4_frame
+except ImportError:
+	lz4_frame = None
+
+MAGIC = b'GOLSNAP\x00'
+EXTENSION = '.golsnap'
+VERSION = 2
+_READ_VERSIONS = (1, 2)
+ENCODINGS = ('raw', 'packed', 'packed+zlib', 'packed+lz4')
+
+_DATA_ALIGNMENT = 64
+# amount of cells that are packed or compressed at once
+_CHUNK_CELLS = 1 << 24
+
+
+def _compressor(encoding):
+	"""Returns the compress and decompress functions of a compressed encoding"""
+	if encoding == 'packed+zlib':
+		return (lambda data: zlib.compress(data, 1)), zlib.decompress
+	if encoding == 'packed+lz4':
+		if lz4_frame is None:
+			raise ValueError('the packed+lz4 encoding needs the lz4 package')
+		return lz4_frame.compress, lz4_frame.decompress
+	return None
+
+
+def is_snapshot(file_name) -> bool:
+	"""Checks if the file starts with the snapshot magic bytes"""
+	try:
+		with open(file_name, 'rb') as read_file:
+			return read_file.read(len(MAGIC)) == MAGIC
+	except (OSError, TypeError):
+		return False
+
+
+def read_header(file_name) -> dict:
+	"""Reads the JSON header of a snapshot file"""
+	with open(file_name, 'rb') as read_file:
+		if read_file.read(len(MAGIC)) != MAGIC:
+			raise ValueError('not a snapshot file')
+		header_length, = struct.unpack('<I', read_file.read(4))
+		header = json.loads(read_file.read(header_length).decode('utf-8'))
+	if header.get('version') not in _READ_VERSIONS:
+		raise ValueError('unsupported snapshot version %r' % header.get('version'))
+	return header
+
+
+def save_snapshot(file_name, state:np.ndarray, encoding:str='packed+zlib', rule=None, metadata:dict=None):
+	"""Saves the whole board as a snapshot
+
+	metadata is any JSON serializable dict that is stored in the header, like the generation.
+	Use the raw encoding for snapshots that should be memory mapped when they are loaded.
+	Compressed chunks are written as soon as they are compressed, so only one chunk is kept in memory.
+	"""
+	if encoding not in ENCODINGS:
+		raise ValueError('encoding must be one of %s' % ', '.join(ENCODINGS))
+	compressor = _compressor(encoding)
+	width, height = state.shape
+	chunk_rows = max(1, _CHUNK_CELLS // max(height, 1))
+	header = {
+		'version': VERSION,
+		'shape': [width, height],
+		'encoding': encoding,
+		'rule': str(get_rule(rule)),
+		'chunk_rows': chunk_rows,
+		'metadata': metadata or {},
+	}
+	def chunks():
+		for x in range(0, width, chunk_rows):
+			cells = state[x:x+chunk_rows] != 0
+			if encoding == 'raw':
+				yield cells.view(np.uint8).tobytes()
+			else:
+				yield np.packbits(cells, axis=1).tobytes()
+	chunk_count = -(-width // chunk_rows)
+	# the chunk table has a fixed size, so its offset is known before the chunks are compressed
+	if compressor is not None:
+		header['chunk_table_offset'] = 0
+
+	# the offsets are part of the header, so its length is found by writing it once without them
+	header['data_offset'] = 0
+	header_length = len(json.dumps(header).encode('utf-8'))
+	data_offset = -(-(len(MAGIC) + 4 + header_length + 64) // _DATA_ALIGNMENT) * _DATA_ALIGNMENT
+	header['data_offset'] = data_offset
+	if compressor is not None:
+		header['chunk_table_offset'] = data_offset
+		header['data_offset'] = data_offset + -(-chunk_count * 8 // _DATA_ALIGNMENT) * _DATA_ALIGNMENT
+	header_bytes = json.dumps(header).encode('utf-8')
+	with open(file_name, 'wb') as write_file:
+		write_file.write(MAGIC)
+		write_file.write(struct.pack('<I', len(header_bytes)))
+		write_file.write(header_bytes)
+		write_file.write(b'\x00' * (header['data_offset'] - write_file.tell()))
+		chunk_sizes = []
+		for chunk in chunks():
+			if compressor is not None:
+				chunk = compressor[0](chunk)
+				chunk_sizes.append(len(chunk))
+			write_file.write(chunk)
+		if compressor is not None:
+			write_file.seek(header['chunk_table_offset'])
+			write_file.write(np.array(chunk_sizes, dtype='<u8').tobytes())
+
+def load_snapshot(file_name, mmap_mode:str='c', return_header:bool=False):
+	"""Loads the board of a snapshot
+
+	raw snapshots are memory mapped with the given mode ('r', 'r+' or 'c' for copy on write),
+	so they are loaded without reading the cells. With mmap_mode None the board is read into memory.
+	The other encodings are always decoded into a new board.
+	"""
+	header = read_header(file_name)
+	width, height = header['shape']
+	encoding = header['encoding']
+	offset = header['data_offset']
+	if encoding == 'raw':
+		if mmap_mode is None:
+			state = np.fromfile(file_name, dtype=np.uint8, count=width*height, offset=offset).reshape(width, height)
+		else:
+			state = np.memmap(file_name, dtype=np.uint8, mode=mmap_mode, offset=offset, shape=(width, height))
+	elif encoding in ENCODINGS:
+		state = np.empty((width, height), dtype=np.uint8)
+		chunk_rows = header['chunk_rows']
+		packed_height = -(-height // 8)
+		compressor = _compressor(encoding)
+		with open(file_name, 'rb') as read_file:
+			chunk_sizes = header.get('chunk_sizes')
+			if compressor is not None and chunk_sizes is None:
+				read_file.seek(header['chunk_table_offset'])
+				chunk_sizes = np.frombuffer(read_file.read(-(-width // chunk_rows) * 8), dtype='<u8').tolist()
+			read_file.seek(offset)
+			for index, x in enumerate(range(0, width, chunk_rows)):
+				rows = min(chunk_rows, width - x)
+				if compressor is None:
+					data = read_file.read(rows * packed_height)
+				else:
+					data = compressor[1](read_file.read(chunk_sizes[index]))
+				packed = np.frombuffer(data, dtype=np.uint8).reshape(rows, packed_height)
+				state[x:x+rows] = np.unpackbits(packed, axis=1, count=height)
+	else:
+		raise ValueError('unknown snapshot encoding %r' % encoding)
+	if return_header:
+		return state, header
+	return state
@@ -0,0 +1,172 @@
+"""This module contains a sparse game of life engine for huge, mostly empty universes
+
+Live cells are stored as a sorted numpy array of int64 keys, one per cell,
+with the x coordinate in the high 32 bits and the y coordinate in the low 32 bits.
+Neighbour counts are only calculated around live cells,
+so memory and time scale with the population instead of the area.
+
+The universe is unbounded, there is no dead border like on the dense boards.
+SparseStep is the step function of the 'sparse' backend, it keeps the cells between calls
+and only renders a window of the universe into the board.
+"""
+import numpy as np
+from rules import get_rule, rule_table
+
+# coordinates are stored with this offset, so that negative coordinates are supported
+# this leaves about +-10^9 cells in both directions, while keeping the keys positive
+_BIAS = 1 << 30
+_X_SHIFT = 32
+_Y_MASK = (1 << _X_SHIFT) - 1
+
+# key offsets of the 8 neighbours of a cell
+NEIGHBOUR_OFFSETS = np.array(
+	[(dx << _X_SHIFT) + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy],
+	dtype=np.int64)
+
+
+def encode(x:np.ndarray, y:np.ndarray) -> np.ndarray:
+	"""Converts cell coordinates into sorted, unique cell keys"""
+	x = np.asarray(x, dtype=np.int64)
+	y = np.asarray(y, dtype=np.int64)
+	return np.unique(((x + _BIAS) << _X_SHIFT) | (y + _BIAS))
+
+
+def decode(cells:np.ndarray) -> tuple:
+	"""Converts cell keys back into x and y coordinate arrays"""
+	return (cells >> _X_SHIFT) - _BIAS, (cells & _Y_MASK) - _BIAS
+
+
+def from_dense(board:np.ndarray, x:int=0, y:int=0) -> np.ndarray:
+	"""Returns the live cells of a dense board, board[0, 0] is placed at (x, y)"""
+	xs, ys = np.nonzero(board)
+	return encode(xs + x, ys + y)
+
+
+def to_dense(cells:np.ndarray, x:int, y:int, width:int, height:int, out:np.ndarray=None) -> np.ndarray:
+	"""Renders the window of the universe that starts at (x, y) into a dense board
+
+	If out is given, it is used instead of allocating a new board
+	"""
+	if out is None:
+		out = np.zeros((width, height), dtype=np.uint8)
+	else:
+		out[...] = 0
+	xs, ys = decode(cells)
+	xs = xs - x
+	ys = ys - y
+	visible = (xs >= 0) & (xs < out.shape[0]) & (ys >= 0) & (ys < out.shape[1])
+	out[xs[visible], ys[visible]] = 1
+	return out
+
+
+def bounds(cells:np.ndarray) -> tuple:
+	"""Returns (x_min, x_max, y_min, y_max) of the live cells, None if there are none"""
+	if cells.size == 0:
+		return None
+	xs, ys = decode(cells)
+	# the keys are sorted by x, so only y needs a reduction
+	return (int(xs[0]), int(xs[-1]), int(ys.min()), int(ys.max()))
+
+
+def gol_sparse_step(cells:np.ndarray, topology:str="bounded", rule=None) -> np.ndarray:
+	"""Steps the sparse universe, returns the new sorted array of live cell keys
+
+	The universe is unbounded, so the torus topology is not supported.
+	The rule is any life-like rule, see rules.get_rule.
+	"""
+	if topology == "torus":
+		raise ValueError("The sparse engine does not support the torus topology, the universe is unbounded")
+	if cells.size == 0:
+		return cells
+	# every live cell adds one to the count of each of its neighbours
+	neighbours = (cells[:, None] + NEIGHBOUR_OFFSETS).ravel()
+	keys, counts = np.unique(neighbours, return_counts=True)
+	# the live cells are sorted, so they can be looked up with a binary search
+	index = np.searchsorted(cells, keys)
+	index[index == cells.size] = 0
+	alive = cells[index] == keys
+	born_or_survived = keys[rule_table(rule)[alive*9 + counts] != 0]
+	if 0 in get_rule(rule).survival:
+		# live cells without live neighbours are not counted, but survive with S0
+		isolated = cells[np.isin(cells, keys, invert=True)]
+		born_or_survived = np.union1d(born_or_survived, isolated)
+	return born_or_survived
+
+
+class SparseStep:
+	"""Step function that runs the board with the sparse engine
+
+	The live cells are kept between calls, as long as the same board is passed back in,
+	and after every call the window of the universe that starts at (x, y) is rendered into the board.
+	So memory scales with the population and the size of the board, not with the area the pattern covers.
+	"""
+	generations_per_call = 1
+
+	def __init__(self, rule=None) -> None:
+		self.rule = get_rule(rule)
+		self.cells = None
+		self.x = 0
+		self.y = 0
+		self._board = None
+
+	def _cells_for(self, board, topology, rule) -> np.ndarray:
+		if topology == "torus":
+			raise ValueError("The sparse engine does not support the torus topology, the universe is unbounded")
+		if rule is not None:
+			self.rule = get_rule(rule)
+		if self.cells is None or board is not self._board:
+			self.cells = from_dense(board, self.x, self.y)
+			self._board = board
+		return self.cells
+
+	def _render(self, board) -> np.ndarray:
+		return to_dense(self.cells, self.x, self.y, *board.shape, out=board)
+
+	def __call__(self, board:np.ndarray, topology:str="bounded", rule=None) -> np.ndarray:
+		self.cells = gol_sparse_step(self._cells_for(board, topology, rule), rule=self.rule)
+		return self._render(board)
+
+	def step_n(self, board:np.ndarray, n:int, stop_when_stable:bool=False, topology:str="bounded",
+			rule=None, hashes:np.ndarray=None, stats:np.ndarray=None) -> tuple:
+		"""Runs n steps at once, see gol_step.get_step_n_function
+
+		If hashes is given, the board is rendered after every step to hash it, see gol_step.board_hash
+		If stats is given, the statistics of the whole universe are written to it,
+		the bounds are in board coordinates and can lie outside of the board.
+		If stop_when_stable is set, it stops after the first step that doesn't change the universe.
+		Returns the board and the amount of steps that were run.
+		"""
+		cells = self._cells_for(board, topology, rule)
+		if hashes is not None:
+			from gol_step import board_hash
+		for step in range(n):
+			previous, cells = cells, gol_sparse_step(cells, rule=self.rule)
+			self.cells = cells
+			if hashes is not None:
+				hashes[step] = board_hash(self._render(board), topology)
+			if stats is not None:
+				self._stats(previous, cells, stats[step:step+1])
+			if stop_when_stable and np.array_equal(previous, cells):
+				return self._render(board), step+1
+		return self._render(board), n
+
+	def _stats(self, previous, cells, stats):
+		"""Writes the statistics of the step from previous to cells to stats[0] (a gol_step.STATS_DTYPE array)"""
+		births = np.count_nonzero(np.isin(cells, previous, assume_unique=True, invert=True))
+		deaths = previous.size - (cells.size - births)
+		live_bounds = bounds(cells)
+		if live_bounds is None:
+			live_bounds = (-1, -1, -1, -1)
+		else:
+			live_bounds = (live_bounds[0]-self.x, live_bounds[1]-self.x, live_bounds[2]-self.y, live_bounds[3]-self.y)
+		stats[0] = (cells.size, births, deaths) + live_bounds
+
+	def move_window(self, board:np.ndarray, dx:int, dy:int) -> np.ndarray:
+		"""Moves the window by (dx, dy) cells and renders it into the board the cells belong to
+
+		The cell at board index (x, y) is at (x-dx, y-dy) afterwards.
+		"""
+		self._cells_for(board, "bounded", None)
+		self.x += dx
+		self.y += dy
+		return self._render(board)
@@ -1,4 +1,7 @@
+import io
 import numpy as np
+from rules import CONWAY, get_rule, parse_rule
+import snapshot
 
 # State format:
 # width,height
@@ -8,74 +11,147 @@ import numpy as np
 # segment2_x, segment2_y, segment2_width, segment2_height
 # segment_data
 
-def rle_decode(file_name, min_size=(0,0)):
-	"""Decodes a RLE file"""
-	read_file = open(file_name, 'r', encoding='utf-8')
-	state = np.zeros((1200, 800), dtype=np.uint8)
-	state_buffer = state
-	offset = (0, 0)
-	while True:
-		line = read_file.readline()
-		if line.startswith('!'):
-			continue
-		elif line.startswith('#'):
-			if line[1] == 'R':
-				params = line.split(' ')
-				# state_buffer = state[int(params[1]):, int(params[2]):]
-				offset = (int(params[1]), int(params[2]))
-		else:
-			break
-	params = line.split(',')
-	params[0] = params[0].split('=')[1]
-	params[1] = params[1].split('=')[1]
-	width = max(int(params[0])+offset[0], min_size[0])
-	height = max(int(params[1])+offset[1], min_size[1])
-	state = np.zeros((width, height), dtype=np.uint8)
-	state_buffer = state[offset[0]:, offset[1]:	]
-	x = 0
-	y = 0
-	buffer = ''
-	while True:
-		char = read_file.read(1)
-		if char == 'b':
-			if buffer == '':
-				state_buffer[x, y] = 0
-				x += 1
-			else:
-				state_buffer[x:x+int(buffer), y] = 0
-				x += int(buffer)
-				buffer = ''
-		elif char == 'o':
-			if buffer == '':
-				state_buffer[x, y] = 1
-				x += 1
-			else:
-				state_buffer[x:x+int(buffer), y] = 1
-				x += int(buffer)
-				buffer = ''
-		elif char == '$':
-			if buffer == '':
-				y += 1
-				x = 0
+# the cell data of RLE files is read in chunks of this many bytes
+_RLE_CHUNK_SIZE = 1 << 20
+# 1 for the digits and 2 for the tags of the RLE cell data, everything else is ignored
+_RLE_CHAR_CLASS = np.zeros(256, dtype=np.uint8)
+_RLE_CHAR_CLASS[np.frombuffer(b'0123456789', dtype=np.uint8)] = 1
+_RLE_CHAR_CLASS[np.frombuffer(b'bo$!', dtype=np.uint8)] = 2
+_POWERS_OF_10 = 10**np.arange(19, dtype=np.int64)
+
+
+def _rle_tokens(data:bytes) -> tuple:
+	"""Splits RLE cell data into run lengths and tags (b, o, $ or !)
+
+	Characters other than digits and tags are ignored.
+	Returns the run lengths, the tags and the unfinished run after the last tag,
+	which has to be put in front of the next chunk.
+	"""
+	chars = np.frombuffer(data, dtype=np.uint8)
+	char_class = _RLE_CHAR_CLASS[chars]
+	chars = chars[char_class != 0]
+	is_tag = char_class[char_class != 0] == 2
+	tag_positions = np.flatnonzero(is_tag)
+	if tag_positions.size == 0:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8), chars.tobytes()
+	rest = chars[tag_positions[-1]+1:].tobytes()
+	chars = chars[:tag_positions[-1]+1]
+	is_tag = is_tag[:chars.size]
+	# every digit is worth 10**(amount of digits between it and its tag)
+	tag_of_char = np.cumsum(is_tag) - is_tag
+	place = tag_positions[tag_of_char] - np.arange(chars.size) - 1
+	values = np.where(is_tag, 0, (chars.astype(np.int64) - ord('0')) * _POWERS_OF_10[np.clip(place, 0, 18)])
+	run_starts = np.concatenate(([0], tag_positions[:-1]+1))
+	counts = np.add.reduceat(values, run_starts)
+	# a tag without digits in front of it is a run of 1
+	counts[tag_positions == run_starts] = 1
+	return counts, chars[tag_positions], rest
+
+
+def _rle_fill(state_buffer:np.ndarray, counts:np.ndarray, tags:np.ndarray, x:int, y:int) -> tuple:
+	"""Sets the live runs of a chunk of RLE tokens, the first token starts at cell (x, y)
+
+	Returns the cell after the last token
+	"""
+	is_row = tags == ord('$')
+	advance = np.where(is_row, 0, counts)
+	x_before = np.cumsum(advance) - advance
+	# x starts again at 0 after every $, the tokens before the first one continue at x
+	last_row = np.maximum.accumulate(np.where(is_row, np.arange(tags.size), -1))
+	row_start = np.where(last_row >= 0, x_before[np.maximum(last_row, 0)], -x)
+	xs = x_before - row_start
+	ys = y + np.cumsum(np.where(is_row, counts, 0))
+
+	alive = tags == ord('o')
+	lengths = counts[alive]
+	if lengths.size:
+		# one index per live cell, the cells of a run are consecutive in x
+		run_of_cell = np.repeat(np.arange(lengths.size), lengths)
+		first_cell = np.cumsum(lengths) - lengths
+		cell_x = xs[alive][run_of_cell] + np.arange(run_of_cell.size) - first_cell[run_of_cell]
+		cell_y = ys[alive][run_of_cell]
+		if cell_x.max() >= state_buffer.shape[0] or cell_y.max() >= state_buffer.shape[1]:
+			raise ValueError('RLE pattern is larger than the size in its header')
+		state_buffer[cell_x, cell_y] = 1
+	return int(x_before[-1] + advance[-1] - row_start[-1]), int(ys[-1])
+
+
+def rle_decode(file_name, min_size=(0,0), return_rule=False):
+	"""Decodes a RLE file
+
+	The cell data is read in chunks and decoded with vectorized operations,
+	so only the board has to fit in memory, not the file.
+	If return_rule is set, the rule of the pattern (conway's game of life if the file has none)
+	is returned together with the state
+	"""
+	with open(file_name, 'rb') as read_file:
+		offset = (0, 0)
+		while True:
+			line = read_file.readline().decode('utf-8')
+			if line == '':
+				raise ValueError('RLE file has no header line')
+			if line.startswith('!'):
+				continue
+			elif line.startswith('#'):
+				if line[1] == 'R':
+					params = line.split(' ')
+					offset = (int(params[1]), int(params[2]))
 			else:
-				y += int(buffer)
-				x = 0
-				buffer = ''
-		elif char == '!':
-			break
-		elif char.isdigit():
-			buffer += char
-	read_file.close()
+				break
+		params = line.split(',')
+		params[0] = params[0].split('=')[1]
+		params[1] = params[1].split('=')[1]
+		rule = CONWAY
+		for param in params[2:]:
+			key, _, value = param.partition('=')
+			if key.strip() == 'rule':
+				rule = parse_rule(value)
+		width = max(int(params[0])+offset[0], min_size[0])
+		height = max(int(params[1])+offset[1], min_size[1])
+		state = np.zeros((width, height), dtype=np.uint8)
+		state_buffer = state[offset[0]:, offset[1]:	]
+		x = 0
+		y = 0
+		rest = b''
+		while True:
+			chunk = read_file.read(_RLE_CHUNK_SIZE)
+			counts, tags, rest = _rle_tokens(rest + chunk)
+			end = np.flatnonzero(tags == ord('!'))
+			if end.size:
+				counts, tags = counts[:end[0]], tags[:end[0]]
+			if tags.size:
+				x, y = _rle_fill(state_buffer, counts, tags, x, y)
+			if end.size or not chunk:
+				break
+	if return_rule:
+		return state, rule
 	return state
 
 
-def load_data(file_name, min_size=(0,0)):
-	"""Loads a state from a file"""
+def load_data(file_name, min_size=(0,0), return_rule=False):
+	"""Loads a state from a file
+
+	Binary snapshots are recognized by their magic bytes, RLE files by their extension,
+	everything else is read as the text segment format.
+	If return_rule is set, the rule is returned together with the state,
+	snapshots and RLE files store a rule, the text format is always conway's game of life
+	"""
 	if file_name is None:
 		return None
+
+	if snapshot.is_snapshot(file_name):
+		state, header = snapshot.load_snapshot(file_name, return_header=True)
+		if state.shape[0] < min_size[0] or state.shape[1] < min_size[1]:
+			# only boards that are large enough stay memory mapped
+			padded = np.zeros((max(state.shape[0], min_size[0]), max(state.shape[1], min_size[1])), dtype=np.uint8)
+			padded[:state.shape[0], :state.shape[1]] = state
+			state = padded
+		if return_rule:
+			return state, parse_rule(header['rule'])
+		return state
 	
 	if file_name.endswith('.rle'):
-		return rle_decode(file_name, min_size)
+		return rle_decode(file_name, min_size, return_rule)
 
 	read_file = open(file_name, 'r', encoding='utf-8')
 	size_line = read_file.readline()
@@ -101,86 +177,139 @@ def load_data(file_name, min_size=(0,0)):
 			state[x:x+segment_width, y+j] = line
 	read_file.close()
 	print(state.shape)
+	if return_rule:
+		return state, CONWAY
 	return state
 
 def find_bounds(state):
 	"""Finds the bounds of a state of the game of life
 	(the smallest rectangle that contains all live cells)
 	"""
-	x_min = 0
-	x_max = state.shape[0]
-	y_min = 0
-	y_max = state.shape[1]
-	for i in range(state.shape[0]):
-		if np.any(state[i,:]):
-			x_min = i
-			break
-	for i in range(state.shape[0]-1, -1, -1):
-		if np.any(state[i,:]):
-			x_max = i
-			break
-	for i in range(state.shape[1]):
-		if np.any(state[:,i]):
-			y_min = i
-			break
-	for i in range(state.shape[1]-1, -1, -1):
-		if np.any(state[:,i]):
-			y_max = i
-			break
-	return (x_min, x_max, y_min, y_max)
-	
+	# one reduction over the whole board for the rows,
+	# the columns only have to be searched between the first and last live row
+	xs = np.flatnonzero(state.any(axis=1))
+	if xs.size == 0:
+		return (0, state.shape[0], 0, state.shape[1])
+	ys = np.flatnonzero(state[xs[0]:xs[-1]+1].any(axis=0))
+	return (int(xs[0]), int(xs[-1]), int(ys[0]), int(ys[-1]))
+
 
-def save_state(file_name, state):
-	"""Saves a state to a file in RLE format"""
+# RLE lines should not be longer than this
+_RLE_LINE_LENGTH = 70
+# amount of cells encoded at once, the output is written after every block
+_RLE_BLOCK_CELLS = 1 << 22
+
+
+class _RLEEncoder:
+	"""Turns blocks of RLE rows into text and writes it to a file-like object
+
+	Lines are broken between tokens so that they stay within the line length:
+	a token goes on line (end of the token - 1) // line_step of the unbroken text,
+	which leaves room for the longest possible token at the start of a line.
+	"""
+	def __init__(self, write_file, max_count:int) -> None:
+		self.write_file = write_file
+		self.binary = not isinstance(write_file, io.TextIOBase)
+		max_token = len(str(max_count)) + 1
+		self.line_step = _RLE_LINE_LENGTH - max_token + 1
+		# length of the token text so far and of the written output, including line breaks
+		self.text_length = 0
+		self.written = 0
+		# the row of the last live run, runs in later rows start with a $ token
+		self.row = 0
+
+	def encode_rows(self, rows:np.ndarray, first_row:int):
+		"""Encodes the rows of cells (each row is an RLE line of the pattern)"""
+		padded = np.zeros((rows.shape[0], rows.shape[1]+2), dtype=np.int8)
+		padded[:, 1:-1] = rows != 0
+		edges = np.diff(padded, axis=1)
+		# live runs from start to end in row-major order, the dead cells after the last run of a row are left out
+		run_rows, starts = np.nonzero(edges == 1)
+		ends = np.nonzero(edges == -1)[1]
+		if starts.size == 0:
+			return
+		run_rows += first_row
+		new_row = np.concatenate(([run_rows[0] != self.row], run_rows[1:] != run_rows[:-1]))
+		previous_end = np.concatenate(([0], ends[:-1]))
+		previous_end[new_row] = 0
+		previous_row = np.concatenate(([self.row], run_rows[:-1]))
+		self.row = int(run_rows[-1])
+		# every run is written as up to 3 tokens: row breaks, dead cells and live cells
+		counts = np.stack((run_rows - previous_row, starts - previous_end, ends - starts), axis=1).ravel()
+		tags = np.tile(np.frombuffer(b'$bo', dtype=np.uint8), starts.size)
+		present = counts > 0
+		self._write_tokens(counts[present], tags[present])
+
+	def finish(self):
+		"""Writes the end of pattern token"""
+		self._write_tokens(np.ones(1, dtype=np.int64), np.frombuffer(b'!', dtype=np.uint8))
+		self._write(b'\n')
+
+	def _write_tokens(self, counts:np.ndarray, tags:np.ndarray):
+		# a count of 1 is left out
+		digits = np.where(counts > 1, np.floor(np.log10(np.maximum(counts, 1))).astype(np.int64) + 1, 0)
+		lengths = digits + 1
+		token_ends = self.text_length + np.cumsum(lengths)
+		token_starts = token_ends - lengths
+		self.text_length = int(token_ends[-1])
+		# every line break before a token moves it one character further
+		positions = token_starts + (token_ends - 1) // self.line_step
+		start = self.written
+		end = int(positions[-1] + lengths[-1])
+		# the gaps between the tokens are the line breaks
+		text = np.full(end - start, ord('\n'), dtype=np.uint8)
+		positions -= start
+		for place in range(int(digits.max())):
+			has_place = digits > place
+			power = 10**(digits[has_place] - 1 - place)
+			text[positions[has_place] + place] = ord('0') + (counts[has_place] // power) % 10
+		text[positions + digits] = tags
+		self.written = end
+		self._write(text.tobytes())
+
+	def _write(self, data:bytes):
+		self.write_file.write(data if self.binary else data.decode('ascii'))
+
+
+def rle_encode(write_file, state):
+	"""Writes the state as RLE cell data to a file-like object, text or binary
+
+	The rows are encoded in blocks with vectorized run detection,
+	so the output can be streamed, for example into a compressed file.
+	"""
+	encoder = _RLEEncoder(write_file, max(state.shape))
+	block_rows = max(1, _RLE_BLOCK_CELLS // max(state.shape[0], 1))
+	for y in range(0, state.shape[1], block_rows):
+		# the lines of an RLE pattern are the columns of the [x, y] board
+		encoder.encode_rows(np.ascontiguousarray(state[:, y:y+block_rows].T), y)
+	encoder.finish()
+
+
+def save_state(file_name, state, rule=None, encoding='packed+zlib'):
+	"""Saves a state to a file in RLE format, rule defaults to conway's game of life
+
+	file_name can also be a file-like object opened in text or binary mode,
+	it is written to but not closed.
+	File names with the snapshot extension (.golsnap) are saved as a binary snapshot of the whole board instead,
+	with the given snapshot encoding. Only raw snapshots can be memory mapped when they are loaded.
+	"""
 	if file_name is None:
 		return
+	if isinstance(file_name, str) and file_name.endswith(snapshot.EXTENSION):
+		snapshot.save_snapshot(file_name, state, encoding=encoding, rule=rule)
+		return
 	bounds = find_bounds(state)
 	state = state[bounds[0]:bounds[1]+1, bounds[2]:bounds[3]+1]
-	
-	write_file = open(file_name, 'w', encoding='utf-8')
-	write_file.write(f'#N Game of Life\n')
-	write_file.write(f'#C Created by Game of Life\n')
-	write_file.write(f'#R 10 10\n')
-	write_file.write(f'x={state.shape[0]},y={state.shape[1]},rule=B3/S23\n')
-	prev_cell = 0
-	count = 0
-	for i in range(state.shape[1]):
-		for j in range(state.shape[0]):
-			if state[j,i] == 1:
-				if prev_cell == 0:
-					if count > 1:
-						write_file.write(str(count))
-						write_file.write('b')
-					elif count == 1:
-						write_file.write('b')
-					count = 1
-					prev_cell = 1
-				else:
-					count += 1
-			else:
-				if prev_cell == 1:
-					if count > 1:
-						write_file.write(str(count))
-						write_file.write('o')
-					elif count == 1:
-						write_file.write('o')
-					count = 1
-					prev_cell = 0
-				else:
-					count += 1
-		if count > 1:
-			write_file.write(str(count))
-			if prev_cell == 1:
-				write_file.write('o')
-			else:
-				write_file.write('b')
-		elif count == 1:
-			if prev_cell == 1:
-				write_file.write('o')
-			else:
-				write_file.write('b')
-		count = 0
-		prev_cell = 0
-		write_file.write('$')
-	write_file.write('!')
-	write_file.close()
\ No newline at end of file
+
+	header = (
+		'#N Game of Life\n'
+		'#C Created by Game of Life\n'
+		'#R 10 10\n'
+		f'x={state.shape[0]},y={state.shape[1]},rule={get_rule(rule)}\n')
+	if hasattr(file_name, 'write'):
+		file_name.write(header if isinstance(file_name, io.TextIOBase) else header.encode('ascii'))
+		rle_encode(file_name, state)
+		return
+	with open(file_name, 'w', encoding='utf-8') as write_file:
+		write_file.write(header)
+		rle_encode(write_file, state)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from gol_step import HAS_C_EXTENSION
+from headless import run
+
+pytestmark = pytest.mark.skipif(not HAS_C_EXTENSION, reason='needs the C extension')
+
+
+def settling_board() -> np.ndarray:
+	"""A T-tetromino that becomes a traffic light (period 2) and a row of ten cells that becomes a pentadecathlon (period 15),
+	far enough from the edges that the unbounded hashlife universe doesn't differ from the bounded board"""
+	board = np.zeros((64, 64), dtype=np.uint8)
+	board[15, 14:17] = 1
+	board[16, 15] = 1
+	board[44, 27:37] = 1
+	return board
+
+
+@pytest.mark.parametrize('backend', ['tiled', 'hashlife'])
+def test_detection_keeps_the_board_of_stateful_backends(backend):
+	board = settling_board()
+	expected = run(board, 512, backend='c_numpy')['board']
+	result = run(board, 512, backend=backend, detect_cycles=True)
+	assert result['cycle'] is not None
+	assert result['cycle'].period % 30 == 0
+	np.testing.assert_array_equal(result['board'], expected)
+
+
+def test_detection_keeps_hashlife_cells_outside_the_board():
+	# a row of eight cells next to the edge, part of what it becomes lies outside the board in the unbounded universe
+	board = np.zeros((40, 40), dtype=np.uint8)
+	board[15:23, 1] = 1
+	margin = 16
+	expected = run(np.pad(board, margin), 300)['board'][margin:-margin, margin:-margin]
+	result = run(board, 300, backend='hashlife', detect_cycles=True)
+	np.testing.assert_array_equal(result['board'], expected)
+
+
+def test_detection_finds_the_period():
+	result = run(settling_board(), 512, backend='c_numpy', detect_cycles=True)
+	assert result['cycle'].period == 30